@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+import logging
+import numpy as np
+import pandas as pd
+import instock.lib.database as mdb
+import instock.core.tablestructure as tbs
+
+__author__ = 'myh '
+__date__ = '2024/12/09 '
+
+# 回测统计。
+# 按 策略表 × N日 × 信号月份 汇总回测收益率：信号数、平均收益、胜率、中位数和分位数，结果保存在回测统计表，
+# 用 get_summary 查询任意月份区间的统计，不用扫描策略表。回测作业每次只把新回填的收益率加进去：数量、合计、
+# 上涨数直接累加，分位数用可合并的分位数草图（按收益率绝对值的对数分桶，桶内相对误差不超过 1%），
+# 多个月份合并后也能求分位数。
+
+SKETCH_GAMMA = 1.02  # 相邻桶的比例，分位数的相对误差 (γ-1)/(γ+1) ≈ 1%
+SKETCH_MIN = 0.01  # 收益率保留两位小数，绝对值小于一半的记为 0
+STATS_QUANTILES = (10, 25, 75, 90)  # 分位数（%），中位数另列
+REBUILT_HORIZON = 0  # 全表重建时写入一行 N日 为 0 的标记行，策略表还没有收益率时也不会每次重建
+
+_LOG_GAMMA = math.log(SKETCH_GAMMA)
+# 负收益用负的桶号，桶号和收益率同序；0 号桶为 0
+_OFFSET = 1 - math.ceil(math.log(SKETCH_MIN) / _LOG_GAMMA)
+
+
+# 收益率的分位数草图，桶号 -> 数量，另外记录精确的数量、合计、上涨数、最小值、最大值
+class rate_sketch:
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.wins = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        a = np.abs(values)
+        keys = np.ceil(np.log(np.maximum(a, SKETCH_MIN)) / _LOG_GAMMA).astype(np.int64) + _OFFSET
+        keys = np.where(a < SKETCH_MIN / 2, 0, np.sign(values).astype(np.int64) * keys)
+        for key, n in zip(*np.unique(keys, return_counts=True)):
+            self.buckets[int(key)] = self.buckets.get(int(key), 0) + int(n)
+        self.count += len(values)
+        self.total += float(values.sum())
+        self.wins += int((values > 0).sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other):
+        for key, n in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + n
+        self.count += other.count
+        self.total += other.total
+        self.wins += other.wins
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    # q 分位（0~1），取所在桶的代表值，不超出最小、最大值
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                break
+        if key == 0:
+            value = 0.0
+        else:
+            value = math.copysign(2 * SKETCH_GAMMA ** (abs(key) - _OFFSET) / (1 + SKETCH_GAMMA), key)
+        return round(min(max(value, self.min), self.max), 2)
+
+    def to_text(self):
+        return ','.join(f"{k}:{self.buckets[k]}" for k in sorted(self.buckets))
+
+    # 由统计表的一行恢复
+    @classmethod
+    def from_row(cls, row):
+        s = cls()
+        if row['sketch']:
+            for item in row['sketch'].split(','):
+                k, n = item.split(':')
+                s.buckets[int(k)] = int(n)
+        s.count = int(row['count'])
+        s.total = float(row['total'])
+        s.wins = int(row['wins'])
+        s.min = float(row['min'])
+        s.max = float(row['max'])
+        return s
+
+
+# 新回填的收益率按 (月份, N日) 汇总成草图。dates 为信号日期字符串，rates 为 信号 × N日 的矩阵，NaN 为没有新值。
+def get_sketches(dates, rates):
+    sketches = {}
+    months = np.array([d[:7] for d in dates])
+    rates = np.asarray(rates, dtype=np.float64)
+    for month in np.unique(months):
+        values = rates[months == month]
+        for h in np.nonzero(~np.isnan(values).all(axis=0))[0]:
+            s = rate_sketch()
+            s.add(values[:, h])
+            sketches[(month, int(h) + 1)] = s
+    return sketches
+
+
+def _stats_row(table_name, month, horizon, s):
+    row = {'name': table_name, 'month': month, 'horizon': horizon, 'count': s.count,
+           'mean': round(s.total / s.count, 2), 'median': s.quantile(0.5),
+           'win_rate': round(s.wins / s.count * 100, 2)}
+    for q in STATS_QUANTILES:
+        row[f'p{q}'] = s.quantile(q / 100)
+    row.update({'min': s.min, 'max': s.max, 'total': s.total, 'wins': s.wins, 'sketch': s.to_text()})
+    return row
+
+
+def _load(table_name, months=None):
+    stats_table = tbs.TABLE_CN_STOCK_BACKTEST_STATS['name']
+    if not mdb.checkTableIsExist(stats_table):
+        return {}
+    sql = f"SELECT * FROM `{stats_table}` WHERE `name` = '{table_name}' AND `horizon` <> {REBUILT_HORIZON}"
+    if months is not None:
+        _months = "','".join(months)
+        sql += f" AND `month` in ('{_months}')"
+    data = pd.read_sql(sql=sql, con=mdb.engine())
+    return {(row['month'], int(row['horizon'])): rate_sketch.from_row(row) for _, row in data.iterrows()}
+
+
+# 建统计表。回测作业各表并行更新统计，要在启动线程之前建好，线程里只删除、插入数据
+def create_stats_table():
+    stats_table = tbs.TABLE_CN_STOCK_BACKTEST_STATS['name']
+    if mdb.checkTableIsExist(stats_table):
+        return
+    columns = tbs.TABLE_CN_STOCK_BACKTEST_STATS['columns']
+    mdb.insert_db_from_df(pd.DataFrame(columns=list(columns)), table_name=stats_table,
+                          cols_type=tbs.get_field_types(columns), write_index=False,
+                          primary_keys="`name`,`month`,`horizon`")
+
+
+# 保存 table_name 若干月份的统计，先删除这些月份的老数据；months 为 None 时为全表重建，同时写入标记行
+def _save(table_name, sketches, months=None):
+    stats_table = tbs.TABLE_CN_STOCK_BACKTEST_STATS['name']
+    create_stats_table()
+    del_sql = f"DELETE FROM `{stats_table}` where `name` = '{table_name}'"
+    if months is not None:
+        _months = "','".join(months)
+        del_sql += f" AND `month` in ('{_months}')"
+    mdb.executeSql(del_sql)
+    rows = [_stats_row(table_name, m, h, s) for (m, h), s in sorted(sketches.items())]
+    if months is None:
+        rows.append({'name': table_name, 'month': '', 'horizon': REBUILT_HORIZON, 'count': 0, 'total': 0.0,
+                     'wins': 0, 'sketch': ''})
+    if not rows:
+        return
+    data = pd.DataFrame(rows, columns=list(tbs.TABLE_CN_STOCK_BACKTEST_STATS['columns']))
+    mdb.insert_db_from_df(data, table_name=stats_table, cols_type=None, write_index=False,
+                          primary_keys="`name`,`month`,`horizon`")
+
+
+# 是否已经全表重建过（有标记行），和统计表里有没有这个策略的收益率无关
+def has_stats(table_name):
+    stats_table = tbs.TABLE_CN_STOCK_BACKTEST_STATS['name']
+    if not mdb.checkTableIsExist(stats_table):
+        return False
+    sql = f"SELECT 1 FROM `{stats_table}` WHERE `name` = '{table_name}' AND `horizon` = {REBUILT_HORIZON} LIMIT 1"
+    return len(pd.read_sql(sql=sql, con=mdb.engine()).index) > 0
+
+
+# 把新回填的收益率加进统计：只读写涉及的月份。dates、rates 同 get_sketches，必须是已经写入策略表的值。
+# 返回是否成功，失败时这些月份要由表重建。
+def update_stats(table_name, dates, rates):
+    try:
+        sketches = get_sketches(dates, rates)
+        if not sketches:
+            return True
+        months = sorted(set(m for m, _ in sketches))
+        old = _load(table_name, months)
+        for key, s in sketches.items():
+            if key in old:
+                old[key].merge(s)
+            else:
+                old[key] = s
+        _save(table_name, old, months)
+        return True
+    except Exception as e:
+        logging.error(f"backtest_stats.update_stats处理异常：{table_name}表{e}")
+    return False
+
+
+# 由策略表中已有的收益率重建统计（第一次运行或统计表损坏时全表重建）。months 为月份（'YYYY-MM'）列表时只重建这些月份。
+def rebuild_stats(table_name, rate_columns=None, months=None):
+    try:
+        if not mdb.checkTableIsExist(table_name):
+            return
+        if rate_columns is None:
+            rate_columns = list(tbs.TABLE_CN_STOCK_BACKTEST_DATA['columns'])
+        _selcol = '`,`'.join(rate_columns)
+        sql = f"SELECT `date`,`{_selcol}` FROM `{table_name}`"
+        if months is not None:
+            months = sorted(set(months))
+            if not months:
+                return
+            end_month = str(pd.Period(months[-1], freq='M') + 1)
+            sql += f" WHERE `date` >= '{months[0]}-01' AND `date` < '{end_month}-01'"
+        data = pd.read_sql(sql=sql, con=mdb.engine())
+        dates = data['date'].astype(str).values
+        rates = data[rate_columns].values.astype(np.float64)
+        if months is not None:
+            keep = np.isin(np.array([d[:7] for d in dates], dtype=str), months)
+            dates, rates = dates[keep], rates[keep]
+        _save(table_name, get_sketches(dates, rates), months)
+    except Exception as e:
+        logging.error(f"backtest_stats.rebuild_stats处理异常：{table_name}表{e}")
+
+
+# 策略表删除、重新写入某些日期的数据后（新数据的收益率要等回测作业回填），由表重建这些日期所在月份的统计，
+# 之后回填的收益率再由回测作业加进去。还没有全表重建过的表不用处理，回测作业会全表重建。
+def refresh_stats(table_name, dates):
+    try:
+        if has_stats(table_name):
+            rebuild_stats(table_name, months=[str(d)[:7] for d in dates])
+    except Exception as e:
+        logging.error(f"backtest_stats.refresh_stats处理异常：{table_name}表{e}")
+
+
+# 查询 table_name 在 start_month ~ end_month（'YYYY-MM'，None 不限）的每个 N日 的统计，月份合并后计算。
+# 返回 DataFrame(horizon, count, mean, median, win_rate, p10..., min, max)。
+def get_summary(table_name, start_month=None, end_month=None):
+    try:
+        merged = {}
+        for (month, horizon), s in _load(table_name).items():
+            if (start_month is not None and month < start_month) or (end_month is not None and month > end_month):
+                continue
+            if horizon in merged:
+                merged[horizon].merge(s)
+            else:
+                merged[horizon] = s
+        rows = [_stats_row(table_name, None, h, merged[h]) for h in sorted(merged)]
+        columns = ['horizon', 'count', 'mean', 'median', 'win_rate'] + [f'p{q}' for q in STATS_QUANTILES] + \
+                  ['min', 'max']
+        return pd.DataFrame(rows, columns=columns)
+    except Exception as e:
+        logging.error(f"backtest_stats.get_summary处理异常：{table_name}表{e}")
+    return None
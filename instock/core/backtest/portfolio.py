@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import math
+import numpy as np
+import pandas as pd
+
+__author__ = 'myh '
+__date__ = '2024/12/07 '
+
+# 组合回测。
+# 以策略表的选股结果为买入信号，按交易日逐日撮合：资金和持仓数有上限，按总资产比例建仓，
+# 计入佣金（最低 5 元）、印花税（卖出）、过户费，按手买入；A 股 T+1，买入当天不能卖出；
+# 开盘涨停买不进、跌停卖不出，停牌不能交易，卖不出的持仓顺延到下一个交易日。
+# 行情整理成 股票 × 交易日历 的面板（停牌为 NaN），持仓的市值、止盈止损、持有天数在面板上按数组计算。
+# 统计年化收益、最大回撤、波动率、夏普、换手率、胜率等。
+
+PORTFOLIO_CONFIG = {
+    'capital': 1000000.0,  # 初始资金
+    'max_positions': 10,  # 最多同时持有的股票数
+    'position_pct': 0.1,  # 每只股票买入金额占总资产的比例
+    'lot': 100,  # 每手股数
+    'commission': 0.00025,  # 佣金费率，买卖双向
+    'min_commission': 5.0,  # 最低佣金
+    'stamp_duty': 0.0005,  # 印花税，卖出单向
+    'transfer_fee': 0.00001,  # 过户费，买卖双向
+    'entry': 'next_open',  # 买入：next_open 信号次日开盘价，close 信号当天收盘价
+    'exit': 'next_open',  # 卖出：next_open 触发卖出条件的次日开盘价，close 触发当天收盘价
+    'hold_days': 10,  # 最多持有的交易日数，None 不限
+    'stop_loss': -8.0,  # 止损，收盘价相对买入价的涨跌幅（%），None 不用
+    'take_profit': 20.0,  # 止盈（%），None 不用
+}
+
+TRADE_DAYS_PER_YEAR = 252
+
+
+# 涨跌停幅度：创业板、科创板 20%，北交所 30%，ST 5%，其他 10%
+def limit_ratio(code, name=''):
+    if code.startswith(('300', '301', '688', '689')):
+        return 0.2
+    if code.startswith(('4', '8', '92')):
+        return 0.3
+    if 'ST' in name.upper():
+        return 0.05
+    return 0.1
+
+
+# 交易日历上的行情面板，calendar 为日期字符串数组，keys 为 [(date, code, name)]
+class calendar_panel:
+    def __init__(self, stocks, keys, calendar):
+        self.keys = keys
+        self.calendar = calendar
+        size, days = len(keys), len(calendar)
+        self.open = np.full((size, days), np.nan)
+        self.close = np.full((size, days), np.nan)
+        self.limit_up = np.full((size, days), np.inf)
+        self.limit_down = np.full((size, days), -np.inf)
+        for i, k in enumerate(keys):
+            data = stocks[k]
+            dates = data['date'].values
+            start = int(np.searchsorted(dates, calendar[0], side='left'))
+            end = int(np.searchsorted(dates, calendar[-1], side='right'))
+            if start >= end:
+                continue
+            cols = np.searchsorted(calendar, dates[start:end])
+            close = data['close'].values.astype(np.float64)
+            self.open[i, cols] = data['open'].values[start:end]
+            self.close[i, cols] = close[start:end]
+            # 前收盘价，上市第一天没有涨跌停
+            prev_close = np.full(end - start, np.nan)
+            prev_close[1 if start == 0 else 0:] = close[max(start - 1, 0):end - 1]
+            ratio = limit_ratio(k[1], k[2])
+            with np.errstate(invalid='ignore'):
+                self.limit_up[i, cols] = np.where(np.isnan(prev_close), np.inf, np.around(prev_close * (1 + ratio), 2))
+                self.limit_down[i, cols] = np.where(np.isnan(prev_close), -np.inf,
+                                                    np.around(prev_close * (1 - ratio), 2))
+        # 停牌时按最近的收盘价计市值
+        self.mark = pd.DataFrame(self.close.T).ffill().values.T
+
+
+class _portfolio:
+    def __init__(self, config):
+        self.config = config
+        self.cash = config['capital']
+        self.rows = np.zeros(0, dtype=np.int64)  # 持仓：面板行号
+        self.shares = np.zeros(0, dtype=np.int64)
+        self.price = np.zeros(0)  # 买入价
+        self.cost = np.zeros(0)  # 买入金额加费用
+        self.entry = np.zeros(0, dtype=np.int64)  # 买入日在日历中的位置
+        self.pending = np.zeros(0, dtype=bool)  # 已触发卖出条件
+        self.trades = []
+        self.buy_value = 0.0
+        self.sell_value = 0.0
+
+    def fee(self, value, sell):
+        c = self.config
+        fee = max(value * c['commission'], c['min_commission']) + value * c['transfer_fee']
+        if sell:
+            fee += value * c['stamp_duty']
+        return fee
+
+    def buy(self, row, t, price, equity):
+        c = self.config
+        budget = min(equity * c['position_pct'], self.cash)
+        lots = math.floor(budget / (price * c['lot'] * (1 + c['commission'] + c['transfer_fee'])))
+        while lots > 0 and lots * c['lot'] * price + self.fee(lots * c['lot'] * price, False) > self.cash:
+            lots -= 1
+        if lots <= 0:
+            return False
+        shares = lots * c['lot']
+        value = shares * price
+        cost = value + self.fee(value, False)
+        self.cash -= cost
+        self.buy_value += value
+        self.rows = np.append(self.rows, row)
+        self.shares = np.append(self.shares, shares)
+        self.price = np.append(self.price, price)
+        self.cost = np.append(self.cost, cost)
+        self.entry = np.append(self.entry, t)
+        self.pending = np.append(self.pending, False)
+        return True
+
+    # 卖出 sell 掩码对应的持仓
+    def sell(self, sell, t, prices, panel):
+        for j in np.nonzero(sell)[0]:
+            value = self.shares[j] * prices[j]
+            fee = self.fee(value, True)
+            self.cash += value - fee
+            self.sell_value += value
+            k = panel.keys[self.rows[j]]
+            self.trades.append({'code': k[1], 'name': k[2], 'buy_date': panel.calendar[self.entry[j]],
+                                'buy_price': self.price[j], 'sell_date': panel.calendar[t], 'sell_price': prices[j],
+                                'shares': int(self.shares[j]), 'profit': value - fee - self.cost[j],
+                                'hold_days': int(t - self.entry[j])})
+        keep = ~sell
+        self.rows, self.shares, self.price = self.rows[keep], self.shares[keep], self.price[keep]
+        self.cost, self.entry, self.pending = self.cost[keep], self.entry[keep], self.pending[keep]
+
+    # 以 prices 卖出已触发条件的持仓：买入当天不能卖（T+1），停牌、跌停卖不出
+    def sell_pending(self, t, prices, limit_down, panel):
+        with np.errstate(invalid='ignore'):
+            sell = self.pending & (self.entry < t) & ~np.isnan(prices) & (prices > limit_down)
+        if sell.any():
+            self.sell(sell, t, prices, panel)
+
+    def value(self, panel, t):
+        return float(np.sum(self.shares * panel.mark[self.rows, t])) if len(self.rows) else 0.0
+
+
+# 组合回测。signals 为买入信号 DataFrame(date, code)，stocks 为历史行情 {(date, code, name): DataFrame}，
+# 回测 start_date ~ end_date（字符串，None 为行情的起止），config 覆盖 PORTFOLIO_CONFIG 中的参数。
+# 返回 {'equity': 每日资产 DataFrame(date, cash, value, equity), 'trades': 成交 DataFrame, 'stats': 统计}。
+def backtest(signals, stocks, start_date=None, end_date=None, config=None):
+    try:
+        c = dict(PORTFOLIO_CONFIG)
+        if config is not None:
+            c.update(config)
+        keys = {k[1]: k for k in stocks if stocks[k] is not None}
+        calendar = np.unique(np.concatenate([stocks[k]['date'].values for k in keys.values()]).astype(str))
+        if start_date is not None:
+            calendar = calendar[calendar >= start_date]
+        if end_date is not None:
+            calendar = calendar[calendar <= end_date]
+        if len(calendar) == 0:
+            return None
+
+        # 只整理有信号的股票
+        signals = signals.astype({'date': str, 'code': str})
+        signals = signals[signals['code'].isin(keys) & signals['date'].isin(calendar)]
+        codes = sorted(set(signals['code']))
+        panel = calendar_panel(stocks, [keys[code] for code in codes], calendar)
+        row_of = {code: i for i, code in enumerate(codes)}
+        day_signals = {}
+        for date, code in sorted(zip(signals['date'].values, signals['code'].values)):
+            day_signals.setdefault(int(np.searchsorted(calendar, date)), []).append(row_of[code])
+
+        p = _portfolio(c)
+        delay = 1 if c['entry'] == 'next_open' else 0
+        exit_delay = 1 if c['exit'] == 'next_open' else 0
+        days = len(calendar)
+        equity = np.zeros(days)
+        cash = np.zeros(days)
+        last_equity = c['capital']
+        for t in range(days):
+            if c['exit'] == 'next_open' and len(p.rows):
+                p.sell_pending(t, panel.open[p.rows, t], panel.limit_down[p.rows, t], panel)
+
+            # 买入：不重复持有，停牌、涨停买不进
+            price = panel.open if delay else panel.close
+            for row in day_signals.get(t - delay, ()):
+                if len(p.rows) >= c['max_positions']:
+                    break
+                x = price[row, t]
+                if row in p.rows or np.isnan(x) or x >= panel.limit_up[row, t]:
+                    continue
+                p.buy(row, t, x, last_equity)
+
+            # 收盘检查卖出条件
+            if len(p.rows):
+                close = panel.close[p.rows, t]
+                with np.errstate(invalid='ignore'):
+                    change = (close / p.price - 1) * 100
+                    trigger = np.zeros(len(p.rows), dtype=bool)
+                    if c['hold_days'] is not None:
+                        # 卖出当天的持有天数
+                        trigger |= (t + exit_delay - p.entry) >= c['hold_days']
+                    if c['stop_loss'] is not None:
+                        trigger |= change <= c['stop_loss']
+                    if c['take_profit'] is not None:
+                        trigger |= change >= c['take_profit']
+                p.pending |= trigger
+                if c['exit'] == 'close':
+                    p.sell_pending(t, close, panel.limit_down[p.rows, t], panel)
+
+            cash[t] = p.cash
+            equity[t] = p.cash + p.value(panel, t)
+            last_equity = equity[t]
+
+        data = pd.DataFrame({'date': calendar, 'cash': cash, 'value': equity - cash, 'equity': equity})
+        trades = pd.DataFrame(p.trades, columns=['code', 'name', 'buy_date', 'buy_price', 'sell_date', 'sell_price',
+                                                 'shares', 'profit', 'hold_days'])
+        return {'equity': data, 'trades': trades, 'stats': get_stats(equity, trades, p, c['capital'])}
+    except Exception as e:
+        logging.error(f"portfolio.backtest处理异常：{e}")
+    return None
+
+
+# 收益统计，百分比字段单位为 %
+def get_stats(equity, trades, p, capital):
+    days = len(equity)
+    years = days / TRADE_DAYS_PER_YEAR
+    curve = np.concatenate([[capital], equity])
+    returns = curve[1:] / curve[:-1] - 1
+    drawdown = curve / np.maximum.accumulate(curve) - 1
+    std = returns.std(ddof=1) if days > 1 else 0.0
+    ratio = equity[-1] / capital
+    return {
+        'equity': round(float(equity[-1]), 2),
+        'total_return': round(float(ratio - 1) * 100, 2),
+        'cagr': round(float(ratio ** (1 / years) - 1) * 100, 2) if ratio > 0 else -100.0,
+        'max_drawdown': round(float(drawdown.min()) * 100, 2),
+        'volatility': round(float(std * math.sqrt(TRADE_DAYS_PER_YEAR)) * 100, 2),
+        'sharpe': round(float(returns.mean() / std * math.sqrt(TRADE_DAYS_PER_YEAR)), 2) if std > 0 else 0.0,
+        # 年化换手率：买卖金额的平均值 / 平均资产
+        'turnover': round(float((p.buy_value + p.sell_value) / 2 / equity.mean() / years), 2),
+        'trades': len(trades.index),
+        'win_rate': round(float((trades['profit'] > 0).mean()) * 100, 2) if len(trades.index) else 0.0,
+        'avg_hold_days': round(float(trades['hold_days'].mean()), 2) if len(trades.index) else 0.0,
+    }
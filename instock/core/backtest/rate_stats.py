@@ -4,6 +4,7 @@
 import logging
 import numpy as np
 import pandas as pd
+from instock.core.stockpanel import slice_start
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
@@ -20,9 +21,7 @@ def get_rates(code_name, data, stock_column, threshold=101):
         # 设置返回数组。
         stock_data_list = [start_date, code]
 
-        mask = (data['date'] >= start_date)
-        data = data.loc[mask].copy()
-        data = data.head(n=threshold)
+        data = slice_start(data, start_date).head(n=threshold).copy()
 
         if len(data.index) <= 1:
             return None
@@ -48,3 +47,99 @@ def get_rates(code_name, data, stock_column, threshold=101):
         logging.error(f"rate_stats.get_rates处理异常：{code}代码{e}")
 
     return pd.Series(stock_data_list, index=stock_column)
+
+
+# 每只股票只定位一次（从最早的信号日起截取收盘价），拼接成一个数组。
+# 返回 (pos, end, close)：信号日在 close 中的位置（找不到股票为 -1），该股票截取部分的结尾。
+def _locate(signals, stocks, threshold):
+    index = {(k[1], k[2]): v for k, v in stocks.items() if v is not None}
+    groups = {}
+    for i, s in enumerate(signals):
+        groups.setdefault((s[1], s[2]), []).append(i)
+
+    pos = np.full(len(signals), -1, dtype=np.int64)
+    end = np.zeros(len(signals), dtype=np.int64)
+    closes = []
+    offset = 0
+    for key, idx in groups.items():
+        data = index.get(key)
+        if data is None:
+            continue
+        first = np.searchsorted(data['date'].values, [signals[i][0] for i in idx], side='left')
+        start = int(first.min())
+        close = data['close'].values[start:min(int(first.max()) + threshold, len(data.index))]
+        pos[idx] = offset + first - start
+        end[idx] = offset + len(close)
+        closes.append(close)
+        offset += len(close)
+    close = np.concatenate(closes).astype(np.float64) if closes else np.zeros(0, dtype=np.float64)
+    return pos, end, close
+
+
+# 批量计算收益率，结果和逐个调用 get_rates 相同。
+# signals 为待回测的 [(date, code, name)]，stocks 为最新一天的行情 {(date, code, name): DataFrame}。
+# 所有信号一次取出 threshold 根K线，得到 信号 × N日 的收益率矩阵。
+# 返回 DataFrame(stock_column)，没有后续K线的信号不返回。
+def get_rates_batch(signals, stocks, stock_column, threshold=101):
+    try:
+        pos, end, close = _locate(signals, stocks, threshold)
+        # 至少还有一根后续K线
+        rows = np.nonzero((pos >= 0) & (end - pos > 1))[0]
+        if len(rows) == 0:
+            return None
+
+        cols = pos[rows, None] + np.arange(threshold)[None, :]
+        valid = cols < end[rows, None]
+        values = close[np.minimum(cols, len(close) - 1)]
+        close1 = values[:, :1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = np.around(100 * (values[:, 1:] - close1) / close1, decimals=2)
+        rates[~valid[:, 1:]] = np.nan
+
+        n = len(stock_column) - 2
+        if rates.shape[1] < n:
+            rates = np.pad(rates, ((0, 0), (0, n - rates.shape[1])), constant_values=np.nan)
+        data = pd.DataFrame(rates[:, :n], columns=stock_column[2:])
+        data.insert(0, stock_column[1], [signals[i][1] for i in rows])
+        data.insert(0, stock_column[0], [signals[i][0] for i in rows])
+        return data
+    except Exception as e:
+        logging.error(f"rate_stats.get_rates_batch处理异常：{e}")
+    return None
+
+
+# 增量计算收益率：filled 为每个信号已回填的天数（rate_1 ~ rate_filled 已有值），
+# 只计算之后新到期的 N日，数值和 get_rates_batch 相同。
+# 返回 DataFrame(stock_column + [filled_column])，只有新到期的 N日 有值，filled_column 为回填后的天数；
+# 没有新到期的信号不返回。
+def get_rates_incremental(signals, filled, stocks, stock_column, filled_column, threshold=101):
+    try:
+        n = len(stock_column) - 2
+        pos, end, close = _locate(signals, stocks, min(threshold, n + 1))
+        filled = np.asarray(filled, dtype=np.int64)
+        # 已到期的天数：信号日之后的K线数，最多 n 天
+        matured = np.where(pos >= 0, np.minimum(end - pos - 1, n), 0)
+        rows = np.nonzero(matured > filled)[0]
+        if len(rows) == 0:
+            return None
+
+        # 展开成 (信号, N日) 的新单元格，一次取出
+        counts = matured[rows] - filled[rows]
+        cell_row = np.repeat(np.arange(len(rows)), counts)
+        horizon = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + \
+            np.repeat(filled[rows], counts) + 1
+        start = pos[rows][cell_row]
+        close1 = close[start]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = np.around(100 * (close[start + horizon] - close1) / close1, decimals=2)
+        rates = np.full((len(rows), n), np.nan)
+        rates[cell_row, horizon - 1] = values
+
+        data = pd.DataFrame(rates, columns=stock_column[2:])
+        data.insert(0, stock_column[1], [signals[i][1] for i in rows])
+        data.insert(0, stock_column[0], [signals[i][0] for i in rows])
+        data[filled_column] = matured[rows]
+        return data
+    except Exception as e:
+        logging.error(f"rate_stats.get_rates_incremental处理异常：{e}")
+    return None
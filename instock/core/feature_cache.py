@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+import talib as tl
+from numpy.lib.stride_tricks import sliding_window_view
+import instock.core.indicator.indicator_cache as icache
+from instock.core.stockpanel import date_index
+
+__author__ = 'myh '
+__date__ = '2024/12/05 '
+
+# 股票特征缓存。
+# 每个 (代码, 截止日期) 一个条目，策略按名字取特征（均线 ma30、ma60、ma250，均量 vol_ma5 等），
+# 同一只股票同一天的特征只算一次，各策略共用；返回的数组只读，不再为了加一列而复制整个行情。
+# 特征和策略函数原来的算法一致：截止日期之前的全部历史上调用 TA-Lib，NaN 置 0，结果逐位相同。
+# 滚动最高收盘价 close_max60 等给组合策略逐日查表用（海龟交易法则），K线数不足周期的位置为 NaN。
+
+# 内存缓存大小（MB），docker -e 传递。0 表示不缓存。
+feature_cache_mb = 128
+_feature_cache_mb = os.environ.get('feature_cache_mb')
+if _feature_cache_mb is not None:
+    feature_cache_mb = int(_feature_cache_mb)
+
+FEATURE_TAIL = 120  # 每个特征至少保留最近多少根K线，请求更长时按需重算
+
+
+def _ma(field):
+    def calc(values, period):
+        value = tl.MA(values[field], timeperiod=period)
+        value[np.isnan(value)] = 0.0
+        return value
+    return calc
+
+
+# 最近 period 天的最高收盘价（不低于 0，忽略 NaN，同 turtle_trade.check_enter 的循环）
+def _close_max(values, period):
+    close = values['close']
+    value = np.full(len(close), np.nan)
+    if len(close) >= period:
+        value[period - 1:] = np.fmax(np.fmax.reduce(sliding_window_view(close, period), axis=1), 0.0)
+    return value
+
+
+# 特征名 -> 计算函数，周期取名字末尾的数字
+_FEATURES = ((re.compile(r'vol_ma(\d+)'), _ma('volume')), (re.compile(r'ma(\d+)'), _ma('close')),
+             (re.compile(r'close_max(\d+)'), _close_max))
+
+
+def _parse(name):
+    for pattern, calc in _FEATURES:
+        m = pattern.fullmatch(name)
+        if m is not None:
+            return calc, int(m.group(1))
+    raise KeyError(f"特征不存在：{name}")
+
+
+# 按条目（代码, 截止日期）做 LRU，条目内 {特征名: 最近若干根K线的值}，多线程安全
+class feature_cache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, name):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            return entry.get(name)
+
+    # 已有更长的值时保留原值
+    def put(self, key, name, value):
+        if value.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                entry = {}
+                self._data[key] = entry
+            old = entry.get(name)
+            if old is not None:
+                if len(old) >= len(value):
+                    return
+                self._bytes -= old.nbytes
+            entry[name] = value
+            self._bytes += value.nbytes
+            self._data.move_to_end(key)
+            while self._bytes > self.max_bytes:
+                _, old_entry = self._data.popitem(last=False)
+                self._bytes -= sum(v.nbytes for v in old_entry.values())
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+
+_cache = feature_cache(feature_cache_mb * 1024 * 1024)
+
+
+def is_enabled():
+    return feature_cache_mb > 0
+
+
+def _key(code, data, end_date):
+    return icache.make_key(code, data, end_date=end_date, params=('feature',))
+
+
+def _calc(data, end, name):
+    calc, period = _parse(name)
+    return calc({'close': data['close'].values[:end], 'volume': data['volume'].values[:end]}, period)
+
+
+# 取特征，返回截止日期之前最近 tail 根K线的只读数组（tail 为 None 时返回全部）
+def get_feature(code, data, name, end_date=None, tail=None):
+    end = len(data.index) if end_date is None else date_index(data, end_date)
+    if end == 0:
+        return np.zeros(0, dtype=np.float64)
+    need = end if tail is None else min(tail, end)
+    key = _key(code, data, end_date) if is_enabled() else None
+    if key is not None:
+        value = _cache.get(key, name)
+        if value is not None and len(value) >= need:
+            return value[len(value) - need:]
+    value = _calc(data, end, name)
+    value.setflags(write=False)
+    if key is not None:
+        # 只保留最近的部分，复制一份，不让缓存持有整个数组
+        keep = np.array(value[max(end - max(need, FEATURE_TAIL), 0):])
+        keep.setflags(write=False)
+        _cache.put(key, name, keep)
+    return value[end - need:]
@@ -0,0 +1,787 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import numpy as np
+import pandas as pd
+import talib as tl
+from numpy.lib.stride_tricks import sliding_window_view
+import instock.core.tablestructure as tbs
+import instock.core.indicator.indicator_registry as ireg
+from instock.core.stockpanel import build_panel
+
+__author__ = 'myh '
+__date__ = '2024/11/20 '
+
+
+# 全市场截面批量指标计算。
+# 在 股票 × 交易日 面板上一次算出 STOCK_STATS_DATA 指标（可按列只算需要的部分），窗口运算沿时间轴对所有股票同时向量化，
+# 上市时间不齐的股票靠左侧 NaN 补齐和有效掩码处理，单只股票的结果与 calculate_indicator.get_indicators 一致。
+
+
+# 和 TA-Lib 一致的零值判断
+def _is_zero(x):
+    return (-0.00000001 < x) & (x < 0.00000001)
+
+
+# 每行第一个非 NaN 的列号，全部为 NaN 时为列数。TA-Lib 的 python 封装同样跳过开头的 NaN。
+def _begin(x):
+    notnan = ~np.isnan(x)
+    return np.where(notnan.any(axis=1), np.argmax(notnan, axis=1), x.shape[1])
+
+
+def _cols(x):
+    return np.arange(x.shape[1])[None, :]
+
+
+# 把每行 begin + lookback 之前的位置置为 NaN
+def _mask_head(out, b, lookback):
+    out[_cols(out) < (b + lookback)[:, None]] = np.nan
+    return out
+
+
+def _fill0(x, valid, inf=False):
+    if inf:
+        x[valid & ~np.isfinite(x)] = 0.0
+    else:
+        x[valid & np.isnan(x)] = 0.0
+    return x
+
+
+# shift(n, fill_value=0.0)：有效区间前 n 个位置填 0，补齐区保持 NaN
+def _shift(x, n, valid):
+    out = np.full_like(x, np.nan)
+    out[:, n:] = x[:, :-n]
+    shifted = np.zeros_like(valid)
+    shifted[:, n:] = valid[:, :-n]
+    out[valid & ~shifted] = 0.0
+    return out
+
+
+# np.insert(np.diff(x), 0, 0.0)
+def _delta(x, valid):
+    out = np.full_like(x, np.nan)
+    out[:, 1:] = x[:, 1:] - x[:, :-1]
+    out[valid & np.isnan(out)] = 0.0
+    return out
+
+
+# 和 TA-Lib 的累加一样，开头之后出现的 NaN 使此后的结果一直为 NaN
+def _mask_nan(out, x):
+    bad = np.isnan(x) & (_cols(x) >= _begin(x)[:, None])
+    if bad.any():
+        first = np.where(bad.any(axis=1), np.argmax(bad, axis=1), x.shape[1])
+        out[_cols(out) >= first[:, None]] = np.nan
+    return out
+
+
+def _rolling_sum(x, period):
+    c = np.cumsum(np.where(np.isnan(x), 0.0, x), axis=1)
+    s = c.copy()
+    s[:, period:] -= c[:, :-period]
+    return _mask_nan(s, x)
+
+
+def SUM(x, period):
+    return _mask_head(_rolling_sum(x, period), _begin(x), period - 1)
+
+
+def MA(x, period):
+    return _mask_head(_rolling_sum(x, period) / period, _begin(x), period - 1)
+
+
+def _rolling(x, period, func):
+    out = np.full_like(x, np.nan)
+    if x.shape[1] >= period:
+        out[:, period - 1:] = func(sliding_window_view(x, period, axis=1), axis=2)
+    return out
+
+
+def MAX(x, period):
+    return _rolling(x, period, np.max)
+
+
+def MIN(x, period):
+    return _rolling(x, period, np.min)
+
+
+# TA-Lib 的 EMA：以前 period 个值的简单平均作为种子。
+# lookback 大于 period-1 时（MACD/PPO 的快线）种子取 lookback 位置往前 period 个值的均值。
+def EMA(x, period, lookback=None, b=None):
+    if b is None:
+        b = _begin(x)
+    if lookback is None:
+        lookback = period - 1
+    k = 2.0 / (period + 1)
+    seed = b + lookback
+    sma = _rolling_sum(x, period) / period
+    out = np.full_like(x, np.nan)
+    prev = np.full(x.shape[0], np.nan)
+    start = int(seed.min()) if len(seed) > 0 else x.shape[1]
+    for t in range(max(start, 0), x.shape[1]):
+        prev = np.where(seed == t, sma[:, t], ((x[:, t] - prev) * k) + prev)
+        out[:, t] = prev
+    return out
+
+
+def MACD(x, fastperiod=12, slowperiod=26, signalperiod=9):
+    b = _begin(x)
+    slow = EMA(x, slowperiod, b=b)
+    fast = EMA(x, fastperiod, lookback=slowperiod - 1, b=b)
+    macd = fast - slow
+    signal = EMA(macd, signalperiod, b=b + slowperiod - 1)
+    macd = _mask_head(macd, b, slowperiod + signalperiod - 2)
+    return macd, signal, macd - signal
+
+
+def PPO(x, fastperiod=12, slowperiod=26):
+    b = _begin(x)
+    slow = EMA(x, slowperiod, b=b)
+    fast = EMA(x, fastperiod, b=b)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.where(_is_zero(slow), 0.0, ((fast - slow) / slow) * 100.0)
+    out[np.isnan(slow)] = np.nan
+    return out
+
+
+def ROC(x, period):
+    out = np.full_like(x, np.nan)
+    prev = x[:, :-period]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[:, period:] = np.where(prev != 0.0, ((x[:, period:] / prev) - 1.0) * 100.0, 0.0)
+    out[:, period:][np.isnan(prev)] = np.nan
+    return out
+
+
+def TRIX(x, period):
+    e = EMA(EMA(EMA(x, period), period), period)
+    return ROC(e, 1)
+
+
+def TEMA(x, period):
+    e1 = EMA(x, period)
+    e2 = EMA(e1, period)
+    e3 = EMA(e2, period)
+    return e3 + ((3.0 * e1) - (3.0 * e2))
+
+
+# Wilder 平滑的 RSI
+def RSI(x, period):
+    b = _begin(x)
+    diff = np.full_like(x, np.nan)
+    diff[:, 1:] = x[:, 1:] - x[:, :-1]
+    gain = np.where(diff > 0, diff, 0.0)
+    loss = np.where(diff < 0, -diff, 0.0)
+    seed = b + period
+    gain_sum = _rolling_sum(gain, period)
+    loss_sum = _rolling_sum(loss, period)
+    out = np.full_like(x, np.nan)
+    prev_gain = np.full(x.shape[0], np.nan)
+    prev_loss = np.full(x.shape[0], np.nan)
+    start = int(seed.min()) if len(seed) > 0 else x.shape[1]
+    for t in range(max(start, 0), x.shape[1]):
+        prev_gain = np.where(seed == t, gain_sum[:, t] / period, ((prev_gain * (period - 1)) + gain[:, t]) / period)
+        prev_loss = np.where(seed == t, loss_sum[:, t] / period, ((prev_loss * (period - 1)) + loss[:, t]) / period)
+        total = prev_gain + prev_loss
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out[:, t] = np.where(_is_zero(total), 0.0, 100.0 * (prev_gain / total))
+        out[np.isnan(total), t] = np.nan
+    return out
+
+
+def TRANGE(high, low, close):
+    prev_close = np.full_like(close, np.nan)
+    prev_close[:, 1:] = close[:, :-1]
+    return np.maximum(np.maximum(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+
+
+def ATR(high, low, close, period):
+    b = _begin(close)
+    tr = TRANGE(high, low, close)
+    seed = b + period
+    tr_sum = _rolling_sum(tr, period)
+    out = np.full_like(close, np.nan)
+    prev = np.full(close.shape[0], np.nan)
+    start = int(seed.min()) if len(seed) > 0 else close.shape[1]
+    for t in range(max(start, 0), close.shape[1]):
+        prev = np.where(seed == t, tr_sum[:, t] / period, ((prev * (period - 1)) + tr[:, t]) / period)
+        out[:, t] = prev
+    return out
+
+
+def STOCH_FASTK(high, low, close, period):
+    highest = MAX(high, period)
+    lowest = MIN(low, period)
+    diff = (highest - lowest) / 100.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.where(diff != 0.0, (close - lowest) / diff, 0.0)
+    out[np.isnan(diff)] = np.nan
+    return out
+
+
+def STOCH(high, low, close, fastk_period=9, slowk_period=5, slowd_period=5):
+    fastk = STOCH_FASTK(high, low, close, fastk_period)
+    slowk = EMA(fastk, slowk_period)
+    slowd = EMA(slowk, slowd_period)
+    slowk[np.isnan(slowd)] = np.nan
+    return slowk, slowd
+
+
+def WILLR(high, low, close, period):
+    highest = MAX(high, period)
+    lowest = MIN(low, period)
+    diff = (highest - lowest) / (-100.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.where(diff != 0.0, (highest - close) / diff, 0.0)
+    out[np.isnan(diff)] = np.nan
+    return out
+
+
+def BBANDS(x, period=20, nbdev=2.0):
+    mid = MA(x, period)
+    mean2 = MA(x * x, period)
+    var = mean2 - mid * mid
+    with np.errstate(invalid='ignore'):
+        sd = np.where(var < 0.00000001, 0.0, np.sqrt(np.where(var > 0, var, 0.0)))
+    sd = sd * nbdev
+    return mid + sd, mid, mid - sd
+
+
+def CCI(high, low, close, period):
+    tp = (high + low + close) / 3
+    avg = MA(tp, period)
+    dev = np.zeros_like(tp)
+    for j in range(min(period, tp.shape[1])):
+        shifted = np.full_like(tp, np.nan)
+        shifted[:, j:] = tp[:, :tp.shape[1] - j]
+        dev += np.abs(shifted - avg)
+    diff = tp - avg
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.where((diff != 0.0) & (dev != 0.0), diff / (0.015 * (dev / period)), 0.0)
+    out[np.isnan(avg)] = np.nan
+    return out
+
+
+def MFI(high, low, close, volume, period):
+    b = _begin(close)
+    tp = (high + low + close) / 3
+    diff = np.full_like(tp, np.nan)
+    diff[:, 1:] = tp[:, 1:] - tp[:, :-1]
+    # 典型价相同但加法顺序不同会留下 1e-15 量级的误差，按持平处理
+    diff[np.abs(diff) <= 1e-12 * np.abs(tp)] = 0.0
+    flow = tp * volume
+    pos = SUM(np.where(diff > 0, flow, np.where(np.isnan(diff), np.nan, 0.0)), period)
+    neg = SUM(np.where(diff < 0, flow, np.where(np.isnan(diff), np.nan, 0.0)), period)
+    total = pos + neg
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = np.where(total < 1.0, 0.0, 100.0 * (pos / total))
+    out[np.isnan(total)] = np.nan
+    return _mask_head(out, b, period)
+
+
+def OBV(close, volume, valid):
+    diff = np.full_like(close, np.nan)
+    diff[:, 1:] = close[:, 1:] - close[:, :-1]
+    step = np.where(diff > 0, volume, np.where(diff < 0, -volume, 0.0))
+    step[~valid] = 0.0
+    b = _begin(close)
+    has = b < close.shape[1]
+    first = np.zeros(close.shape[0])
+    first[has] = volume[has, b[has]]
+    out = first[:, None] + np.cumsum(step, axis=1)
+    out[~valid] = np.nan
+    return out
+
+
+# SAR 是逐根递推的状态机，逐行调用 TA-Lib（C 实现，开销可忽略）
+def SAR(high, low, begin):
+    out = np.full_like(high, np.nan)
+    for i in range(high.shape[0]):
+        b = begin[i]
+        if high.shape[1] - b < 2:
+            continue
+        out[i, b:] = tl.SAR(high[i, b:], low[i, b:])
+    return out
+
+
+def SUPERTREND(close, b_ub, b_lb, begin):
+    size, length = close.shape
+    ub = np.full((size, length), np.nan)
+    lb = np.full((size, length), np.nan)
+    st = np.full((size, length), np.nan)
+    start = int(begin.min()) if size > 0 else length
+    for t in range(start, length):
+        first = begin == t
+        curr_close = close[:, t]
+        curr_b_ub = b_ub[:, t]
+        curr_b_lb = b_lb[:, t]
+        if t == 0:
+            last_close = last_ub = last_lb = last_st = np.full(size, np.nan)
+        else:
+            last_close = close[:, t - 1]
+            last_ub = ub[:, t - 1]
+            last_lb = lb[:, t - 1]
+            last_st = st[:, t - 1]
+        # calculate current upper band
+        curr_ub = np.where((curr_b_ub < last_ub) | (last_close > last_ub), curr_b_ub, last_ub)
+        # calculate current lower band
+        curr_lb = np.where((curr_b_lb > last_lb) | (last_close < last_lb), curr_b_lb, last_lb)
+        # calculate supertrend
+        curr_st = np.where(last_st == last_ub,
+                           np.where(curr_close <= curr_ub, curr_ub, curr_lb),
+                           np.where(last_st == last_lb,
+                                    np.where(curr_close > curr_lb, curr_lb, curr_ub), np.nan))
+        # 每只股票第一根K线
+        ub[:, t] = np.where(first, curr_b_ub, curr_ub)
+        lb[:, t] = np.where(first, curr_b_lb, curr_lb)
+        st[:, t] = np.where(first, np.where(curr_close <= curr_b_ub, curr_b_ub, curr_b_lb), curr_st)
+    return ub, lb, st
+
+
+def _valid(x, valid):
+    x = np.asarray(x, dtype=np.float64)
+    x[~valid] = np.nan
+    return x
+
+
+# macd
+def _macd(p, d):
+    d['macd'], d['macds'], d['macdh'] = MACD(p['close'], fastperiod=12, slowperiod=26, signalperiod=9)
+    _fill0(d['macd'], p.valid)
+    _fill0(d['macds'], p.valid)
+    _fill0(d['macdh'], p.valid)
+
+
+# kdjk
+def _kdj(p, d):
+    d['kdjk'], d['kdjd'] = STOCH(p['high'], p['low'], p['close'], fastk_period=9, slowk_period=5, slowd_period=5)
+    _fill0(d['kdjk'], p.valid)
+    _fill0(d['kdjd'], p.valid)
+    d['kdjj'] = 3 * d['kdjk'] - 2 * d['kdjd']
+
+
+# boll
+def _boll(p, d):
+    d['boll_ub'], d['boll'], d['boll_lb'] = BBANDS(p['close'], period=20, nbdev=2)
+    _fill0(d['boll_ub'], p.valid)
+    _fill0(d['boll'], p.valid)
+    _fill0(d['boll_lb'], p.valid)
+
+
+# trix
+def _trix(p, d):
+    d['trix'] = _fill0(TRIX(p['close'], 12), p.valid)
+    d['trix_20_sma'] = _fill0(MA(d['trix'], 20), p.valid)
+
+
+# 均价
+def _m_price(p, d):
+    d['m_price'] = p['amount'] / p['volume']
+
+
+# cr
+def _cr(p, d):
+    m_price_sf1 = _shift(d['m_price'], 1, p.valid)
+    h_m = p['high'] - np.minimum(m_price_sf1, p['high'])
+    m_l = m_price_sf1 - np.minimum(m_price_sf1, p['low'])
+    d['cr'] = _fill0(SUM(h_m, 26) / SUM(m_l, 26), p.valid, inf=True) * 100
+    d['cr-ma1'] = _fill0(MA(d['cr'], 5), p.valid)
+    d['cr-ma2'] = _fill0(MA(d['cr'], 10), p.valid)
+    d['cr-ma3'] = _fill0(MA(d['cr'], 20), p.valid)
+
+
+# rsi
+def _rsi(p, d):
+    d['rsi'] = _fill0(RSI(p['close'], 14), p.valid)
+    d['rsi_6'] = _fill0(RSI(p['close'], 6), p.valid)
+    d['rsi_12'] = _fill0(RSI(p['close'], 12), p.valid)
+    d['rsi_24'] = _fill0(RSI(p['close'], 24), p.valid)
+
+
+# vr
+def _vr(p, d):
+    p_change = p['p_change']
+    volume = p['volume']
+    avs = SUM(_valid(np.where(p_change > 0, volume, 0), p.valid), 26)
+    bvs = SUM(_valid(np.where(p_change < 0, volume, 0), p.valid), 26)
+    cvs = SUM(_valid(np.where(p_change == 0, volume, 0), p.valid), 26)
+    d['vr'] = _fill0((avs + cvs / 2) / (bvs + cvs / 2), p.valid, inf=True) * 100
+    d['vr_6_sma'] = _fill0(MA(d['vr'], 6), p.valid)
+
+
+# 前一日价格
+def _prev(p, d):
+    d['prev_close'] = _shift(p['close'], 1, p.valid)
+    d['prev_high'] = _shift(p['high'], 1, p.valid)
+    d['prev_low'] = _shift(p['low'], 1, p.valid)
+    d['h_l'] = p['high'] - p['low']
+    d['h_cy'] = p['high'] - d['prev_close']
+    d['cy_l'] = d['prev_close'] - p['low']
+
+
+# atr
+def _atr(p, d):
+    d['tr'] = _fill0(np.fmax(np.fmax(d['h_l'], np.abs(d['h_cy'])), np.abs(d['cy_l'])), p.valid)
+    d['atr'] = _fill0(ATR(p['high'], p['low'], p['close'], 14), p.valid)
+
+
+# DMI stockstats计算公式
+def _dmi(p, d):
+    high_delta = _delta(p['high'], p.valid)
+    high_m = (high_delta + abs(high_delta)) / 2
+    low_delta = -_delta(p['low'], p.valid)
+    low_m = (low_delta + abs(low_delta)) / 2
+    pdm = _fill0(EMA(_valid(np.where(high_m > low_m, high_m, 0), p.valid), 14), p.valid)
+    d['pdi'] = _fill0(pdm / d['atr'], p.valid, inf=True) * 100
+    mdm = _fill0(EMA(_valid(np.where(low_m > high_m, low_m, 0), p.valid), 14), p.valid)
+    d['mdi'] = _fill0(mdm / d['atr'], p.valid, inf=True) * 100
+    d['dx'] = _fill0(abs(d['pdi'] - d['mdi']) / (d['pdi'] + d['mdi']), p.valid, inf=True) * 100
+    d['adx'] = _fill0(EMA(d['dx'], 6), p.valid)
+    d['adxr'] = _fill0(EMA(d['adx'], 6), p.valid)
+
+
+# wr
+def _wr(p, d):
+    d['wr_6'] = _fill0(WILLR(p['high'], p['low'], p['close'], 6), p.valid)
+    d['wr_10'] = _fill0(WILLR(p['high'], p['low'], p['close'], 10), p.valid)
+    d['wr_14'] = _fill0(WILLR(p['high'], p['low'], p['close'], 14), p.valid)
+
+
+# cci
+def _cci(p, d):
+    d['cci'] = _fill0(CCI(p['high'], p['low'], p['close'], 14), p.valid)
+    d['cci_84'] = _fill0(CCI(p['high'], p['low'], p['close'], 84), p.valid)
+
+
+# ma10
+def _ma10(p, d):
+    d['ma10'] = _fill0(MA(p['close'], 10), p.valid)
+
+
+# dma
+def _dma(p, d):
+    d['ma50'] = _fill0(MA(p['close'], 50), p.valid)
+    d['dma'] = d['ma10'] - d['ma50']
+    d['dma_10_sma'] = _fill0(MA(d['dma'], 10), p.valid)
+
+
+# tema
+def _tema(p, d):
+    d['tema'] = _fill0(TEMA(p['close'], 14), p.valid)
+
+
+# mfi
+def _mfi(p, d):
+    d['mfi'] = _fill0(MFI(p['high'], p['low'], p['close'], p['volume'], 14), p.valid)
+    d['mfisma'] = MA(d['mfi'], 6)
+
+
+# vwma
+def _vwma(p, d):
+    d['vwma'] = _fill0(SUM(p['amount'], 14) / SUM(p['volume'], 14), p.valid, inf=True)
+    d['mvwma'] = MA(d['vwma'], 6)
+
+
+# ppo
+def _ppo(p, d):
+    d['ppo'] = _fill0(PPO(p['close'], 12, 26), p.valid)
+    d['ppos'] = _fill0(EMA(d['ppo'], 9), p.valid)
+    d['ppoh'] = d['ppo'] - d['ppos']
+
+
+# stochrsi
+def _stochrsi(p, d):
+    rsi_min = MIN(d['rsi'], 14)
+    rsi_max = MAX(d['rsi'], 14)
+    d['stochrsi_k'] = _fill0((d['rsi'] - rsi_min) / (rsi_max - rsi_min), p.valid, inf=True) * 100
+    d['stochrsi_d'] = MA(d['stochrsi_k'], 3)
+
+
+# wt
+def _wt(p, d):
+    m_price = d['m_price']
+    esa = _fill0(EMA(m_price, 10), p.valid)
+    esa_d = EMA(abs(m_price - esa), 10)
+    esa_ci = _fill0((m_price - esa) / (0.015 * esa_d), p.valid, inf=True)
+    d['wt1'] = _fill0(EMA(esa_ci, 21), p.valid)
+    d['wt2'] = _fill0(MA(d['wt1'], 4), p.valid)
+
+
+# 最高最低价均值
+def _hl_avg(p, d):
+    d['hl_avg'] = (p['high'] + p['low']) / 2.0
+
+
+# Supertrend
+def _supertrend(p, d):
+    m_atr = d['atr'] * 3
+    d['supertrend_ub'], d['supertrend_lb'], d['supertrend'] = SUPERTREND(
+        p['close'], d['hl_avg'] + m_atr, d['hl_avg'] - m_atr, p.begin)
+
+
+# roc
+def _roc(p, d):
+    d['roc'] = _fill0(ROC(p['close'], 12), p.valid)
+    d['rocma'] = _fill0(MA(d['roc'], 6), p.valid)
+    d['rocema'] = _fill0(EMA(d['roc'], 9), p.valid)
+
+
+# obv
+def _obv(p, d):
+    d['obv'] = _fill0(OBV(p['close'], p['volume'], p.valid), p.valid)
+
+
+# sar
+def _sar(p, d):
+    d['sar'] = _fill0(SAR(p['high'], p['low'], p.begin), p.valid)
+
+
+# psy
+def _psy(p, d):
+    price_up = _valid(np.where(p['close'] > d['prev_close'], 1.0, 0.0), p.valid)
+    d['psy'] = _fill0(SUM(price_up, 12) / 12.0, p.valid) * 100
+    d['psyma'] = MA(d['psy'], 6)
+
+
+# BRAR
+def _brar(p, d):
+    d['ar'] = _fill0(SUM(p['high'] - p['open'], 26) / SUM(p['open'] - p['low'], 26), p.valid, inf=True) * 100
+    d['br'] = _fill0(SUM(d['h_cy'], 26) / SUM(d['cy_l'], 26), p.valid, inf=True) * 100
+
+
+# EMV
+def _emv(p, d):
+    phl_avg = (d['prev_high'] + d['prev_low']) / 2.0
+    emva_em = (d['hl_avg'] - phl_avg) * d['h_l'] / p['amount']
+    d['emv'] = _fill0(SUM(emva_em, 14), p.valid)
+    d['emva'] = _fill0(MA(d['emv'], 9), p.valid)
+
+
+# BIAS
+def _bias(p, d):
+    close = p['close']
+    ma6 = _fill0(MA(close, 6), p.valid)
+    ma12 = _fill0(MA(close, 12), p.valid)
+    ma24 = _fill0(MA(close, 24), p.valid)
+    d['bias'] = _fill0((close - ma6) / ma6, p.valid, inf=True) * 100
+    d['bias_12'] = _fill0((close - ma12) / ma12, p.valid, inf=True) * 100
+    d['bias_24'] = _fill0((close - ma24) / ma24, p.valid, inf=True) * 100
+
+
+# DPO
+def _dpo(p, d):
+    c_m_11 = MA(p['close'], 11)
+    d['dpo'] = _fill0(p['close'] - _shift(c_m_11, 1, p.valid), p.valid)
+    d['madpo'] = _fill0(MA(d['dpo'], 6), p.valid)
+
+
+# VHF
+def _vhf(p, d):
+    close = p['close']
+    hcp_lcp = _fill0(MAX(close, 28) - MIN(close, 28), p.valid)
+    d['vhf'] = _fill0(np.divide(hcp_lcp, SUM(abs(close - d['prev_close']), 28)), p.valid)
+
+
+# RVI
+def _rvi(p, d):
+    op, high, low, close, valid = p['open'], p['high'], p['low'], p['close'], p.valid
+    rvi_x = ((close - op) +
+             2 * (d['prev_close'] - _shift(op, 1, valid)) +
+             2 * (_shift(close, 2, valid) - _shift(op, 2, valid)) +
+             (_shift(close, 3, valid) - _shift(op, 3, valid))) / 6
+    rvi_y = ((high - low) +
+             2 * (d['prev_high'] - d['prev_low']) +
+             2 * (_shift(high, 2, valid) - _shift(low, 2, valid)) +
+             (_shift(high, 3, valid) - _shift(low, 3, valid))) / 6
+    d['rvi'] = _fill0(MA(rvi_x, 10) / MA(rvi_y, 10), valid, inf=True)
+    d['rvis'] = (d['rvi'] +
+                 2 * _shift(d['rvi'], 1, valid) +
+                 2 * _shift(d['rvi'], 2, valid) +
+                 _shift(d['rvi'], 3, valid)) / 6
+
+
+# FI
+def _fi(p, d):
+    d['fi'] = _delta(p['close'], p.valid) * p['volume']
+    d['force_2'] = _fill0(EMA(d['fi'], 2), p.valid)
+    d['force_13'] = _fill0(EMA(d['fi'], 13), p.valid)
+
+
+# ENE
+def _ene(p, d):
+    d['ene_ue'] = (1 + 11 / 100) * d['ma10']
+    d['ene_le'] = (1 - 9 / 100) * d['ma10']
+    d['ene'] = (d['ene_ue'] + d['ene_le']) / 2
+
+
+# VOL
+def _vol(p, d):
+    d['vol_5'] = _fill0(MA(p['volume'], 5), p.valid)
+    d['vol_10'] = _fill0(MA(p['volume'], 10), p.valid)
+
+
+# MA
+def _ma(p, d):
+    d['ma20'] = _fill0(MA(p['close'], 20), p.valid)
+    d['ma200'] = _fill0(MA(p['close'], 200), p.valid)
+
+
+# 指标组的计算函数，组名与依赖关系见 indicator_registry.INDICATOR_REGISTRY
+_INDICATOR_FUNCS = {
+    'macd': _macd,
+    'kdj': _kdj,
+    'boll': _boll,
+    'trix': _trix,
+    'm_price': _m_price,
+    'cr': _cr,
+    'rsi': _rsi,
+    'vr': _vr,
+    'prev': _prev,
+    'atr': _atr,
+    'dmi': _dmi,
+    'wr': _wr,
+    'cci': _cci,
+    'ma10': _ma10,
+    'dma': _dma,
+    'tema': _tema,
+    'mfi': _mfi,
+    'vwma': _vwma,
+    'ppo': _ppo,
+    'stochrsi': _stochrsi,
+    'wt': _wt,
+    'hl_avg': _hl_avg,
+    'supertrend': _supertrend,
+    'roc': _roc,
+    'obv': _obv,
+    'sar': _sar,
+    'psy': _psy,
+    'brar': _brar,
+    'emv': _emv,
+    'bias': _bias,
+    'dpo': _dpo,
+    'vhf': _vhf,
+    'rvi': _rvi,
+    'fi': _fi,
+    'ene': _ene,
+    'vol': _vol,
+    'ma': _ma,
+}
+
+
+# 在面板上计算指标，返回 {列名: ndarray(N, T)}，字段含义同 calculate_indicator.get_indicators。
+# columns 为需要的指标列，None 时计算全部；只计算这些列及其依赖的指标。
+# 紧凑模式（compact 为 None 时取 indicator_registry.indicator_compact）下，指标组不再被依赖后，
+# 需要的列转成 float32，不需要的中间列直接丢弃；tail 不为 None 时只保留最后 tail 个交易日。
+def get_indicators_panel(panel, columns=None, compact=None, tail=None):
+    if compact is None:
+        compact = ireg.indicator_compact
+    d = {}
+    if 'close' in panel:
+        d['close'] = panel['close']
+    groups = ireg.resolve_groups(columns)
+    release = ireg.resolve_release(groups) if compact else {}
+    wanted = None if columns is None else set(columns)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for name in groups:
+            _INDICATOR_FUNCS[name](panel, d)
+            for g in release.get(name, ()):
+                for c in ireg.INDICATOR_REGISTRY[g]['columns']:
+                    if wanted is None or c in wanted:
+                        d[c] = (d[c] if tail is None else d[c][:, -tail:]).astype(np.float32)
+                    else:
+                        d.pop(c, None)
+    return d
+
+
+# 全市场批量计算指定日期的指标，返回 DataFrame（date, code, name + stock_column），
+# 结果等价于对每只股票调用 calculate_indicator.get_indicator。
+def get_indicator_batch(stocks, stock_column=None, date=None, calc_threshold=90):
+    try:
+        if stock_column is None:
+            stock_column = list(tbs.STOCK_STATS_DATA['columns'])
+        if date is None:
+            end_date = next(iter(stocks))[0]
+        else:
+            end_date = date.strftime("%Y-%m-%d")
+        panel = build_panel(stocks, end_date=end_date, threshold=calc_threshold,
+                            fields=ireg.resolve_fields(stock_column))
+        if panel.size == 0:
+            return None
+        if panel.length == 0:
+            values = {c: np.zeros(panel.size) for c in stock_column}
+        else:
+            d = get_indicators_panel(panel, stock_column, tail=1)
+            values = {}
+            for c in stock_column:
+                last = d[c][:, -1].copy()
+                last[~np.isfinite(last)] = 0.0
+                values[c] = last
+            # 只有一根K线的股票返回 0 数据。
+            short = (panel.length - panel.begin) <= 1
+            if short.any():
+                for c in stock_column:
+                    values[c][short] = 0.0
+        data = pd.DataFrame(panel.keys, columns=list(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns']))
+        data['date'] = end_date
+        data = pd.concat([data, pd.DataFrame(values, columns=stock_column)], axis=1)
+        return data
+    except Exception as e:
+        logging.error(f"calculate_indicator_batch.get_indicator_batch处理异常：{e}")
+    return None
+
+
+# 历史回补时每次放进面板的股票数，控制全历史面板的内存占用
+BACKFILL_CHUNK_SIZE = 200
+
+
+# 历史回补：每只股票只用全部历史K线算一遍指标时间序列，一次取出多个日期的结果，
+# 返回按日期排列的 DataFrame（date, code, name + stock_column）。
+# 某日停牌的股票取该日之前最后一根K线的值，该日之前不足两根K线的返回 0 数据，与逐日作业一致。
+def get_indicator_backfill(stocks, dates, stock_column=None):
+    try:
+        if stock_column is None:
+            stock_column = list(tbs.STOCK_STATS_DATA['columns'])
+        dates = sorted(d.strftime("%Y-%m-%d") if not isinstance(d, str) else d for d in dates)
+        keys = [k for k in stocks if stocks[k] is not None]
+        if not keys or not dates:
+            return None
+        fields = ireg.resolve_fields(stock_column)
+        dtype = np.float32 if ireg.indicator_compact else np.float64
+        values = {c: np.zeros((len(keys), len(dates)), dtype=dtype) for c in stock_column}
+        for s in range(0, len(keys), BACKFILL_CHUNK_SIZE):
+            chunk = keys[s:s + BACKFILL_CHUNK_SIZE]
+            panel = build_panel({k: stocks[k] for k in chunk}, end_date=dates[-1], fields=fields)
+            if panel.length == 0:
+                continue
+            # 每个日期对应的列号：该日及之前最后一根K线
+            idx = np.empty((panel.size, len(dates)), dtype=np.int64)
+            for i in range(panel.size):
+                b = panel.begin[i]
+                idx[i] = b + np.searchsorted(panel.dates[i, b:].astype(str), dates, side='right') - 1
+            # 只有一根K线（或没有K线）的返回 0 数据
+            short = (idx - panel.begin[:, None]) < 1
+            rows = np.arange(panel.size)[:, None]
+            idx = np.maximum(idx, 0)
+            d = get_indicators_panel(panel, stock_column, tail=panel.length - int(idx.min()))
+            for c in stock_column:
+                # 紧凑模式下只保留了最后几个交易日
+                v = d[c][rows, idx - (panel.length - d[c].shape[1])]
+                v[short | ~np.isfinite(v)] = 0.0
+                values[c][s:s + panel.size] = v
+            del d
+        keys = np.array(keys, dtype=object)
+        frame = {}
+        for j, c in enumerate(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns']):
+            frame[c] = np.repeat(np.array(dates, dtype=object), len(keys)) if c == 'date' else \
+                np.tile(keys[:, j], len(dates))
+            if ireg.indicator_compact:
+                # 日期、代码、名称大量重复，用分类类型保存
+                frame[c] = pd.Categorical(frame[c])
+        # 日期优先展开：values[c].T 按日期逐行
+        for c in stock_column:
+            frame[c] = values.pop(c).T.ravel()
+        data = pd.DataFrame(frame)
+        return data
+    except Exception as e:
+        logging.error(f"calculate_indicator_batch.get_indicator_backfill处理异常：{e}")
+    return None
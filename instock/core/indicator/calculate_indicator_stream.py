@@ -0,0 +1,859 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import os.path
+import numpy as np
+import pandas as pd
+import instock.core.tablestructure as tbs
+from instock.core.stockpanel import build_panel
+
+__author__ = 'myh '
+__date__ = '2024/11/22 '
+
+# 增量（流式）指标计算。
+# 每只股票持久化指标的递推状态：EMA 累加值、Wilder 平滑值、滑动窗口等，每天只推进一根K线，
+# 单只股票每日计算量为 O(1)。EMA 类指标从完整历史起算，不再受 calc_threshold=90 截断起点的影响。
+# 状态按股票向量化保存（每行一只股票），全市场一次推进。
+# 每只股票的记录全部是定长数组：代码为定长字符串，最后一根K线的日期为 datetime64[D]；
+# 状态文件按数组名平铺保存为 npz，不再 pickle Python 对象。
+
+# 状态缓存目录，每个交易日一个文件（状态读写频繁，不压缩）
+cpath_current = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+stock_indicator_state_path = os.path.join(cpath_current, 'cache', 'indicator_state')
+STATE_KEEP_COUNT = 3  # 保留最近几个交易日的状态文件
+STATE_VERSION = 3  # 状态结构变化时加一，旧版本的状态文件不再使用
+
+
+# 状态对象基类，所有首维为股票数的 ndarray 都是按行保存的状态。
+class _state:
+    def _arrays(self):
+        for k, v in vars(self).items():
+            if isinstance(v, np.ndarray):
+                yield k, v
+            elif isinstance(v, _state):
+                yield from ((f'{k}.{kk}', vv) for kk, vv in v._arrays())
+
+    def _set(self, name, value):
+        obj = self
+        names = name.split('.')
+        for n in names[:-1]:
+            obj = getattr(obj, n)
+        setattr(obj, names[-1], value)
+
+    # 按行选取
+    def take(self, idx):
+        for k, v in list(self._arrays()):
+            self._set(k, v[idx])
+        return self
+
+    # 按行拼接
+    def extend(self, other):
+        others = dict(other._arrays())
+        for k, v in list(self._arrays()):
+            self._set(k, np.concatenate([v, others[k]]))
+        return self
+
+
+# 定长滑动窗口，每行独立计数。行情开头的 NaN 会被跳过（与 TA-Lib 一致）。
+class _window(_state):
+    def __init__(self, size, period):
+        self.period = period
+        self.buf = np.full((size, period), np.nan)
+        self.pos = np.zeros(size, dtype=np.int64)
+        self.count = np.zeros(size, dtype=np.int64)
+        self.started = np.zeros(size, dtype=bool)
+        self.broken = np.zeros(size, dtype=bool)  # 出现过 NaN/inf
+
+    def push(self, x, active):
+        self.started |= active & ~np.isnan(x)
+        rows = np.nonzero(active & self.started)[0]
+        self.broken[rows] |= ~np.isfinite(x[rows])
+        self.buf[rows, self.pos[rows]] = x[rows]
+        self.pos[rows] = (self.pos[rows] + 1) % self.period
+        self.count[rows] += 1
+        return rows
+
+    def ready(self):
+        return self.count >= self.period
+
+    # 和 TA-Lib 的累加一样，出现过 NaN/inf 之后结果一直为 NaN（inf 还在窗口里时为 inf）
+    def sum(self):
+        total = np.where(self.ready(), self.buf.sum(axis=1), np.nan)
+        total[self.broken & np.isfinite(total)] = np.nan
+        return total
+
+    def mean(self):
+        return self.sum() / self.period
+
+    def max(self):
+        return np.where(self.ready(), self.buf.max(axis=1), np.nan)
+
+    def min(self):
+        return np.where(self.ready(), self.buf.min(axis=1), np.nan)
+
+    # 窗口中最早的值
+    def oldest(self):
+        return np.where(self.ready(), self.buf[np.arange(len(self.pos)), self.pos], np.nan)
+
+
+class _sma(_window):
+    def update(self, x, active):
+        self.push(x, active)
+        return self.mean()
+
+
+class _sum(_window):
+    def update(self, x, active):
+        self.push(x, active)
+        return self.sum()
+
+
+class _max(_window):
+    def update(self, x, active):
+        self.push(x, active)
+        return self.max()
+
+
+class _min(_window):
+    def update(self, x, active):
+        self.push(x, active)
+        return self.min()
+
+
+# TA-Lib 的 EMA：种子为第 lookback 根K线往前 period 个值的简单平均。
+class _ema(_state):
+    def __init__(self, size, period, lookback=None):
+        self.k = 2.0 / (period + 1)
+        self.lookback = period - 1 if lookback is None else lookback
+        self.window = _window(size, period)
+        self.value = np.full(size, np.nan)
+
+    def update(self, x, active):
+        rows = self.window.push(x, active)
+        count = self.window.count[rows]
+        seed = rows[count == self.lookback + 1]
+        later = rows[count > self.lookback + 1]
+        if len(seed):
+            self.value[seed] = self.window.buf[seed].sum(axis=1) / self.window.period
+        if len(later):
+            prev = self.value[later]
+            self.value[later] = ((x[later] - prev) * self.k) + prev
+        return self.value.copy()
+
+
+# Wilder 平滑，前 period 个值的简单平均作为种子。
+class _wilder(_state):
+    def __init__(self, size, period):
+        self.period = period
+        self.count = np.zeros(size, dtype=np.int64)
+        self.total = np.zeros(size)
+        self.value = np.full(size, np.nan)
+
+    def update(self, x, rows):
+        self.count[rows] += 1
+        count = self.count[rows]
+        seeding = rows[count <= self.period]
+        self.total[seeding] += x[seeding]
+        seed = rows[count == self.period]
+        later = rows[count > self.period]
+        if len(seed):
+            self.value[seed] = self.total[seed] / self.period
+        if len(later):
+            self.value[later] = ((self.value[later] * (self.period - 1)) + x[later]) / self.period
+        return self.value.copy()
+
+
+class _rsi(_state):
+    def __init__(self, size, period):
+        self.prev = np.full(size, np.nan)
+        self.gain = _wilder(size, period)
+        self.loss = _wilder(size, period)
+
+    def update(self, x, active):
+        has_prev = np.nonzero(active & ~np.isnan(self.prev))[0]
+        diff = x - self.prev
+        gain = self.gain.update(np.where(diff > 0, diff, 0.0), has_prev)
+        loss = self.loss.update(np.where(diff < 0, -diff, 0.0), has_prev)
+        self.prev[active] = x[active]
+        total = gain + loss
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out = np.where(_is_zero(total), 0.0, 100.0 * (gain / total))
+        out[np.isnan(total)] = np.nan
+        return out
+
+
+class _atr(_state):
+    def __init__(self, size, period):
+        self.prev_close = np.full(size, np.nan)
+        self.tr = _wilder(size, period)
+
+    def update(self, high, low, close, active):
+        has_prev = np.nonzero(active & ~np.isnan(self.prev_close))[0]
+        tr = np.maximum(np.maximum(high - low, np.abs(high - self.prev_close)), np.abs(low - self.prev_close))
+        out = self.tr.update(tr, has_prev)
+        self.prev_close[active] = close[active]
+        return out
+
+
+# 抛物线转向 SAR，递推过程同 TA-Lib。
+class _sar(_state):
+    def __init__(self, size, acceleration=0.02, maximum=0.2):
+        self.acceleration = acceleration
+        self.maximum = maximum
+        self.count = np.zeros(size, dtype=np.int64)
+        self.is_long = np.zeros(size, dtype=bool)
+        self.af = np.full(size, acceleration)
+        self.ep = np.full(size, np.nan)
+        self.sar = np.full(size, np.nan)
+        self.new_high = np.full(size, np.nan)
+        self.new_low = np.full(size, np.nan)
+        self.value = np.full(size, np.nan)
+
+    def update(self, high, low, active):
+        self.count[active] += 1
+        first = active & (self.count == 1)
+        init = active & (self.count == 2)
+        if init.any():
+            # 用第二根K线的 MINUS_DM 判断初始方向
+            diff_p = high - self.new_high
+            diff_m = self.new_low - low
+            minus_dm = (diff_m > 0) & (diff_p < diff_m)
+            self.is_long = np.where(init, ~minus_dm, self.is_long)
+            self.ep = np.where(init, np.where(self.is_long, high, low), self.ep)
+            self.sar = np.where(init, np.where(self.is_long, self.new_low, self.new_high), self.sar)
+            self.new_high = np.where(init, high, self.new_high)
+            self.new_low = np.where(init, low, self.new_low)
+        rows = active & (self.count >= 2)
+        prev_low = self.new_low
+        prev_high = self.new_high
+        new_low = np.where(rows, low, self.new_low)
+        new_high = np.where(rows, high, self.new_high)
+        sar, ep, af, is_long = self.sar, self.ep, self.af, self.is_long
+        out = np.full(len(sar), np.nan)
+
+        long_rows = rows & is_long
+        short_rows = rows & ~is_long
+        # 多头反转为空头
+        rev = long_rows & (new_low <= sar)
+        s = np.maximum(np.maximum(ep, prev_high), new_high)
+        out = np.where(rev, s, out)
+        s2 = s + self.acceleration * (new_low - s)
+        s2 = np.maximum(np.maximum(s2, prev_high), new_high)
+        n_sar = np.where(rev, s2, sar)
+        n_ep = np.where(rev, new_low, ep)
+        n_af = np.where(rev, self.acceleration, af)
+        n_long = np.where(rev, False, is_long)
+        # 多头延续
+        keep = long_rows & ~rev
+        out = np.where(keep, sar, out)
+        up = keep & (new_high > ep)
+        k_ep = np.where(up, new_high, ep)
+        k_af = np.where(up, np.minimum(af + self.acceleration, self.maximum), af)
+        k_sar = sar + k_af * (k_ep - sar)
+        k_sar = np.minimum(np.minimum(k_sar, prev_low), new_low)
+        n_sar = np.where(keep, k_sar, n_sar)
+        n_ep = np.where(keep, k_ep, n_ep)
+        n_af = np.where(keep, k_af, n_af)
+        # 空头反转为多头
+        rev = short_rows & (new_high >= sar)
+        s = np.minimum(np.minimum(ep, prev_low), new_low)
+        out = np.where(rev, s, out)
+        s2 = s + self.acceleration * (new_high - s)
+        s2 = np.minimum(np.minimum(s2, prev_low), new_low)
+        n_sar = np.where(rev, s2, n_sar)
+        n_ep = np.where(rev, new_high, n_ep)
+        n_af = np.where(rev, self.acceleration, n_af)
+        n_long = np.where(rev, True, n_long)
+        # 空头延续
+        keep = short_rows & ~rev
+        out = np.where(keep, sar, out)
+        down = keep & (new_low < ep)
+        k_ep = np.where(down, new_low, ep)
+        k_af = np.where(down, np.minimum(af + self.acceleration, self.maximum), af)
+        k_sar = sar + k_af * (k_ep - sar)
+        k_sar = np.maximum(np.maximum(k_sar, prev_high), new_high)
+        n_sar = np.where(keep, k_sar, n_sar)
+        n_ep = np.where(keep, k_ep, n_ep)
+        n_af = np.where(keep, k_af, n_af)
+
+        self.sar, self.ep, self.af, self.is_long = n_sar, n_ep, n_af, n_long
+        self.new_high, self.new_low = new_high, new_low
+        self.new_high = np.where(first, high, self.new_high)
+        self.new_low = np.where(first, low, self.new_low)
+        self.value = np.where(rows, out, self.value)
+        return self.value.copy()
+
+
+def _is_zero(x):
+    return (-0.00000001 < x) & (x < 0.00000001)
+
+
+def _fill0(x, inf=False):
+    if inf:
+        return np.where(np.isfinite(x), x, 0.0)
+    return np.where(np.isnan(x), 0.0, x)
+
+
+def _div(a, b):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return a / b
+
+
+# 全部指标的递推状态，每行一只股票。
+class indicator_stream(_state):
+    def __init__(self, codes):
+        size = len(codes)
+        self.version = STATE_VERSION
+        self.codes = np.array(codes, dtype=str)
+        self.last_date = np.full(size, np.datetime64('NaT'), dtype='datetime64[D]')
+        self.last_close = np.full(size, np.nan)
+        self.bars = np.zeros(size, dtype=np.int64)
+        # 前 1~3 根K线（shift 填 0）
+        self.prev_open = np.zeros((size, 3))
+        self.prev_high = np.zeros((size, 3))
+        self.prev_low = np.zeros((size, 3))
+        self.prev_close = np.zeros((size, 3))
+        self.prev_m_price = np.zeros(size)
+        self.prev_c_m_11 = np.zeros(size)
+        self.prev_rvi = np.zeros((size, 3))
+        self.obv = np.zeros(size)
+        # macd
+        self.macd_fast = _ema(size, 12, lookback=25)
+        self.macd_slow = _ema(size, 26)
+        self.macd_signal = _ema(size, 9)
+        # kdj
+        self.kdj_high = _max(size, 9)
+        self.kdj_low = _min(size, 9)
+        self.kdj_k = _ema(size, 5)
+        self.kdj_d = _ema(size, 5)
+        # boll
+        self.boll = _window(size, 20)
+        self.boll2 = _window(size, 20)
+        # trix
+        self.trix_e1 = _ema(size, 12)
+        self.trix_e2 = _ema(size, 12)
+        self.trix_e3 = _ema(size, 12)
+        self.trix_prev = np.full(size, np.nan)
+        self.trix_sma = _sma(size, 20)
+        # cr
+        self.h_m_sum = _sum(size, 26)
+        self.m_l_sum = _sum(size, 26)
+        self.cr_ma1 = _sma(size, 5)
+        self.cr_ma2 = _sma(size, 10)
+        self.cr_ma3 = _sma(size, 20)
+        # rsi
+        self.rsi = _rsi(size, 14)
+        self.rsi_6 = _rsi(size, 6)
+        self.rsi_12 = _rsi(size, 12)
+        self.rsi_24 = _rsi(size, 24)
+        # vr
+        self.avs = _sum(size, 26)
+        self.bvs = _sum(size, 26)
+        self.cvs = _sum(size, 26)
+        self.vr_sma = _sma(size, 6)
+        # atr / dmi
+        self.atr = _atr(size, 14)
+        self.pdm = _ema(size, 14)
+        self.mdm = _ema(size, 14)
+        self.adx = _ema(size, 6)
+        self.adxr = _ema(size, 6)
+        # wr
+        self.wr_high = {p: _max(size, p) for p in (6, 10, 14)}
+        self.wr_low = {p: _min(size, p) for p in (6, 10, 14)}
+        # cci
+        self.cci = _window(size, 14)
+        self.cci_84 = _window(size, 84)
+        # ma
+        self.ma = {p: _sma(size, p) for p in (6, 10, 11, 12, 20, 24, 50, 200)}
+        self.dma_sma = _sma(size, 10)
+        # tema
+        self.tema_e1 = _ema(size, 14)
+        self.tema_e2 = _ema(size, 14)
+        self.tema_e3 = _ema(size, 14)
+        # mfi
+        self.mfi_prev = np.full(size, np.nan)
+        self.mfi_pos = _sum(size, 14)
+        self.mfi_neg = _sum(size, 14)
+        self.mfisma = _sma(size, 6)
+        # vwma
+        self.tpv_14 = _sum(size, 14)
+        self.vol_14 = _sum(size, 14)
+        self.mvwma = _sma(size, 6)
+        # ppo
+        self.ppo_fast = _ema(size, 12)
+        self.ppo_slow = _ema(size, 26)
+        self.ppos = _ema(size, 9)
+        # stochrsi
+        self.rsi_min = _min(size, 14)
+        self.rsi_max = _max(size, 14)
+        self.stochrsi_d = _sma(size, 3)
+        # wt
+        self.esa = _ema(size, 10)
+        self.esa_d = _ema(size, 10)
+        self.wt1 = _ema(size, 21)
+        self.wt2 = _sma(size, 4)
+        # supertrend
+        self.st_ub = np.full(size, np.nan)
+        self.st_lb = np.full(size, np.nan)
+        self.st = np.full(size, np.nan)
+        # roc
+        self.roc = _window(size, 13)
+        self.rocma = _sma(size, 6)
+        self.rocema = _ema(size, 9)
+        # sar
+        self.sar = _sar(size)
+        # psy
+        self.psy = _sum(size, 12)
+        self.psyma = _sma(size, 6)
+        # brar
+        self.h_o_sum = _sum(size, 26)
+        self.o_l_sum = _sum(size, 26)
+        self.h_cy_sum = _sum(size, 26)
+        self.cy_l_sum = _sum(size, 26)
+        # emv
+        self.emv = _sum(size, 14)
+        self.emva = _sma(size, 9)
+        # dpo
+        self.madpo = _sma(size, 6)
+        # vhf
+        self.vhf_max = _max(size, 28)
+        self.vhf_min = _min(size, 28)
+        self.vhf_sum = _sum(size, 28)
+        # rvi
+        self.rvi_x = _sma(size, 10)
+        self.rvi_y = _sma(size, 10)
+        # fi
+        self.force_2 = _ema(size, 2)
+        self.force_13 = _ema(size, 13)
+        # vol
+        self.vol_5 = _sma(size, 5)
+        self.vol_10 = _sma(size, 10)
+        # 最近一次的指标值，停牌的股票沿用
+        self.values = {c: np.zeros(size) for c in tbs.STOCK_STATS_DATA['columns']}
+
+    def _arrays(self):
+        yield from super()._arrays()
+        for name in ('wr_high', 'wr_low', 'ma'):
+            for p, op in getattr(self, name).items():
+                yield from ((f'{name}[{p}].{k}', v) for k, v in op._arrays())
+        for c, v in self.values.items():
+            yield f'values[{c}]', v
+
+    def _set(self, name, value):
+        if name.startswith('values['):
+            self.values[name[7:-1]] = value
+            return
+        for attr in ('wr_high', 'wr_low', 'ma'):
+            if name.startswith(f'{attr}['):
+                key, rest = name[len(attr) + 1:].split('].', 1)
+                getattr(self, attr)[int(key)]._set(rest, value)
+                return
+        super()._set(name, value)
+
+    # 推进一根K线，bar 为 {字段: ndarray(N,)}，active 为当天有K线的股票。
+    def update(self, bar, active):
+        op = bar['open']
+        high = bar['high']
+        low = bar['low']
+        close = bar['close']
+        volume = bar['volume']
+        amount = bar['amount']
+        p_change = bar['p_change']
+        first = active & (self.bars == 0)
+        prev_close = self.prev_close[:, 0]
+        prev_high = self.prev_high[:, 0]
+        prev_low = self.prev_low[:, 0]
+        v = {'close': close}
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # macd
+            fast = self.macd_fast.update(close, active)
+            slow = self.macd_slow.update(close, active)
+            macd = fast - slow
+            signal = self.macd_signal.update(macd, active)
+            macd = np.where(np.isnan(signal), np.nan, macd)
+            v['macd'] = _fill0(macd)
+            v['macds'] = _fill0(signal)
+            v['macdh'] = _fill0(macd - signal)
+
+            # kdj
+            hh = self.kdj_high.update(high, active)
+            ll = self.kdj_low.update(low, active)
+            diff = (hh - ll) / 100.0
+            fastk = np.where(diff != 0.0, _div(close - ll, diff), 0.0)
+            fastk[np.isnan(diff)] = np.nan
+            slowk = self.kdj_k.update(fastk, active)
+            slowd = self.kdj_d.update(slowk, active)
+            slowk = np.where(np.isnan(slowd), np.nan, slowk)
+            v['kdjk'] = _fill0(slowk)
+            v['kdjd'] = _fill0(slowd)
+            v['kdjj'] = 3 * v['kdjk'] - 2 * v['kdjd']
+
+            # boll
+            self.boll.push(close, active)
+            self.boll2.push(close * close, active)
+            mid = self.boll.mean()
+            var = self.boll2.mean() - mid * mid
+            sd = np.where(var < 0.00000001, 0.0, np.sqrt(np.where(var > 0, var, 0.0))) * 2
+            v['boll_ub'] = _fill0(mid + sd)
+            v['boll'] = _fill0(mid)
+            v['boll_lb'] = _fill0(mid - sd)
+
+            # trix
+            e3 = self.trix_e3.update(self.trix_e2.update(self.trix_e1.update(close, active), active), active)
+            trix = np.where(self.trix_prev != 0.0, ((e3 / self.trix_prev) - 1.0) * 100.0, 0.0)
+            trix[np.isnan(self.trix_prev) | np.isnan(e3)] = np.nan
+            self.trix_prev = np.where(active, e3, self.trix_prev)
+            v['trix'] = _fill0(trix)
+            v['trix_20_sma'] = _fill0(self.trix_sma.update(v['trix'], active))
+
+            # cr
+            m_price = amount / volume
+            m_price_sf1 = self.prev_m_price
+            h_m = high - np.minimum(m_price_sf1, high)
+            m_l = m_price_sf1 - np.minimum(m_price_sf1, low)
+            cr = _div(self.h_m_sum.update(h_m, active), self.m_l_sum.update(m_l, active))
+            v['cr'] = _fill0(cr, inf=True) * 100
+            v['cr-ma1'] = _fill0(self.cr_ma1.update(v['cr'], active))
+            v['cr-ma2'] = _fill0(self.cr_ma2.update(v['cr'], active))
+            v['cr-ma3'] = _fill0(self.cr_ma3.update(v['cr'], active))
+
+            # rsi
+            v['rsi'] = _fill0(self.rsi.update(close, active))
+            v['rsi_6'] = _fill0(self.rsi_6.update(close, active))
+            v['rsi_12'] = _fill0(self.rsi_12.update(close, active))
+            v['rsi_24'] = _fill0(self.rsi_24.update(close, active))
+
+            # vr
+            avs = self.avs.update(np.where(p_change > 0, volume, 0.0), active)
+            bvs = self.bvs.update(np.where(p_change < 0, volume, 0.0), active)
+            cvs = self.cvs.update(np.where(p_change == 0, volume, 0.0), active)
+            v['vr'] = _fill0(_div(avs + cvs / 2, bvs + cvs / 2), inf=True) * 100
+            v['vr_6_sma'] = _fill0(self.vr_sma.update(v['vr'], active))
+
+            # atr
+            h_l = high - low
+            h_cy = high - prev_close
+            cy_l = prev_close - low
+            v['tr'] = _fill0(np.fmax(np.fmax(h_l, np.abs(h_cy)), np.abs(cy_l)))
+            v['atr'] = _fill0(self.atr.update(high, low, close, active))
+
+            # DMI stockstats计算公式
+            high_delta = np.where(first, 0.0, high - prev_high)
+            high_m = (high_delta + abs(high_delta)) / 2
+            low_delta = np.where(first, 0.0, -(low - prev_low))
+            low_m = (low_delta + abs(low_delta)) / 2
+            pdm = _fill0(self.pdm.update(np.where(high_m > low_m, high_m, 0.0), active))
+            v['pdi'] = _fill0(pdm / v['atr'], inf=True) * 100
+            mdm = _fill0(self.mdm.update(np.where(low_m > high_m, low_m, 0.0), active))
+            v['mdi'] = _fill0(mdm / v['atr'], inf=True) * 100
+            v['dx'] = _fill0(abs(v['pdi'] - v['mdi']) / (v['pdi'] + v['mdi']), inf=True) * 100
+            v['adx'] = _fill0(self.adx.update(v['dx'], active))
+            v['adxr'] = _fill0(self.adxr.update(v['adx'], active))
+
+            # wr
+            for p in (6, 10, 14):
+                hh = self.wr_high[p].update(high, active)
+                ll = self.wr_low[p].update(low, active)
+                diff = (hh - ll) / (-100.0)
+                wr = np.where(diff != 0.0, _div(hh - close, diff), 0.0)
+                wr[np.isnan(diff)] = np.nan
+                v[f'wr_{p}'] = _fill0(wr)
+
+            # cci
+            tp = (high + low + close) / 3
+            for name, window in (('cci', self.cci), ('cci_84', self.cci_84)):
+                window.push(tp, active)
+                avg = window.mean()
+                dev = np.abs(window.buf - avg[:, None]).sum(axis=1)
+                diff = tp - avg
+                cci = np.where((diff != 0.0) & (dev != 0.0), _div(diff, 0.015 * (dev / window.period)), 0.0)
+                cci[np.isnan(avg)] = np.nan
+                v[name] = _fill0(cci)
+
+            # ma
+            ma = {p: _fill0(self.ma[p].update(close, active)) for p in self.ma}
+            v['ma10'] = ma[10]
+            v['ma50'] = ma[50]
+            v['dma'] = v['ma10'] - v['ma50']
+            v['dma_10_sma'] = _fill0(self.dma_sma.update(v['dma'], active))
+
+            # tema
+            e1 = self.tema_e1.update(close, active)
+            e2 = self.tema_e2.update(e1, active)
+            e3 = self.tema_e3.update(e2, active)
+            v['tema'] = _fill0(e3 + ((3.0 * e1) - (3.0 * e2)))
+
+            # mfi
+            diff = tp - self.mfi_prev
+            diff = np.where(np.abs(diff) <= 1e-12 * np.abs(tp), 0.0, diff)
+            flow = tp * volume
+            has_prev = active & ~np.isnan(self.mfi_prev)
+            pos = self.mfi_pos.update(np.where(diff > 0, flow, 0.0), has_prev)
+            neg = self.mfi_neg.update(np.where(diff < 0, flow, 0.0), has_prev)
+            self.mfi_prev = np.where(active, tp, self.mfi_prev)
+            total = pos + neg
+            mfi = np.where(total < 1.0, 0.0, _div(100.0 * pos, total))
+            mfi[np.isnan(total)] = np.nan
+            v['mfi'] = _fill0(mfi)
+            v['mfisma'] = self.mfisma.update(v['mfi'], active)
+
+            # vwma
+            v['vwma'] = _fill0(_div(self.tpv_14.update(amount, active), self.vol_14.update(volume, active)), inf=True)
+            v['mvwma'] = self.mvwma.update(v['vwma'], active)
+
+            # ppo
+            fast = self.ppo_fast.update(close, active)
+            slow = self.ppo_slow.update(close, active)
+            ppo = np.where(_is_zero(slow), 0.0, _div((fast - slow), slow) * 100.0)
+            ppo[np.isnan(slow)] = np.nan
+            v['ppo'] = _fill0(ppo)
+            v['ppos'] = _fill0(self.ppos.update(v['ppo'], active))
+            v['ppoh'] = v['ppo'] - v['ppos']
+
+            # stochrsi
+            rsi_min = self.rsi_min.update(v['rsi'], active)
+            rsi_max = self.rsi_max.update(v['rsi'], active)
+            v['stochrsi_k'] = _fill0(_div(v['rsi'] - rsi_min, rsi_max - rsi_min), inf=True) * 100
+            v['stochrsi_d'] = self.stochrsi_d.update(v['stochrsi_k'], active)
+
+            # wt
+            esa = _fill0(self.esa.update(m_price, active))
+            esa_d = self.esa_d.update(abs(m_price - esa), active)
+            esa_ci = _fill0(_div(m_price - esa, 0.015 * esa_d), inf=True)
+            v['wt1'] = _fill0(self.wt1.update(esa_ci, active))
+            v['wt2'] = _fill0(self.wt2.update(v['wt1'], active))
+
+            # Supertrend
+            m_atr = v['atr'] * 3
+            hl_avg = (high + low) / 2.0
+            b_ub = hl_avg + m_atr
+            b_lb = hl_avg - m_atr
+            last_close = prev_close
+            ub = np.where((b_ub < self.st_ub) | (last_close > self.st_ub), b_ub, self.st_ub)
+            lb = np.where((b_lb > self.st_lb) | (last_close < self.st_lb), b_lb, self.st_lb)
+            st = np.where(self.st == self.st_ub, np.where(close <= ub, ub, lb),
+                          np.where(self.st == self.st_lb, np.where(close > lb, lb, ub), np.nan))
+            ub = np.where(first, b_ub, ub)
+            lb = np.where(first, b_lb, lb)
+            st = np.where(first, np.where(close <= b_ub, b_ub, b_lb), st)
+            self.st_ub = np.where(active, ub, self.st_ub)
+            self.st_lb = np.where(active, lb, self.st_lb)
+            self.st = np.where(active, st, self.st)
+            v['supertrend_ub'] = ub
+            v['supertrend_lb'] = lb
+            v['supertrend'] = st
+
+            # roc
+            self.roc.push(close, active)
+            oldest = self.roc.oldest()
+            roc = np.where(oldest != 0.0, ((close / oldest) - 1.0) * 100.0, 0.0)
+            roc[np.isnan(oldest)] = np.nan
+            v['roc'] = _fill0(roc)
+            v['rocma'] = _fill0(self.rocma.update(v['roc'], active))
+            v['rocema'] = _fill0(self.rocema.update(v['roc'], active))
+
+            # obv
+            step = np.where(close > prev_close, volume, np.where(close < prev_close, -volume, 0.0))
+            self.obv = np.where(first, volume, np.where(active, self.obv + step, self.obv))
+            v['obv'] = _fill0(self.obv)
+
+            # sar
+            v['sar'] = _fill0(self.sar.update(high, low, active))
+
+            # psy
+            price_up = np.where(close > prev_close, 1.0, 0.0)
+            v['psy'] = _fill0(self.psy.update(price_up, active) / 12.0) * 100
+            v['psyma'] = self.psyma.update(v['psy'], active)
+
+            # BRAR
+            ar = _div(self.h_o_sum.update(high - op, active), self.o_l_sum.update(op - low, active))
+            v['ar'] = _fill0(ar, inf=True) * 100
+            br = _div(self.h_cy_sum.update(h_cy, active), self.cy_l_sum.update(cy_l, active))
+            v['br'] = _fill0(br, inf=True) * 100
+
+            # EMV
+            phl_avg = (prev_high + prev_low) / 2.0
+            emva_em = (hl_avg - phl_avg) * h_l / amount
+            v['emv'] = _fill0(self.emv.update(emva_em, active))
+            v['emva'] = _fill0(self.emva.update(v['emv'], active))
+
+            # BIAS
+            v['bias'] = _fill0(_div(close - ma[6], ma[6]), inf=True) * 100
+            v['bias_12'] = _fill0(_div(close - ma[12], ma[12]), inf=True) * 100
+            v['bias_24'] = _fill0(_div(close - ma[24], ma[24]), inf=True) * 100
+
+            # DPO
+            c_m_11 = self.ma[11].mean()
+            v['dpo'] = _fill0(close - self.prev_c_m_11)
+            self.prev_c_m_11 = np.where(active, c_m_11, self.prev_c_m_11)
+            v['madpo'] = _fill0(self.madpo.update(v['dpo'], active))
+
+            # VHF
+            hcp_lcp = _fill0(self.vhf_max.update(close, active) - self.vhf_min.update(close, active))
+            v['vhf'] = _fill0(_div(hcp_lcp, self.vhf_sum.update(abs(close - prev_close), active)))
+
+            # RVI
+            po, ph, pl, pc = self.prev_open, self.prev_high, self.prev_low, self.prev_close
+            rvi_x = ((close - op) +
+                     2 * (pc[:, 0] - po[:, 0]) +
+                     2 * (pc[:, 1] - po[:, 1]) +
+                     (pc[:, 2] - po[:, 2])) / 6
+            rvi_y = ((high - low) +
+                     2 * (ph[:, 0] - pl[:, 0]) +
+                     2 * (ph[:, 1] - pl[:, 1]) +
+                     (ph[:, 2] - pl[:, 2])) / 6
+            rvi = _div(self.rvi_x.update(rvi_x, active), self.rvi_y.update(rvi_y, active))
+            v['rvi'] = _fill0(rvi, inf=True)
+            v['rvis'] = (v['rvi'] +
+                         2 * self.prev_rvi[:, 0] +
+                         2 * self.prev_rvi[:, 1] +
+                         self.prev_rvi[:, 2]) / 6
+
+            # FI
+            v['fi'] = np.where(first, 0.0, close - prev_close) * volume
+            v['force_2'] = _fill0(self.force_2.update(v['fi'], active))
+            v['force_13'] = _fill0(self.force_13.update(v['fi'], active))
+
+            # ENE
+            v['ene_ue'] = (1 + 11 / 100) * v['ma10']
+            v['ene_le'] = (1 - 9 / 100) * v['ma10']
+            v['ene'] = (v['ene_ue'] + v['ene_le']) / 2
+
+            # VOL
+            v['vol_5'] = _fill0(self.vol_5.update(volume, active))
+            v['vol_10'] = _fill0(self.vol_10.update(volume, active))
+
+            # MA
+            v['ma20'] = ma[20]
+            v['ma200'] = ma[200]
+
+        # 前 1~3 根K线
+        for hist, x in ((self.prev_open, op), (self.prev_high, high), (self.prev_low, low),
+                        (self.prev_close, close), (self.prev_rvi, v['rvi'])):
+            hist[active] = np.column_stack((x, hist[:, :2]))[active]
+        self.prev_m_price = np.where(active, m_price, self.prev_m_price)
+        self.bars[active] += 1
+        self.last_close = np.where(active, close, self.last_close)
+        for c in self.values:
+            self.values[c] = np.where(active, v[c], self.values[c])
+        return v
+
+    # 按面板逐根推进，active_from 为每行开始推进的列号（之前的K线已计入状态）。
+    def run(self, panel, active_from=None):
+        for t in range(panel.length):
+            active = panel.valid[:, t].copy()
+            if active_from is not None:
+                active &= t >= active_from
+            if not active.any():
+                continue
+            bar = {f: panel[f][:, t] for f in panel.fields}
+            self.update(bar, active)
+            self.last_date[active] = panel.dates[active, t].astype('datetime64[D]')
+        return self
+
+
+def _state_file(date_str):
+    return os.path.join(stock_indicator_state_path, f'{date_str}.npz')
+
+
+def load_state(end_date):
+    try:
+        if not os.path.exists(stock_indicator_state_path):
+            return None
+        files = sorted(f for f in os.listdir(stock_indicator_state_path) if f.endswith('.npz'))
+        files = [f for f in files if f[:10] < end_date]
+        if not files:
+            return None
+        with np.load(os.path.join(stock_indicator_state_path, files[-1])) as data:
+            if 'version' not in data.files or int(data['version']) != STATE_VERSION:
+                return None
+            # 先按代码建好结构，再按数组名填回
+            state = indicator_stream(data['codes'])
+            for name, _ in list(state._arrays()):
+                state._set(name, data[name])
+        return state
+    except Exception as e:
+        logging.error(f"calculate_indicator_stream.load_state处理异常：{e}")
+    return None
+
+
+def save_state(state, end_date):
+    try:
+        if not os.path.exists(stock_indicator_state_path):
+            os.makedirs(stock_indicator_state_path)
+        arrays = dict(state._arrays())
+        arrays['version'] = np.array(STATE_VERSION)
+        with open(_state_file(end_date), 'wb') as f:
+            np.savez(f, **arrays)
+        files = sorted(f for f in os.listdir(stock_indicator_state_path) if f.endswith('.npz'))
+        for f in files[:-STATE_KEEP_COUNT]:
+            os.remove(os.path.join(stock_indicator_state_path, f))
+    except Exception as e:
+        logging.error(f"calculate_indicator_stream.save_state处理异常：{e}")
+
+
+# 增量计算指定日期的指标，返回 DataFrame（date, code, name + stock_column）。
+# 有上一交易日状态且复权价格未变动的股票只推进新增的K线，其余股票用完整历史重建状态。
+def get_indicator_stream(stocks, stock_column=None, date=None):
+    try:
+        if stock_column is None:
+            stock_column = list(tbs.STOCK_STATS_DATA['columns'])
+        if date is None:
+            end_date = next(iter(stocks))[0]
+        else:
+            end_date = date.strftime("%Y-%m-%d")
+
+        state = load_state(end_date)
+        rows = {} if state is None else {c: i for i, c in enumerate(state.codes)}
+
+        advance_keys, advance_rows, advance_new = [], [], []
+        rebuild_keys = []
+        for k in stocks:
+            data = stocks[k]
+            if data is None:
+                continue
+            i = rows.get(k[1])
+            if i is not None and not np.isnat(state.last_date[i]):
+                dates = data['date'].values
+                last_date = str(state.last_date[i])
+                end = np.searchsorted(dates, end_date, side='right')
+                j = np.searchsorted(dates, last_date)
+                # 状态日期的收盘价没变（没有重新复权）才能接着推进
+                if j < end and dates[j] == last_date and data['close'].values[j] == state.last_close[i]:
+                    advance_keys.append(k)
+                    advance_rows.append(i)
+                    advance_new.append(end - j - 1)
+                    continue
+            rebuild_keys.append(k)
+
+        result = None
+        if advance_keys:
+            result = state.take(np.array(advance_rows, dtype=np.int64))
+            new = np.array(advance_new, dtype=np.int64)
+            panel = build_panel({k: stocks[k] for k in advance_keys}, end_date=end_date, threshold=int(new.max()))
+            if panel.length > 0:
+                result.run(panel, active_from=panel.length - new)
+        if rebuild_keys:
+            panel = build_panel({k: stocks[k] for k in rebuild_keys}, end_date=end_date)
+            rebuilt = indicator_stream(panel.codes()).run(panel)
+            result = rebuilt if result is None else result.extend(rebuilt)
+        if result is None:
+            return None
+        save_state(result, end_date)
+
+        keys = advance_keys + rebuild_keys
+        data = pd.DataFrame(keys, columns=list(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns']))
+        data['date'] = end_date
+        values = {}
+        for c in stock_column:
+            val = result.values[c].copy()
+            val[~np.isfinite(val)] = 0.0
+            # 只有一根K线的股票返回 0 数据。
+            val[result.bars <= 1] = 0.0
+            values[c] = val
+        return pd.concat([data, pd.DataFrame(values, columns=stock_column)], axis=1)
+    except Exception as e:
+        logging.error(f"calculate_indicator_stream.get_indicator_stream处理异常：{e}")
+    return None
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import os.path
+import sys
+import glob
+import time
+import datetime
+import numpy as np
+import pandas as pd
+import talib as tl
+
+cpath_current = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+cpath = os.path.abspath(os.path.join(cpath_current, os.pardir))
+sys.path.append(cpath)
+import instock.core.tablestructure as tbs
+import instock.core.indicator.indicator_registry as ireg
+import instock.core.indicator.indicator_kernels as ikn
+import instock.core.indicator.calculate_indicator as idr
+import instock.core.indicator.calculate_indicator_batch as bidr
+import instock.core.indicator.calculate_indicator_stream as sidr
+import instock.core.process_executor as pe
+from instock.core.stockpanel import build_panel
+from instock.core.stockfetch import stock_hist_cache_path
+
+__author__ = 'myh '
+__date__ = '2024/11/29 '
+
+# 指标计算的一致性校验和性能基准。
+# 以 calculate_indicator.get_indicator（逐只股票 pandas 计算）为参照，校验批量面板、增量递推、紧凑模式、
+# JIT 内核与 NumPy 回退的每个 STOCK_STATS_DATA 列；再按不同K线窗口统计单只股票和全市场的耗时。
+# get_indicator 本身也在改动，另有冻结的基准结果 indicator_baseline.npz：一组固定的随机K线和改动前的
+# get_indicator 在其上的输出，所有计算方式（包括 get_indicator）都要和它一致，两边同时出错也能发现。
+# 行情优先用 cache/hist 下缓存的真实K线，不够时用随机生成的K线补齐。
+# python -m instock.core.indicator.indicator_benchmark [股票数] [K线数]
+
+PARITY_RTOL = 1e-6  # 相对误差
+PARITY_ATOL = 1e-6  # 绝对误差，按列的最大绝对值缩放
+COMPACT_RTOL = 1e-4  # 紧凑模式结果为 float32
+BENCHMARK_WINDOWS = (90, 250, None)  # 参与计算的K线数，None 为全部历史
+BENCHMARK_REPEAT = 3
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'indicator_baseline.npz')
+
+
+# 随机生成一只股票的日K线，字段和 stockfetch.fetch_stock_hist 的结果一致
+def synthetic_stock(bars, seed, start=datetime.date(2020, 1, 2)):
+    rng = np.random.default_rng(seed)
+    dates = []
+    date = start
+    while len(dates) < bars:
+        if date.weekday() < 5:
+            dates.append(date.strftime("%Y-%m-%d"))
+        date += datetime.timedelta(days=1)
+    ret = rng.normal(0.0005, 0.025, bars)
+    ret[rng.random(bars) < 0.02] = 0.1  # 涨停
+    close = np.round(10 * np.exp(np.cumsum(ret)), 2)
+    open_ = np.round(close * (1 + rng.normal(0, 0.01, bars)), 2)
+    high = np.round(np.maximum(close, open_) * (1 + np.abs(rng.normal(0, 0.01, bars))), 2)
+    low = np.round(np.minimum(close, open_) * (1 - np.abs(rng.normal(0, 0.01, bars))), 2)
+    volume = np.round(rng.lognormal(13, 0.6, bars))
+    volume[rng.random(bars) < 0.005] = 0.0  # 零成交
+    amount = volume * (high + low + close) / 3 * 100
+    data = pd.DataFrame({'date': dates, 'open': open_, 'close': close, 'high': high, 'low': low,
+                         'volume': volume, 'amount': amount, 'amplitude': 0.0, 'quote_change': 0.0,
+                         'ups_downs': 0.0, 'turnover': 1.0})
+    return _hist_fields(data)
+
+
+# 和 stockfetch.fetch_stock_hist 一样补充 p_change，成交量单位从手变成股
+def _hist_fields(data):
+    data.loc[:, 'p_change'] = tl.ROC(data['close'].values, 1)
+    data['p_change'].values[np.isnan(data['p_change'].values)] = 0.0
+    data['volume'] = data['volume'].values.astype('double') * 100
+    return data
+
+
+# 随机生成的全市场行情 {(date, code, name): DataFrame}，包含新股（K线不足）和停牌（最后几天没有K线）的股票
+def synthetic_stocks(size, bars, seed=0):
+    rng = np.random.default_rng(seed)
+    stocks = {}
+    frames = []
+    for i in range(size):
+        data = synthetic_stock(bars, seed * 100000 + i)
+        if i % 5 == 0:
+            data = data.tail(int(rng.integers(1, bars + 1)))
+        if i % 17 == 3:
+            data = data.iloc[:-2]
+        frames.append(data.reset_index(drop=True))
+    last = max(f['date'].values[-1] for f in frames if len(f.index) > 0)
+    for i, data in enumerate(frames):
+        stocks[(last, f"{900000 + i:06d}", f"SYN{i}")] = data
+    return stocks
+
+
+# 读取 cache/hist 下最新一天缓存的真实K线
+def recorded_stocks(size, bars=None):
+    stocks = {}
+    try:
+        days = sorted(glob.glob(os.path.join(stock_hist_cache_path, '*', '*')))
+        if not days:
+            return stocks
+        for cache_file in sorted(glob.glob(os.path.join(days[-1], '*qfq.gzip.pickle')))[:size]:
+            data = pd.read_pickle(cache_file, compression="gzip")
+            if data is None or len(data.index) == 0:
+                continue
+            data.columns = tuple(tbs.CN_STOCK_HIST_DATA['columns'])
+            data = _hist_fields(data.reset_index(drop=True))
+            if bars is not None:
+                data = data.tail(bars).reset_index(drop=True)
+            code = os.path.basename(cache_file)[0:6]
+            stocks[(data['date'].values[-1], code, code)] = data
+        if stocks:
+            last = max(k[0] for k in stocks)
+            stocks = {(last, k[1], k[2]): v for k, v in stocks.items()}
+    except Exception as e:
+        logging.error(f"indicator_benchmark.recorded_stocks处理异常：{e}")
+    return stocks
+
+
+def load_stocks(size, bars):
+    stocks = recorded_stocks(size, bars)
+    if len(stocks) < size:
+        synthetic = synthetic_stocks(size - len(stocks), bars)
+        if stocks:
+            last = next(iter(stocks))[0]
+            synthetic = {(last, k[1], k[2]): v for k, v in synthetic.items()}
+        stocks.update(synthetic)
+    return stocks
+
+
+# 参照结果：逐只股票调用 calculate_indicator.get_indicator，返回 (N, 列数) 矩阵
+def reference_values(stocks, columns, calc_threshold=90):
+    stock_column = ['date', 'code'] + list(columns)
+    rows = [idr.get_indicator(k, stocks[k], stock_column, calc_threshold=calc_threshold).values[2:]
+            for k in stocks]
+    return np.array(rows, dtype=np.float64).reshape(len(rows), len(columns))
+
+
+def _stream_values(stocks, columns):
+    panel = build_panel(stocks)
+    state = sidr.indicator_stream(panel.codes()).run(panel)
+    values = np.empty((panel.size, len(columns)), dtype=np.float64)
+    for j, c in enumerate(columns):
+        val = state.values[c].astype(np.float64)
+        val[~np.isfinite(val)] = 0.0
+        val[state.bars <= 1] = 0.0
+        values[:, j] = val
+    return values
+
+
+# 比较两个结果矩阵，返回超出误差的列名
+def compare(ref, out, columns, rtol=PARITY_RTOL, atol=PARITY_ATOL):
+    bad = []
+    for j, c in enumerate(columns):
+        x = ref[:, j]
+        y = out[:, j]
+        scale = np.nanmax(np.abs(x)) if np.isfinite(x).any() else 0.0
+        if not np.allclose(x, y, rtol=rtol, atol=atol * max(scale, 1.0), equal_nan=True):
+            bad.append(c)
+    return bad
+
+
+# 保存冻结的基准：stocks 为输入行情，refs 为 {'ref_90': 矩阵, 'ref_full': 矩阵}（calc_threshold 为 90 和全部历史）。
+# 基准结果必须由改动前的算法生成，只在确认指标算法有意变化时重新生成。
+def write_baseline(stocks, refs, columns, path=BASELINE_FILE):
+    keys = list(stocks)
+    frames = [stocks[k] for k in keys]
+    fields = [c for c in frames[0].columns if c != 'date']
+    np.savez_compressed(path, keys=np.array(keys, dtype=str), fields=np.array(fields, dtype=str),
+                        columns=np.array(columns, dtype=str),
+                        offsets=np.cumsum([0] + [len(f.index) for f in frames]),
+                        dates=np.concatenate([f['date'].values for f in frames]).astype(str),
+                        values=np.concatenate([f[fields].values.astype(np.float64) for f in frames]),
+                        **refs)
+
+
+# 读取冻结的基准，返回 (stocks, columns, {'ref_90': 矩阵, 'ref_full': 矩阵})，没有基准文件返回 None
+def load_baseline(path=BASELINE_FILE):
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        offsets = data['offsets']
+        fields = list(data['fields'])
+        stocks = {}
+        for i, k in enumerate(data['keys']):
+            s, e = offsets[i], offsets[i + 1]
+            frame = pd.DataFrame(data['values'][s:e], columns=fields)
+            frame.insert(0, 'date', data['dates'][s:e].astype(object))
+            stocks[tuple(str(x) for x in k)] = frame
+        return stocks, list(data['columns']), {'ref_90': data['ref_90'], 'ref_full': data['ref_full']}
+
+
+# 和冻结的基准比较，返回 {计算方式: 超出误差的列名}
+def check_baseline(path=BASELINE_FILE):
+    baseline = load_baseline(path)
+    if baseline is None:
+        return {}
+    stocks, columns, refs = baseline
+    result = {'baseline_get_indicator': compare(refs['ref_90'], reference_values(stocks, columns, 90), columns),
+              'baseline_get_indicator_full': compare(refs['ref_full'], reference_values(stocks, columns, None),
+                                                     columns)}
+    batch = bidr.get_indicator_batch(stocks, columns, calc_threshold=90)
+    result['baseline_batch'] = compare(refs['ref_90'], batch[columns].values.astype(np.float64), columns)
+    result['baseline_stream'] = compare(refs['ref_full'], _stream_values(stocks, columns), columns)
+    return result
+
+
+# 一致性校验，返回 {计算方式: 超出误差的列名}
+def check_parity(stocks, columns=None, calc_threshold=90):
+    if columns is None:
+        columns = list(tbs.STOCK_STATS_DATA['columns'])
+    stocks = {k: v for k, v in stocks.items() if v is not None}
+    result = {}
+    ref = reference_values(stocks, columns, calc_threshold)
+    batch = bidr.get_indicator_batch(stocks, columns, calc_threshold=calc_threshold)
+    result['batch'] = compare(ref, batch[columns].values.astype(np.float64), columns)
+
+    compact = ireg.indicator_compact
+    try:
+        ireg.indicator_compact = True
+        out = bidr.get_indicator_batch(stocks, columns, calc_threshold=calc_threshold)
+        result['compact'] = compare(ref, out[columns].values.astype(np.float64), columns, rtol=COMPACT_RTOL)
+    finally:
+        ireg.indicator_compact = compact
+
+    # 增量递推用全部历史计算
+    ref_full = reference_values(stocks, columns, None)
+    result['stream'] = compare(ref_full, _stream_values(stocks, columns), columns)
+
+    if ikn.HAS_NUMBA:
+        try:
+            ikn.HAS_NUMBA = False
+            result['numpy_kernels'] = compare(ref, reference_values(stocks, columns, calc_threshold), columns)
+        finally:
+            ikn.HAS_NUMBA = True
+    return result
+
+
+def _timeit(func, repeat=BENCHMARK_REPEAT):
+    func()  # 预热（JIT 编译、缓存）
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# 性能基准，返回 [(项目, K线窗口, 秒)]
+def benchmark(stocks, windows=BENCHMARK_WINDOWS, repeat=BENCHMARK_REPEAT, sample=20):
+    columns = list(tbs.STOCK_STATS_DATA['columns'])
+    stock_column = ['date', 'code'] + columns
+    stocks = {k: v for k, v in stocks.items() if v is not None}
+    sample_keys = [k for k in stocks if len(stocks[k].index) > 1][:sample]
+    result = []
+    for window in windows:
+        result.append(('get_indicators/stock', window, _timeit(lambda: [
+            idr.get_indicators(stocks[k], threshold=None, calc_threshold=window) for k in sample_keys],
+            repeat) / max(len(sample_keys), 1)))
+        result.append(('get_indicator/stock', window, _timeit(lambda: [
+            idr.get_indicator(k, stocks[k], stock_column, calc_threshold=window) for k in sample_keys],
+            repeat) / max(len(sample_keys), 1)))
+        result.append(('get_indicator/universe', window, _timeit(lambda: [
+            idr.get_indicator(k, stocks[k], stock_column, calc_threshold=window) for k in stocks], 1)))
+        result.append(('batch/universe', window, _timeit(lambda: bidr.get_indicator_batch(
+            stocks, columns, calc_threshold=window), repeat)))
+        if pe.is_enabled():
+            result.append(('batch_process/universe', window, _timeit(lambda: pe.run_chunks(
+                bidr.get_indicator_batch, stocks, columns, calc_threshold=window), repeat)))
+    result.append(('stream/universe', None, _timeit(lambda: _stream_values(stocks, columns), 1)))
+    return result
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    bars = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    stocks = load_stocks(size, bars)
+    print(f"股票数：{len(stocks)}，K线数：{bars}，numba：{ikn.HAS_NUMBA}，进程数：{pe.process_workers}")
+
+    failed = False
+    parity = check_baseline()
+    parity.update(check_parity(stocks))
+    for name, bad in parity.items():
+        failed = failed or bool(bad)
+        print(f"一致性 {name:<16}{'通过' if not bad else '不一致：' + ','.join(bad)}")
+
+    for name, window, seconds in benchmark(stocks):
+        print(f"耗时 {name:<24}{'全部' if window is None else window:>6}{seconds * 1000:>12.2f} ms")
+    return 1 if failed else 0
+
+
+# main函数入口
+if __name__ == '__main__':
+    sys.exit(main())
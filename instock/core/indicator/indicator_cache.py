@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import os.path
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import instock.core.indicator.calculate_indicator as idr
+
+__author__ = 'myh '
+__date__ = '2024/11/28 '
+
+# 指标结果缓存。
+# 键为 (代码, 最后一根K线日期, 复权方式, 参数哈希)，参数哈希包含计算参数、指标列和参与计算的K线摘要，
+# 同一份行情同样的参数直接复用结果：K线图页面重复打开、每日指标作业重跑都不再重算。
+# 内存中按 LRU 淘汰，可选同时写入磁盘（按月、日分文件夹，方便删除）。
+
+# 内存缓存大小（MB），docker -e 传递。0 表示不使用内存缓存。
+indicator_cache_mb = 256
+_indicator_cache_mb = os.environ.get('indicator_cache_mb')
+if _indicator_cache_mb is not None:
+    indicator_cache_mb = int(_indicator_cache_mb)
+# 是否同时缓存到磁盘，docker -e 传递。
+indicator_cache_disk = False
+_indicator_cache_disk = os.environ.get('indicator_cache_disk')
+if _indicator_cache_disk is not None:
+    indicator_cache_disk = _indicator_cache_disk.lower() in ('1', 'true', 'yes')
+
+cpath_current = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+indicator_cache_path = os.path.join(cpath_current, 'cache', 'indicator')
+
+# 摘要用到的K线字段
+_DIGEST_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def _nbytes(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return 64
+
+
+# LRU 缓存，按占用内存淘汰，多线程安全
+class indicator_cache:
+    def __init__(self, max_bytes, disk_path=None):
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _file(self, key):
+        code, last_date, adjust, param_hash = key
+        day = last_date.replace('-', '')
+        return os.path.join(self.disk_path, day[0:6], day, f"{code}{adjust}_{param_hash}.pickle")
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                self._data.move_to_end(key)
+                return item[0]
+        if self.disk_path is None:
+            return None
+        cache_file = self._file(key)
+        try:
+            if os.path.isfile(cache_file):
+                with open(cache_file, 'rb') as f:
+                    value = pickle.load(f)
+                self._put_memory(key, value)
+                return value
+        except Exception as e:
+            logging.error(f"indicator_cache.get处理异常：{key}{e}")
+        return None
+
+    def put(self, key, value):
+        self._put_memory(key, value)
+        if self.disk_path is None:
+            return
+        cache_file = self._file(key)
+        try:
+            cache_dir = os.path.dirname(cache_file)
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir, exist_ok=True)
+            tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}"
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+        except Exception as e:
+            logging.error(f"indicator_cache.put处理异常：{key}{e}")
+
+    def _put_memory(self, key, value):
+        size = _nbytes(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, s) = self._data.popitem(last=False)
+                self._bytes -= s
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+
+_cache = indicator_cache(indicator_cache_mb * 1024 * 1024,
+                         indicator_cache_path if indicator_cache_disk else None)
+
+
+def is_enabled():
+    return indicator_cache_mb > 0 or indicator_cache_disk
+
+
+# 计算缓存键，end_date 之前没有K线时返回 None。
+# window 为参与计算的K线数（None 为全部），摘要包含窗口起止日期、根数和最后一根K线，
+# 行情更新（盘中刷新、复权变化）后键随之变化。
+def make_key(code, data, end_date=None, window=None, adjust='qfq', params=()):
+    dates = data['date'].values
+    end = len(dates) if end_date is None else int(np.searchsorted(dates, end_date, side='right'))
+    if end == 0:
+        return None
+    start = 0 if window is None else max(end - window, 0)
+    last = tuple(float(data[f].values[end - 1]) for f in _DIGEST_FIELDS if f in data)
+    digest = repr((params, str(dates[start]), end - start, last))
+    param_hash = hashlib.md5(digest.encode('utf-8')).hexdigest()[:16]
+    return code, str(dates[end - 1]), adjust, param_hash
+
+
+# 带缓存的 calculate_indicator.get_indicators，返回结果的副本，调用方可以直接修改。
+def get_indicators(code, data, end_date=None, threshold=120, calc_threshold=None, columns=None, adjust='qfq'):
+    key = None
+    if is_enabled():
+        try:
+            params = ('get_indicators', threshold, calc_threshold, None if columns is None else tuple(columns))
+            key = make_key(code, data, end_date=end_date, window=calc_threshold, adjust=adjust, params=params)
+            if key is not None:
+                value = _cache.get(key)
+                if value is not None:
+                    return value.copy()
+        except Exception as e:
+            logging.error(f"indicator_cache.get_indicators处理异常：{code}代码{e}")
+    value = idr.get_indicators(data, end_date=end_date, threshold=threshold, calc_threshold=calc_threshold,
+                               columns=columns)
+    if value is not None and key is not None:
+        _cache.put(key, value.copy())
+    return value
+
+
+# 带缓存的全市场指定日期指标计算，只把没有命中的股票交给 calc_func(stocks, stock_column, date) 计算，
+# 返回和 calculate_indicator_batch.get_indicator_batch 相同格式的 DataFrame。
+def get_indicator_batch(stocks, stock_column, date, calc_func, calc_threshold=90, adjust='qfq'):
+    # tablestructure 引用了各策略模块，策略模块又经 feature_cache 引用本模块，这里用到时再导入
+    import instock.core.tablestructure as tbs
+    end_date = next(iter(stocks))[0] if date is None else date.strftime("%Y-%m-%d")
+    params = ('get_indicator_batch', calc_threshold, tuple(stock_column))
+    keys = []
+    rows = {}
+    misses = {}
+    for k in stocks:
+        data = stocks[k]
+        if data is None:
+            continue
+        key = make_key(k[1], data, end_date=end_date, window=calc_threshold, adjust=adjust, params=params)
+        value = None if key is None else _cache.get(key)
+        if value is None:
+            misses[k] = data
+        else:
+            rows[k] = value
+        keys.append((k, key))
+
+    if misses:
+        calc_data = calc_func(misses, stock_column, date)
+        if calc_data is not None:
+            values = calc_data[stock_column].values.astype(np.float64)
+            miss_keys = dict(keys)
+            # 结果都是 end_date 当天的，按返回的代码对回股票；计算失败（某块结果为空）的股票不返回
+            by_code = {k[1]: k for k in misses}
+            for i, code in enumerate(calc_data['code'].values):
+                k = by_code.get(code)
+                if k is None:
+                    continue
+                rows[k] = values[i]
+                if miss_keys[k] is not None:
+                    _cache.put(miss_keys[k], values[i].copy())
+
+    keys = [k for k, _ in keys if k in rows]
+    if not keys:
+        return None
+    data = pd.DataFrame(keys, columns=list(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns']))
+    data['date'] = end_date
+    data = pd.concat([data, pd.DataFrame(np.vstack([rows[k] for k in keys]), columns=stock_column)], axis=1)
+    return data
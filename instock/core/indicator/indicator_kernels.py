@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+import numpy as np
+import talib as tl
+
+__author__ = 'myh '
+__date__ = '2024/11/28 '
+
+# 手工组合的指标（CR、VR、DMI、RVI、Supertrend、WT、STOCHRSI、VHF）的融合计算内核。
+# 安装了 numba 时用 JIT 编译的单次循环，不产生中间数组；窗口和、EMA 的累加顺序与 TA-Lib 相同，
+# 开头的 NaN 同样跳过。没有 numba 时退回 TA-Lib + NumPy 的向量化实现，两者结果一致。
+try:
+    import numba
+
+    HAS_NUMBA = True
+except ImportError:
+    numba = None
+    HAS_NUMBA = False
+
+
+def _jit(func):
+    if not HAS_NUMBA:
+        return func
+    return numba.njit(cache=True, nogil=True, error_model='numpy')(func)
+
+
+def _fill0(x, inf=False):
+    x[np.isnan(x)] = 0.0
+    if inf:
+        x[np.isinf(x)] = 0.0
+    return x
+
+
+# ---------- JIT 内核 ----------
+@_jit
+def _cr_loop(high, low, amount, volume, period, out):
+    n = len(high)
+    hm_total = 0.0
+    ml_total = 0.0
+    hm_begin = -1
+    ml_begin = -1
+    for i in range(n):
+        mp = 0.0 if i == 0 else amount[i - 1] / volume[i - 1]
+        hm = math.nan if math.isnan(mp) or math.isnan(high[i]) else high[i] - min(mp, high[i])
+        ml = math.nan if math.isnan(mp) or math.isnan(low[i]) else mp - min(mp, low[i])
+        if hm_begin < 0 and not math.isnan(hm):
+            hm_begin = i
+        if ml_begin < 0 and not math.isnan(ml):
+            ml_begin = i
+        hm_sum = math.nan
+        ml_sum = math.nan
+        if hm_begin >= 0:
+            hm_total += hm
+            if i >= hm_begin + period - 1:
+                hm_sum = hm_total
+                j = i - period + 1
+                mp = 0.0 if j == 0 else amount[j - 1] / volume[j - 1]
+                hm_total -= math.nan if math.isnan(mp) or math.isnan(high[j]) else high[j] - min(mp, high[j])
+        if ml_begin >= 0:
+            ml_total += ml
+            if i >= ml_begin + period - 1:
+                ml_sum = ml_total
+                j = i - period + 1
+                mp = 0.0 if j == 0 else amount[j - 1] / volume[j - 1]
+                ml_total -= math.nan if math.isnan(mp) or math.isnan(low[j]) else mp - min(mp, low[j])
+        cr = hm_sum / ml_sum
+        out[i] = 0.0 if math.isnan(cr) or math.isinf(cr) else cr * 100
+
+
+@_jit
+def _vr_x(p_change, volume, i, k):
+    # k: 0 上涨日成交量, 1 下跌日成交量, 2 平盘日成交量
+    if k == 0:
+        return volume[i] if p_change[i] > 0 else 0.0
+    if k == 1:
+        return volume[i] if p_change[i] < 0 else 0.0
+    return volume[i] if p_change[i] == 0 else 0.0
+
+
+@_jit
+def _vr_loop(p_change, volume, period, out):
+    n = len(p_change)
+    totals = np.zeros(3)
+    begins = np.full(3, -1)
+    sums = np.empty(3)
+    for i in range(n):
+        for k in range(3):
+            x = _vr_x(p_change, volume, i, k)
+            if begins[k] < 0 and not math.isnan(x):
+                begins[k] = i
+            sums[k] = math.nan
+            if begins[k] >= 0:
+                totals[k] += x
+                if i >= begins[k] + period - 1:
+                    sums[k] = totals[k]
+                    totals[k] -= _vr_x(p_change, volume, i - period + 1, k)
+        vr = (sums[0] + sums[2] / 2) / (sums[1] + sums[2] / 2)
+        out[i] = 0.0 if math.isnan(vr) or math.isinf(vr) else vr * 100
+
+
+@_jit
+def _dmi_loop(high, low, atr, period, adx_period, pdi, mdi, dx, adx, adxr):
+    n = len(high)
+    k = 2.0 / (period + 1)
+    k_adx = 2.0 / (adx_period + 1)
+    pdm = 0.0
+    mdm = 0.0
+    e_adx = 0.0
+    e_adxr = 0.0
+    for i in range(n):
+        high_delta = 0.0 if i == 0 else high[i] - high[i - 1]
+        high_m = (high_delta + abs(high_delta)) / 2
+        low_delta = 0.0 if i == 0 else -(low[i] - low[i - 1])
+        low_m = (low_delta + abs(low_delta)) / 2
+        p = high_m if high_m > low_m else 0.0
+        m = low_m if low_m > high_m else 0.0
+        # EMA：前 period 个值的均值作为种子
+        if i < period - 1:
+            pdm += p
+            mdm += m
+            pdm_v = 0.0
+            mdm_v = 0.0
+        elif i == period - 1:
+            pdm = (pdm + p) / period
+            mdm = (mdm + m) / period
+            pdm_v = pdm
+            mdm_v = mdm
+        else:
+            pdm = ((p - pdm) * k) + pdm
+            mdm = ((m - mdm) * k) + mdm
+            pdm_v = pdm
+            mdm_v = mdm
+        v = pdm_v / atr[i]
+        pdi[i] = 0.0 if math.isnan(v) or math.isinf(v) else v * 100
+        v = mdm_v / atr[i]
+        mdi[i] = 0.0 if math.isnan(v) or math.isinf(v) else v * 100
+        v = abs(pdi[i] - mdi[i]) / (pdi[i] + mdi[i])
+        dx[i] = 0.0 if math.isnan(v) or math.isinf(v) else v * 100
+        if i < adx_period - 1:
+            e_adx += dx[i]
+            adx[i] = 0.0
+        elif i == adx_period - 1:
+            e_adx = (e_adx + dx[i]) / adx_period
+            adx[i] = e_adx
+        else:
+            e_adx = ((dx[i] - e_adx) * k_adx) + e_adx
+            adx[i] = e_adx
+        if i < adx_period - 1:
+            e_adxr += adx[i]
+            adxr[i] = 0.0
+        elif i == adx_period - 1:
+            e_adxr = (e_adxr + adx[i]) / adx_period
+            adxr[i] = e_adxr
+        else:
+            e_adxr = ((adx[i] - e_adxr) * k_adx) + e_adxr
+            adxr[i] = e_adxr
+
+
+@_jit
+def _rvi_x(op, close, i):
+    v = close[i] - op[i]
+    for s, w in ((1, 2.0), (2, 2.0), (3, 1.0)):
+        v += w * ((close[i - s] - op[i - s]) if i >= s else 0.0)
+    return v / 6
+
+
+@_jit
+def _rvi_loop(op, high, low, close, period, rvi, rvis):
+    n = len(close)
+    x_total = 0.0
+    y_total = 0.0
+    x_begin = -1
+    y_begin = -1
+    for i in range(n):
+        x = _rvi_x(op, close, i)
+        y = _rvi_x(low, high, i)
+        if x_begin < 0 and not math.isnan(x):
+            x_begin = i
+        if y_begin < 0 and not math.isnan(y):
+            y_begin = i
+        x_ma = math.nan
+        y_ma = math.nan
+        if x_begin >= 0:
+            x_total += x
+            if i >= x_begin + period - 1:
+                x_ma = x_total / period
+                x_total -= _rvi_x(op, close, i - period + 1)
+        if y_begin >= 0:
+            y_total += y
+            if i >= y_begin + period - 1:
+                y_ma = y_total / period
+                y_total -= _rvi_x(low, high, i - period + 1)
+        v = x_ma / y_ma
+        rvi[i] = 0.0 if math.isnan(v) or math.isinf(v) else v
+        v = rvi[i]
+        for s, w in ((1, 2.0), (2, 2.0), (3, 1.0)):
+            v += w * (rvi[i - s] if i >= s else 0.0)
+        rvis[i] = v / 6
+
+
+@_jit
+def _supertrend_loop(close, high, low, atr, multiplier, ub, lb, st):
+    n = len(close)
+    for i in range(n):
+        hl_avg = (high[i] + low[i]) / 2.0
+        m_atr = atr[i] * multiplier
+        curr_b_ub = hl_avg + m_atr
+        curr_b_lb = hl_avg - m_atr
+        if i == 0:
+            ub[i] = curr_b_ub
+            lb[i] = curr_b_lb
+            st[i] = ub[i] if close[i] <= ub[i] else lb[i]
+            continue
+        last_close = close[i - 1]
+        last_ub = ub[i - 1]
+        last_lb = lb[i - 1]
+        last_st = st[i - 1]
+        ub[i] = curr_b_ub if curr_b_ub < last_ub or last_close > last_ub else last_ub
+        lb[i] = curr_b_lb if curr_b_lb > last_lb or last_close < last_lb else last_lb
+        if last_st == last_ub:
+            st[i] = ub[i] if close[i] <= ub[i] else lb[i]
+        elif last_st == last_lb:
+            st[i] = lb[i] if close[i] > lb[i] else ub[i]
+        else:
+            st[i] = math.nan
+
+
+@_jit
+def _wt_loop(amount, volume, channel_period, average_period, ma_period, wt1, wt2):
+    n = len(amount)
+    k_esa = 2.0 / (channel_period + 1)
+    k_wt = 2.0 / (average_period + 1)
+    esa = 0.0
+    esa_d = 0.0
+    e_wt1 = 0.0
+    wt2_total = 0.0
+    esa_begin = -1
+    d_begin = -1
+    for i in range(n):
+        m_price = amount[i] / volume[i]
+        # esa = EMA(m_price)，开头的 NaN 跳过
+        if esa_begin < 0 and not math.isnan(m_price):
+            esa_begin = i
+        esa_v = 0.0
+        if esa_begin >= 0:
+            j = i - esa_begin
+            if j < channel_period - 1:
+                esa += m_price
+            elif j == channel_period - 1:
+                esa = (esa + m_price) / channel_period
+                esa_v = esa
+            else:
+                esa = ((m_price - esa) * k_esa) + esa
+                esa_v = esa
+            if math.isnan(esa_v):
+                esa_v = 0.0
+        # esa_d = EMA(|m_price - esa|)
+        d = abs(m_price - esa_v)
+        if d_begin < 0 and not math.isnan(d):
+            d_begin = i
+        esa_d_v = math.nan
+        if d_begin >= 0:
+            j = i - d_begin
+            if j < channel_period - 1:
+                esa_d += d
+            elif j == channel_period - 1:
+                esa_d = (esa_d + d) / channel_period
+                esa_d_v = esa_d
+            else:
+                esa_d = ((d - esa_d) * k_esa) + esa_d
+                esa_d_v = esa_d
+        esa_ci = (m_price - esa_v) / (0.015 * esa_d_v)
+        if math.isnan(esa_ci) or math.isinf(esa_ci):
+            esa_ci = 0.0
+        # wt1 = EMA(esa_ci)
+        if i < average_period - 1:
+            e_wt1 += esa_ci
+            wt1[i] = 0.0
+        elif i == average_period - 1:
+            e_wt1 = (e_wt1 + esa_ci) / average_period
+            wt1[i] = e_wt1
+        else:
+            e_wt1 = ((esa_ci - e_wt1) * k_wt) + e_wt1
+            wt1[i] = e_wt1
+        if math.isnan(wt1[i]):
+            wt1[i] = 0.0
+        # wt2 = MA(wt1)
+        wt2_total += wt1[i]
+        if i >= ma_period - 1:
+            wt2[i] = wt2_total / ma_period
+            wt2_total -= wt1[i - ma_period + 1]
+            if math.isnan(wt2[i]):
+                wt2[i] = 0.0
+        else:
+            wt2[i] = 0.0
+
+
+@_jit
+def _stochrsi_loop(rsi, period, d_period, k_out, d_out):
+    n = len(rsi)
+    d_total = 0.0
+    for i in range(n):
+        v = math.nan
+        if i >= period - 1:
+            lowest = rsi[i - period + 1]
+            highest = rsi[i - period + 1]
+            for j in range(i - period + 2, i + 1):
+                if rsi[j] < lowest:
+                    lowest = rsi[j]
+                if rsi[j] > highest:
+                    highest = rsi[j]
+            v = (rsi[i] - lowest) / (highest - lowest)
+        k_out[i] = 0.0 if math.isnan(v) or math.isinf(v) else v * 100
+        d_total += k_out[i]
+        if i >= d_period - 1:
+            d_out[i] = d_total / d_period
+            d_total -= k_out[i - d_period + 1]
+        else:
+            d_out[i] = math.nan
+
+
+@_jit
+def _vhf_loop(close, period, out):
+    n = len(close)
+    total = 0.0
+    begin = -1
+    for i in range(n):
+        x = abs(close[i] - (close[i - 1] if i > 0 else 0.0))
+        if begin < 0 and not math.isnan(x):
+            begin = i
+        hcp_lcp = 0.0
+        if i >= period - 1:
+            lowest = close[i - period + 1]
+            highest = close[i - period + 1]
+            for j in range(i - period + 2, i + 1):
+                if close[j] < lowest:
+                    lowest = close[j]
+                if close[j] > highest:
+                    highest = close[j]
+            hcp_lcp = highest - lowest
+            if math.isnan(hcp_lcp):
+                hcp_lcp = 0.0
+        s = math.nan
+        if begin >= 0:
+            total += x
+            if i >= begin + period - 1:
+                s = total
+                j = i - period + 1
+                total -= abs(close[j] - (close[j - 1] if j > 0 else 0.0))
+        v = hcp_lcp / s
+        out[i] = 0.0 if math.isnan(v) else v
+
+
+# ---------- NumPy 实现（没有 numba 时使用） ----------
+def _prev(x, n=1):
+    out = np.zeros_like(x)
+    if n < len(x):
+        out[n:] = x[:-n]
+    return out
+
+
+def _cr_numpy(high, low, amount, volume, period):
+    m_price_sf1 = _prev(amount / volume)
+    h_m = high - np.minimum(m_price_sf1, high)
+    m_l = m_price_sf1 - np.minimum(m_price_sf1, low)
+    return _fill0(tl.SUM(h_m, timeperiod=period) / tl.SUM(m_l, timeperiod=period), inf=True) * 100
+
+
+def _vr_numpy(p_change, volume, period):
+    avs = tl.SUM(np.where(p_change > 0, volume, 0.0), timeperiod=period)
+    bvs = tl.SUM(np.where(p_change < 0, volume, 0.0), timeperiod=period)
+    cvs = tl.SUM(np.where(p_change == 0, volume, 0.0), timeperiod=period)
+    return _fill0((avs + cvs / 2) / (bvs + cvs / 2), inf=True) * 100
+
+
+def _dmi_numpy(high, low, atr, period, adx_period):
+    high_delta = np.insert(np.diff(high), 0, 0.0)
+    high_m = (high_delta + abs(high_delta)) / 2
+    low_delta = np.insert(-np.diff(low), 0, 0.0)
+    low_m = (low_delta + abs(low_delta)) / 2
+    pdm = _fill0(tl.EMA(np.where(high_m > low_m, high_m, 0.0), timeperiod=period))
+    pdi = _fill0(pdm / atr, inf=True) * 100
+    mdm = _fill0(tl.EMA(np.where(low_m > high_m, low_m, 0.0), timeperiod=period))
+    mdi = _fill0(mdm / atr, inf=True) * 100
+    dx = _fill0(abs(pdi - mdi) / (pdi + mdi), inf=True) * 100
+    adx = _fill0(tl.EMA(dx, timeperiod=adx_period))
+    adxr = _fill0(tl.EMA(adx, timeperiod=adx_period))
+    return pdi, mdi, dx, adx, adxr
+
+
+def _rvi_numpy(op, high, low, close, period):
+    rvi_x = ((close - op) + 2 * (_prev(close) - _prev(op)) + 2 * (_prev(close, 2) - _prev(op, 2)) +
+             (_prev(close, 3) - _prev(op, 3))) / 6
+    rvi_y = ((high - low) + 2 * (_prev(high) - _prev(low)) + 2 * (_prev(high, 2) - _prev(low, 2)) +
+             (_prev(high, 3) - _prev(low, 3))) / 6
+    rvi = _fill0(tl.MA(rvi_x, timeperiod=period) / tl.MA(rvi_y, timeperiod=period), inf=True)
+    rvis = (rvi + 2 * _prev(rvi) + 2 * _prev(rvi, 2) + _prev(rvi, 3)) / 6
+    return rvi, rvis
+
+
+def _supertrend_numpy(close, high, low, atr, multiplier):
+    size = len(close)
+    ub = np.empty(size, dtype=np.float64)
+    lb = np.empty(size, dtype=np.float64)
+    st = np.empty(size, dtype=np.float64)
+    _supertrend_loop(close, high, low, atr, multiplier, ub, lb, st)
+    return ub, lb, st
+
+
+def _wt_numpy(amount, volume, channel_period, average_period, ma_period):
+    m_price = amount / volume
+    esa = _fill0(tl.EMA(m_price, timeperiod=channel_period))
+    esa_d = tl.EMA(abs(m_price - esa), timeperiod=channel_period)
+    esa_ci = _fill0((m_price - esa) / (0.015 * esa_d), inf=True)
+    wt1 = _fill0(tl.EMA(esa_ci, timeperiod=average_period))
+    wt2 = _fill0(tl.MA(wt1, timeperiod=ma_period))
+    return wt1, wt2
+
+
+def _stochrsi_numpy(rsi, period, d_period):
+    rsi_min = tl.MIN(rsi, timeperiod=period)
+    rsi_max = tl.MAX(rsi, timeperiod=period)
+    k = _fill0((rsi - rsi_min) / (rsi_max - rsi_min), inf=True) * 100
+    return k, tl.MA(k, timeperiod=d_period)
+
+
+def _vhf_numpy(close, period):
+    hcp_lcp = _fill0(tl.MAX(close, timeperiod=period) - tl.MIN(close, timeperiod=period))
+    return _fill0(np.divide(hcp_lcp, tl.SUM(abs(close - _prev(close)), timeperiod=period)))
+
+
+# ---------- 对外接口，参数均为 float64 的一维 ndarray ----------
+def cr(high, low, amount, volume, period=26):
+    if not HAS_NUMBA:
+        return _cr_numpy(high, low, amount, volume, period)
+    out = np.empty(len(high), dtype=np.float64)
+    _cr_loop(high, low, amount, volume, period, out)
+    return out
+
+
+def vr(p_change, volume, period=26):
+    if not HAS_NUMBA:
+        return _vr_numpy(p_change, volume, period)
+    out = np.empty(len(volume), dtype=np.float64)
+    _vr_loop(p_change, volume, period, out)
+    return out
+
+
+# 返回 pdi, mdi, dx, adx, adxr
+def dmi(high, low, atr, period=14, adx_period=6):
+    if not HAS_NUMBA:
+        return _dmi_numpy(high, low, atr, period, adx_period)
+    out = np.empty((5, len(high)), dtype=np.float64)
+    _dmi_loop(high, low, atr, period, adx_period, out[0], out[1], out[2], out[3], out[4])
+    return tuple(out)
+
+
+# 返回 rvi, rvis
+def rvi(op, high, low, close, period=10):
+    if not HAS_NUMBA:
+        return _rvi_numpy(op, high, low, close, period)
+    out = np.empty((2, len(close)), dtype=np.float64)
+    _rvi_loop(op, high, low, close, period, out[0], out[1])
+    return tuple(out)
+
+
+# 返回 supertrend_ub, supertrend_lb, supertrend
+def supertrend(close, high, low, atr, multiplier=3):
+    if not HAS_NUMBA:
+        return _supertrend_numpy(close, high, low, atr, multiplier)
+    out = np.empty((3, len(close)), dtype=np.float64)
+    _supertrend_loop(close, high, low, atr, multiplier, out[0], out[1], out[2])
+    return tuple(out)
+
+
+# 返回 wt1, wt2
+def wt(amount, volume, channel_period=10, average_period=21, ma_period=4):
+    if not HAS_NUMBA:
+        return _wt_numpy(amount, volume, channel_period, average_period, ma_period)
+    out = np.empty((2, len(amount)), dtype=np.float64)
+    _wt_loop(amount, volume, channel_period, average_period, ma_period, out[0], out[1])
+    return tuple(out)
+
+
+# 返回 stochrsi_k, stochrsi_d
+def stochrsi(rsi, period=14, d_period=3):
+    if not HAS_NUMBA:
+        return _stochrsi_numpy(rsi, period, d_period)
+    out = np.empty((2, len(rsi)), dtype=np.float64)
+    _stochrsi_loop(rsi, period, d_period, out[0], out[1])
+    return tuple(out)
+
+
+def vhf(close, period=28):
+    if not HAS_NUMBA:
+        return _vhf_numpy(close, period)
+    out = np.empty(len(close), dtype=np.float64)
+    _vhf_loop(close, period, out)
+    return out
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+
+__author__ = 'myh '
+__date__ = '2024/11/24 '
+
+# 紧凑模式，docker -e 传递。指标结果用 float32 保存，中间列在不再被依赖后立即丢弃，降低全市场计算的内存峰值。
+# 计算过程仍用 float64，结果和默认模式在 float32 精度内一致。
+indicator_compact = False
+_indicator_compact = os.environ.get('indicator_compact')
+if _indicator_compact is not None:
+    indicator_compact = _indicator_compact.lower() in ('1', 'true', 'yes')
+
+# 行情原始字段，可以直接作为依赖
+INPUT_FIELDS = ('open', 'high', 'low', 'close', 'volume', 'amount', 'p_change')
+
+# 指标注册表，按计算顺序排列。
+# 指标组名: {'columns': 产出的列（含中间列）, 'depends': 依赖的指标组或行情字段}
+INDICATOR_REGISTRY = {
+    'macd': {'columns': ('macd', 'macds', 'macdh'), 'depends': ('close',)},
+    'kdj': {'columns': ('kdjk', 'kdjd', 'kdjj'), 'depends': ('high', 'low', 'close')},
+    'boll': {'columns': ('boll_ub', 'boll', 'boll_lb'), 'depends': ('close',)},
+    'trix': {'columns': ('trix', 'trix_20_sma'), 'depends': ('close',)},
+    'm_price': {'columns': ('m_price',), 'depends': ('amount', 'volume')},
+    'cr': {'columns': ('cr', 'cr-ma1', 'cr-ma2', 'cr-ma3'), 'depends': ('m_price', 'high', 'low')},
+    'rsi': {'columns': ('rsi', 'rsi_6', 'rsi_12', 'rsi_24'), 'depends': ('close',)},
+    'vr': {'columns': ('vr', 'vr_6_sma'), 'depends': ('p_change', 'volume')},
+    'prev': {'columns': ('prev_close', 'prev_high', 'prev_low', 'h_l', 'h_cy', 'cy_l'),
+             'depends': ('high', 'low', 'close')},
+    'atr': {'columns': ('tr', 'atr'), 'depends': ('prev',)},
+    'dmi': {'columns': ('pdi', 'mdi', 'dx', 'adx', 'adxr'), 'depends': ('atr', 'high', 'low')},
+    'wr': {'columns': ('wr_6', 'wr_10', 'wr_14'), 'depends': ('high', 'low', 'close')},
+    'cci': {'columns': ('cci', 'cci_84'), 'depends': ('high', 'low', 'close')},
+    'ma10': {'columns': ('ma10',), 'depends': ('close',)},
+    'dma': {'columns': ('ma50', 'dma', 'dma_10_sma'), 'depends': ('ma10',)},
+    'tema': {'columns': ('tema',), 'depends': ('close',)},
+    'mfi': {'columns': ('mfi', 'mfisma'), 'depends': ('high', 'low', 'close', 'volume')},
+    'vwma': {'columns': ('vwma', 'mvwma'), 'depends': ('amount', 'volume')},
+    'ppo': {'columns': ('ppo', 'ppos', 'ppoh'), 'depends': ('close',)},
+    'stochrsi': {'columns': ('stochrsi_k', 'stochrsi_d'), 'depends': ('rsi',)},
+    'wt': {'columns': ('wt1', 'wt2'), 'depends': ('m_price',)},
+    'hl_avg': {'columns': ('hl_avg',), 'depends': ('high', 'low')},
+    'supertrend': {'columns': ('supertrend_ub', 'supertrend_lb', 'supertrend'), 'depends': ('atr', 'hl_avg', 'close')},
+    'roc': {'columns': ('roc', 'rocma', 'rocema'), 'depends': ('close',)},
+    'obv': {'columns': ('obv',), 'depends': ('close', 'volume')},
+    'sar': {'columns': ('sar',), 'depends': ('high', 'low')},
+    'psy': {'columns': ('psy', 'psyma'), 'depends': ('prev', 'close')},
+    'brar': {'columns': ('ar', 'br'), 'depends': ('prev', 'open', 'high', 'low')},
+    'emv': {'columns': ('emv', 'emva'), 'depends': ('prev', 'hl_avg', 'amount')},
+    'bias': {'columns': ('bias', 'bias_12', 'bias_24'), 'depends': ('close',)},
+    'dpo': {'columns': ('dpo', 'madpo'), 'depends': ('close',)},
+    'vhf': {'columns': ('vhf',), 'depends': ('prev', 'close')},
+    'rvi': {'columns': ('rvi', 'rvis'), 'depends': ('prev', 'open', 'high', 'low', 'close')},
+    'fi': {'columns': ('fi', 'force_2', 'force_13'), 'depends': ('close', 'volume')},
+    'ene': {'columns': ('ene_ue', 'ene_le', 'ene'), 'depends': ('ma10',)},
+    'vol': {'columns': ('vol_5', 'vol_10'), 'depends': ('volume',)},
+    'ma': {'columns': ('ma20', 'ma200'), 'depends': ('close',)},
+}
+
+# 列名 -> 指标组名
+COLUMN_GROUP = {c: name for name, conf in INDICATOR_REGISTRY.items() for c in conf['columns']}
+
+
+# 解析需要计算的指标组，返回按计算顺序排列的组名列表。columns 为 None 时返回全部。
+def resolve_groups(columns=None):
+    if columns is None:
+        return list(INDICATOR_REGISTRY)
+    needed = set()
+    stack = []
+    # 非指标列（date、code、行情字段等）直接忽略
+    for c in columns:
+        if c in COLUMN_GROUP:
+            stack.append(COLUMN_GROUP[c])
+        elif c in INDICATOR_REGISTRY:
+            stack.append(c)
+    while stack:
+        name = stack.pop()
+        if name in needed:
+            continue
+        needed.add(name)
+        stack.extend(d for d in INDICATOR_REGISTRY[name]['depends'] if d in INDICATOR_REGISTRY)
+    # 注册表本身按依赖顺序排列
+    return [name for name in INDICATOR_REGISTRY if name in needed]
+
+
+# 计算指定指标列需要的行情字段（含直接请求的行情字段），columns 为 None 时返回全部。
+def resolve_fields(columns=None):
+    if columns is None:
+        return INPUT_FIELDS
+    fields = set(c for c in columns if c in INPUT_FIELDS)
+    for name in resolve_groups(columns):
+        fields.update(d for d in INDICATOR_REGISTRY[name]['depends'] if d in INPUT_FIELDS)
+    return tuple(f for f in INPUT_FIELDS if f in fields)
+
+
+# 紧凑模式下每个指标组算完后可以释放的指标组，返回 {组名: [此后不再被依赖的指标组]}。
+# groups 为 resolve_groups 的结果。
+def resolve_release(groups):
+    last_use = {name: i for i, name in enumerate(groups)}
+    for i, name in enumerate(groups):
+        for d in INDICATOR_REGISTRY[name]['depends']:
+            if d in last_use:
+                last_use[d] = max(last_use[d], i)
+    release = {name: [] for name in groups}
+    for name, i in last_use.items():
+        release[groups[i]].append(name)
+    return release
@@ -13,7 +13,7 @@ from bokeh.models import ColumnDataSource, HoverTool, CheckboxGroup, LabelSet, B
     CDSView, BooleanFilter, TabPanel, Tabs, Div, Styles, CrosshairTool, Span, BoxSelectTool, WheelZoomTool, PanTool, \
     BoxZoomTool, ZoomInTool, ZoomOutTool, RedoTool, ResetTool, SaveTool, UndoTool
 import instock.core.tablestructure as tbs
-import instock.core.indicator.calculate_indicator as idr
+import instock.core.indicator.indicator_cache as icache
 import instock.core.pattern.pattern_recognitions as kpr
 import instock.core.kline.indicator_web_dic as iwd
 import time
@@ -21,6 +21,10 @@ import time
 __author__ = 'myh '
 __date__ = '2023/4/6 '
 
+# K线图用到的指标列，只计算这些指标
+KLINE_INDICATOR_COLUMNS = ("ma10", "ma20", "ma50", "ma200", "vol_5", "vol_10") + \
+                          tuple(name for conf in iwd.indicators_dic for name in conf["dic"])
+
 
 def get_plot_kline(code, stock, date, stock_name):
     start_time = time.time()
@@ -29,8 +33,8 @@ def get_plot_kline(code, stock, date, stock_name):
     threshold = 360
     try:
         t1 = time.time()
-        data = idr.get_indicators(stock, date, threshold=threshold)
-        logging.info(f"Step 1: idr.get_indicators took {time.time() - t1:.2f} seconds")
+        data = icache.get_indicators(code, stock, date, threshold=threshold, columns=KLINE_INDICATOR_COLUMNS)
+        logging.info(f"Step 1: icache.get_indicators took {time.time() - t1:.2f} seconds")
         if data is None:
             return None
 
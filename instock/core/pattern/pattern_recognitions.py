@@ -2,6 +2,11 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import numpy as np
+import pandas as pd
+from talib import abstract
+import instock.core.tablestructure as tbs
+from instock.core.stockpanel import build_panel, slice_end
 
 __author__ = 'myh '
 __date__ = '2023/3/24 '
@@ -10,8 +15,7 @@ __date__ = '2023/3/24 '
 def get_pattern_recognitions(data, stock_column, end_date=None, threshold=120, calc_threshold=None):
     isCopy = False
     if end_date is not None:
-        mask = (data['date'] <= end_date)
-        data = data.loc[mask]
+        data = slice_end(data, end_date)
         isCopy = True
     if calc_threshold is not None:
         data = data.tail(n=calc_threshold)
@@ -68,3 +72,122 @@ def get_pattern_recognition(code_name, data, stock_column, date=None, calc_thres
         logging.error(f"pattern_recognitions.get_pattern_recognition处理异常：{code}代码{e}")
 
     return None
+
+
+# ----------全市场批量形态识别-----------------
+# 行情按 股票 × 交易日 面板排成连续的 OHLC 数组，每个 CDL 函数直接在每只股票的连续切片上运行，
+# 结果写进预先分配的 int16 矩阵（TA-Lib 形态值有 ±80、±100、±200，int8 放不下），不再为每只股票构造 DataFrame。
+# 结果与逐只股票调用 get_pattern_recognition 一致。
+
+PATTERN_FIELDS = ('open', 'high', 'low', 'close')
+PATTERN_EVENT_MARGIN = 10  # 形态历史在最大 lookback 之外多取的K线数
+
+
+# 每个 CDL 函数需要的K线数减一，K线不够时 TA-Lib 只会返回 0，可以直接跳过
+def _lookbacks(stock_column):
+    lookbacks = []
+    for k in stock_column:
+        try:
+            lookbacks.append(abstract.Function(stock_column[k]['func'].__name__).lookback)
+        except Exception:
+            lookbacks.append(0)
+    return np.array(lookbacks, dtype=np.int64)
+
+
+# 返回 (股票键列表, 形态矩阵 ndarray(N, 形态数) int16)，矩阵的值为 TA-Lib 形态值。
+# 只统计每只股票 date 及之前最后一根K线，K线不超过一根的股票不计算。
+def get_pattern_matrix(stocks, stock_column=None, date=None, calc_threshold=12):
+    if stock_column is None:
+        stock_column = tbs.STOCK_KLINE_PATTERN_DATA['columns']
+    end_date = next(iter(stocks))[0] if date is None else date.strftime("%Y-%m-%d")
+    stocks = {k: v for k, v in stocks.items() if v is not None and len(v.index) > 1}
+    panel = build_panel(stocks, end_date=end_date, threshold=calc_threshold, fields=PATTERN_FIELDS)
+    funcs = [stock_column[k]['func'] for k in stock_column]
+    lookbacks = _lookbacks(stock_column)
+    signals = np.zeros((panel.size, len(funcs)), dtype=np.int16)
+    op, high, low, close = (panel[f] for f in PATTERN_FIELDS)
+    for i in range(panel.size):
+        b = panel.begin[i]
+        bars = panel.length - b
+        if bars <= 0:
+            continue
+        args = (op[i, b:], high[i, b:], low[i, b:], close[i, b:])
+        for j in np.nonzero(lookbacks < bars)[0]:
+            try:
+                signals[i, j] = funcs[j](*args)[-1]
+            except Exception:
+                pass
+    return panel.keys, signals
+
+
+# 返回有形态的 (股票键, 形态名, 形态值) 列表。
+def get_pattern_signals(stocks, stock_column=None, date=None, calc_threshold=12):
+    if stock_column is None:
+        stock_column = tbs.STOCK_KLINE_PATTERN_DATA['columns']
+    keys, signals = get_pattern_matrix(stocks, stock_column, date=date, calc_threshold=calc_threshold)
+    names = list(stock_column)
+    rows, cols = np.nonzero(signals)
+    return [(keys[i], names[j], int(signals[i, j])) for i, j in zip(rows, cols)]
+
+
+# 全市场批量识别，返回有形态股票的 DataFrame（date, code, name + 形态列），没有时返回 None。
+def get_pattern_batch(stocks, stock_column=None, date=None, calc_threshold=12):
+    try:
+        if stock_column is None:
+            stock_column = tbs.STOCK_KLINE_PATTERN_DATA['columns']
+        keys, signals = get_pattern_matrix(stocks, stock_column, date=date, calc_threshold=calc_threshold)
+        rows = np.nonzero(signals.any(axis=1))[0]
+        if len(rows) == 0:
+            return None
+        data = pd.DataFrame([keys[i] for i in rows], columns=list(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns']))
+        values = pd.DataFrame(signals[rows].astype(np.int32), columns=list(stock_column))
+        return pd.concat([data, values], axis=1)
+    except Exception as e:
+        logging.error(f"pattern_recognitions.get_pattern_batch处理异常：{e}")
+    return None
+
+
+# 形态历史：每只股票一次算出每个交易日的形态，返回稀疏的事件 DataFrame（date, code, pattern, value），
+# 只保留 start_date ~ end_date 之间的交易日，没有事件时为空表，出错返回 None。
+# 形态只看最近 lookback 根K线，只取 start_date 之前 最大lookback + PATTERN_EVENT_MARGIN 根K线计算，
+# 每天追加一天时计算量也只有一天左右；start_date 为 None 时用全部历史。
+def get_pattern_events(stocks, stock_column=None, start_date=None, end_date=None):
+    try:
+        if stock_column is None:
+            stock_column = tbs.STOCK_KLINE_PATTERN_DATA['columns']
+        names = np.array(list(stock_column), dtype=object)
+        funcs = [stock_column[k]['func'] for k in stock_column]
+        lookbacks = _lookbacks(stock_column)
+        max_lookback = int(lookbacks.max()) if len(lookbacks) > 0 else 0
+        dates_list, codes_list, patterns_list, values_list = [], [], [], []
+        for k, data in stocks.items():
+            if data is None or len(data.index) <= 1:
+                continue
+            dates = data['date'].values
+            end = len(dates) if end_date is None else int(np.searchsorted(dates, end_date, side='right'))
+            start = 0 if start_date is None else int(np.searchsorted(dates, start_date, side='left'))
+            if start >= end:
+                continue
+            lo = max(start - max_lookback - PATTERN_EVENT_MARGIN, 0)
+            args = tuple(np.ascontiguousarray(data[f].values[lo:end], dtype=np.float64) for f in PATTERN_FIELDS)
+            for j in np.nonzero(lookbacks < end - lo)[0]:
+                try:
+                    values = funcs[j](*args)[start - lo:]
+                except Exception:
+                    continue
+                idx = np.nonzero(values)[0]
+                if len(idx) == 0:
+                    continue
+                dates_list.append(dates[start + idx])
+                codes_list.append(np.full(len(idx), k[1], dtype=object))
+                patterns_list.append(np.full(len(idx), names[j], dtype=object))
+                values_list.append(values[idx].astype(np.int16))
+        if not dates_list:
+            # 没有形态事件返回空表，None 表示计算失败
+            return pd.DataFrame({'date': [], 'code': [], 'pattern': [], 'value': np.zeros(0, dtype=np.int16)})
+        data = pd.DataFrame({'date': np.concatenate(dates_list), 'code': np.concatenate(codes_list),
+                             'pattern': np.concatenate(patterns_list), 'value': np.concatenate(values_list)})
+        return data.sort_values(['date', 'code'], kind='stable', ignore_index=True)
+    except Exception as e:
+        logging.error(f"pattern_recognitions.get_pattern_events处理异常：{e}")
+    return None
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import atexit
+import threading
+import multiprocessing
+import concurrent.futures
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+__author__ = 'myh '
+__date__ = '2024/11/26 '
+
+# 多进程执行计算密集的作业（指标、K线形态、策略），绕开 GIL。
+# 股票历史行情只在共享内存中发布一次，子进程按需映射，不再逐只股票 pickle DataFrame；
+# 子进程返回紧凑的 numpy 结果（形态值、命中的股票序号），主进程再组装入库。
+
+# 进程数，docker -e 传递。默认 0 不使用多进程，作业沿用线程池；
+# spawn 启动子进程和共享内存有固定开销，核数少的小容器不划算，需要时按核数设置。
+process_workers = 0
+_process_workers = os.environ.get('process_workers')
+if _process_workers is not None:
+    process_workers = int(_process_workers)
+
+TASK_CHUNKS_PER_WORKER = 4  # 每个进程分到的任务块数，平衡负载
+SHARED_KEEP_COUNT = 2  # 共享内存中最多保留几份空闲的行情（区间作业同时有多个交易日）
+
+
+def is_enabled():
+    return process_workers > 0
+
+
+# 把 {(date, code, name): DataFrame} 的行情拼成一块连续内存发布到共享内存。
+# 每只股票占 offsets[i]:offsets[i+1] 行，日期单独用定长字节串保存。
+class shared_stocks:
+    def __init__(self, stocks):
+        self.keys = [k for k in stocks if stocks[k] is not None]
+        first = stocks[self.keys[0]] if self.keys else None
+        self.columns = tuple(c for c in first.columns if c != 'date') if first is not None else ()
+        lengths = np.array([len(stocks[k].index) for k in self.keys], dtype=np.int64)
+        self.offsets = np.zeros(len(self.keys) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.offsets[1:])
+        rows = int(self.offsets[-1])
+
+        self._shm_data = shared_memory.SharedMemory(create=True, size=max(rows * len(self.columns) * 8, 1))
+        self._shm_date = shared_memory.SharedMemory(create=True, size=max(rows * 10, 1))
+        data = np.ndarray((len(self.columns), rows), dtype=np.float64, buffer=self._shm_data.buf)
+        dates = np.ndarray((rows,), dtype='S10', buffer=self._shm_date.buf)
+        for i, k in enumerate(self.keys):
+            df = stocks[k]
+            s, e = self.offsets[i], self.offsets[i + 1]
+            for j, c in enumerate(self.columns):
+                data[j, s:e] = df[c].values
+            dates[s:e] = df['date'].values.astype('S10')
+        del data, dates
+
+    def spec(self):
+        return {'data': self._shm_data.name, 'date': self._shm_date.name,
+                'columns': self.columns, 'rows': int(self.offsets[-1])}
+
+    def close(self):
+        for shm in (self._shm_data, self._shm_date):
+            try:
+                shm.close()
+                shm.unlink()
+            except Exception:
+                pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_published = {}  # id(stocks) -> [stocks, shared_stocks, 引用数]
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn 启动，避免在多线程的主进程里 fork
+            _pool = concurrent.futures.ProcessPoolExecutor(max_workers=process_workers,
+                                                           mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+# 同一份行情（stock_hist_data 单例）只发布一次，用完 release
+def publish(stocks):
+    with _pool_lock:
+        item = _published.pop(id(stocks), None)
+        if item is None or item[0] is not stocks:
+            if item is not None:
+                item[1].close()
+            item = [stocks, shared_stocks(stocks), 0]
+        item[2] += 1
+        _published[id(stocks)] = item  # 重新插入，保持最近使用的在后面
+        # 清理多余的空闲行情
+        idle = [k for k, v in _published.items() if v[2] == 0]
+        for k in idle[:max(len(idle) - SHARED_KEEP_COUNT, 0)]:
+            _published.pop(k)[1].close()
+        return item[1]
+
+
+def release(stocks):
+    with _pool_lock:
+        item = _published.get(id(stocks))
+        if item is not None and item[0] is stocks:
+            item[2] -= 1
+
+
+@atexit.register
+def shutdown():
+    global _pool
+    with _pool_lock:
+        for item in _published.values():
+            item[1].close()
+        _published.clear()
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+# ---------- 子进程 ----------
+_attached = {}
+
+
+def _attach(spec):
+    item = _attached.get(spec['data'])
+    if item is None:
+        # 子进程只读映射，共享内存由主进程释放
+        shm_data = shared_memory.SharedMemory(name=spec['data'])
+        shm_date = shared_memory.SharedMemory(name=spec['date'])
+        rows = spec['rows']
+        data = np.ndarray((len(spec['columns']), rows), dtype=np.float64, buffer=shm_data.buf)
+        dates = np.ndarray((rows,), dtype='S10', buffer=shm_date.buf)
+        item = (shm_data, shm_date, data, dates)
+        _attached.clear()  # 只保留当前这份行情
+        _attached[spec['data']] = item
+    return item[2], item[3]
+
+
+def _frame(spec, data, dates, s, e):
+    # 复制出来，不直接引用共享内存
+    df = pd.DataFrame(data[:, s:e].T, columns=list(spec['columns']), copy=True)
+    df.insert(0, 'date', dates[s:e].astype(str).astype(object))
+    return df
+
+
+def _stocks(spec, keys, offsets):
+    data, dates = _attach(spec)
+    return {k: _frame(spec, data, dates, offsets[i], offsets[i + 1]) for i, k in enumerate(keys)}
+
+
+def _run_stock_task(spec, keys, offsets, base, func, args, kwargs, key_kwargs):
+    results = []
+    for i, (k, df) in enumerate(_stocks(spec, keys, offsets).items()):
+        try:
+            kw = kwargs if key_kwargs is None or k not in key_kwargs else {**kwargs, **key_kwargs[k]}
+            r = func(k, df, *args, **kw)
+            if r is not None and r is not False:
+                results.append((base + i, r))
+        except Exception as e:
+            logging.error(f"process_executor.run_stocks处理异常：{k[1]}代码{e}")
+    return results
+
+
+def _run_chunk_task(spec, keys, offsets, func, args, kwargs):
+    return func(_stocks(spec, keys, offsets), *args, **kwargs)
+
+
+# ---------- 主进程 ----------
+def _chunks(size):
+    count = max(min(size, process_workers * TASK_CHUNKS_PER_WORKER), 1)
+    bounds = np.linspace(0, size, count + 1).astype(np.int64)
+    return [(bounds[i], bounds[i + 1]) for i in range(count) if bounds[i] < bounds[i + 1]]
+
+
+# 对每只股票执行 func(key, data, *args, **kwargs)，返回 {key: 结果}，结果为 None/False 的不返回。
+# func 必须是模块级函数；key_kwargs 为个别股票额外的参数 {key: {参数: 值}}。
+def run_stocks(func, stocks, *args, key_kwargs=None, **kwargs):
+    shared = publish(stocks)
+    try:
+        spec = shared.spec()
+        pool = _get_pool()
+        futures = []
+        for s, e in _chunks(len(shared.keys)):
+            keys = shared.keys[s:e]
+            _key_kwargs = None if key_kwargs is None else {k: key_kwargs[k] for k in keys if k in key_kwargs}
+            futures.append(pool.submit(_run_stock_task, spec, keys, shared.offsets[s:e + 1], s,
+                                       func, args, kwargs, _key_kwargs))
+        results = {}
+        for future in concurrent.futures.as_completed(futures):
+            for i, r in future.result():
+                results[shared.keys[i]] = r
+        return results
+    finally:
+        release(stocks)
+
+
+# 把股票分块，每块执行 func({key: data}, *args, **kwargs)，按分块顺序返回结果列表。
+def run_chunks(func, stocks, *args, **kwargs):
+    shared = publish(stocks)
+    try:
+        spec = shared.spec()
+        pool = _get_pool()
+        futures = [pool.submit(_run_chunk_task, spec, shared.keys[s:e], shared.offsets[s:e + 1], func, args, kwargs)
+                   for s, e in _chunks(len(shared.keys))]
+        return [future.result() for future in futures]
+    finally:
+        release(stocks)
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import os.path
+import re
+import json
+import numpy as np
+
+__author__ = 'myh '
+__date__ = '2024/12/04 '
+
+# 选股条件表达式。
+# 例如 "kdjk >= 80 and rsi_6 >= 80 and cr >= 300"，支持列名、数字、+ - * /、比较 >= <= > < = == != <>、
+# and or not（也可写 & | ~）和括号。同一个表达式既可以编译成 NumPy 在内存结果上向量化筛选，也可以生成 SQL 条件。
+# 内存筛选按 SQL 的三值逻辑处理空值：NaN 参与比较的结果为未知，not 未知仍为未知，最终只选出为真的行；
+# 除以 0 和 MySQL 一样得到空值。
+# 内置的筛选条件在 SCREENS 中，config/screens.json（{"名称": "表达式"}）可以覆盖或增加，不用改代码。
+
+cpath_current = os.path.dirname(os.path.dirname(__file__))
+screens_file = os.path.join(cpath_current, 'config', 'screens.json')
+
+SCREENS = {
+    # 指标买入
+    'indicators_buy': 'kdjk >= 80 and kdjd >= 70 and kdjj >= 100 and rsi_6 >= 80 and '
+                      'cci >= 100 and cr >= 300 and wr_6 >= -20 and vr >= 160',
+    # 指标卖出
+    'indicators_sell': 'kdjk < 20 and kdjd < 30 and kdjj < 10 and rsi_6 < 20 and '
+                       'cci < -100 and cr < 40 and wr_6 < -80 and vr < 40',
+    # 基本面选股
+    'spot_buy': 'pe9 > 0 and pe9 <= 20 and pbnewmrq <= 10 and roe_weight >= 15',
+}
+
+_TOKEN = re.compile(r'\s*(?:(\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)|([A-Za-z_]\w*)|'
+                    r'(>=|<=|<>|!=|==|[-+*/()<>=&|~]))')
+_KEYWORDS = {'and': '&', 'or': '|', 'not': '~'}
+_COMPARE = {'>=': np.greater_equal, '<=': np.less_equal, '>': np.greater, '<': np.less,
+            '=': np.equal, '==': np.equal, '!=': np.not_equal, '<>': np.not_equal}
+_COMPARE_SQL = {'==': '=', '!=': '<>'}
+_ARITH = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.divide}
+
+
+# 词法分析，返回 [(类型, 值)]，类型为 num、col、op
+def _tokenize(expr):
+    tokens = []
+    pos = 0
+    expr = expr.strip()
+    while pos < len(expr):
+        m = _TOKEN.match(expr, pos)
+        if m is None or m.end() == pos:
+            raise ValueError(f"选股表达式错误：{expr[pos:]}")
+        number, name, op = m.groups()
+        if number is not None:
+            tokens.append(('num', float(number)))
+        elif name is not None and name.lower() in _KEYWORDS:
+            tokens.append(('op', _KEYWORDS[name.lower()]))
+        elif name is not None:
+            tokens.append(('col', name))
+        else:
+            tokens.append(('op', op))
+        pos = m.end()
+    return tokens
+
+
+# 递归下降语法分析，语法树为元组：
+# ('num', 值) ('col', 列名) ('neg', x) ('arith', 运算符, a, b) ('cmp', 比较符, a, b) ('and', a, b) ('or', a, b) ('not', x)
+class _parser:
+    def __init__(self, tokens, expr):
+        self.tokens = tokens
+        self.expr = expr
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, op=None):
+        token = self.peek()
+        if token[0] is None or (op is not None and token != ('op', op)):
+            raise ValueError(f"选股表达式错误：{self.expr}")
+        self.pos += 1
+        return token
+
+    def parse(self):
+        node = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise ValueError(f"选股表达式错误：{self.expr}")
+        return node
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.peek() == ('op', '|'):
+            self.take()
+            node = ('or', node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.peek() == ('op', '&'):
+            self.take()
+            node = ('and', node, self.parse_not())
+        return node
+
+    def parse_not(self):
+        if self.peek() == ('op', '~'):
+            self.take()
+            return ('not', self.parse_not())
+        return self.parse_compare()
+
+    def parse_compare(self):
+        node = self.parse_sum()
+        kind, op = self.peek()
+        if kind == 'op' and op in _COMPARE:
+            self.take()
+            node = ('cmp', op, node, self.parse_sum())
+        return node
+
+    def parse_sum(self):
+        node = self.parse_term()
+        while self.peek() in (('op', '+'), ('op', '-')):
+            op = self.take()[1]
+            node = ('arith', op, node, self.parse_term())
+        return node
+
+    def parse_term(self):
+        node = self.parse_unary()
+        while self.peek() in (('op', '*'), ('op', '/')):
+            op = self.take()[1]
+            node = ('arith', op, node, self.parse_unary())
+        return node
+
+    def parse_unary(self):
+        if self.peek() == ('op', '-'):
+            self.take()
+            return ('neg', self.parse_unary())
+        if self.peek() == ('op', '+'):
+            self.take()
+            return self.parse_unary()
+        return self.parse_primary()
+
+    def parse_primary(self):
+        kind, value = self.take()
+        if kind in ('num', 'col'):
+            return (kind, value)
+        if value == '(':
+            node = self.parse_or()
+            self.take(')')
+            return node
+        raise ValueError(f"选股表达式错误：{self.expr}")
+
+
+def _is_bool(node):
+    return node[0] in ('cmp', 'and', 'or', 'not')
+
+
+# 检查条件和数值的位置是否正确，返回用到的列名
+def _check(node, expr, want_bool, columns):
+    if _is_bool(node) != want_bool:
+        raise ValueError(f"选股表达式错误：{expr}（{'需要条件' if want_bool else '需要数值'}）")
+    kind = node[0]
+    if kind == 'col':
+        columns.add(node[1])
+    elif kind == 'neg':
+        _check(node[1], expr, False, columns)
+    elif kind in ('arith', 'cmp'):
+        _check(node[2], expr, False, columns)
+        _check(node[3], expr, False, columns)
+    elif kind in ('and', 'or'):
+        _check(node[1], expr, True, columns)
+        _check(node[2], expr, True, columns)
+    elif kind == 'not':
+        _check(node[1], expr, True, columns)
+    return columns
+
+
+# 编译数值节点，返回 func(columns) -> ndarray（空值为 NaN）
+def _compile_value(node):
+    kind = node[0]
+    if kind == 'num':
+        value = node[1]
+        return lambda cols: value
+    if kind == 'col':
+        name = node[1]
+        return lambda cols: cols[name]
+    if kind == 'neg':
+        a = _compile_value(node[1])
+        return lambda cols: np.negative(a(cols))
+    a = _compile_value(node[2])
+    b = _compile_value(node[3])
+    func = _ARITH[node[1]]
+    if node[1] == '/':
+        def divide(cols):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                value = func(a(cols), b(cols))
+            return np.where(np.isfinite(value), value, np.nan)
+        return divide
+    return lambda cols: func(a(cols), b(cols))
+
+
+# 编译条件节点，返回 func(columns) -> (为真, 为空) 两个布尔数组
+def _compile_bool(node):
+    kind = node[0]
+    if kind == 'cmp':
+        a = _compile_value(node[2])
+        b = _compile_value(node[3])
+        func = _COMPARE[node[1]]
+
+        def compare(cols):
+            x = a(cols)
+            y = b(cols)
+            null = np.isnan(x) | np.isnan(y)
+            with np.errstate(invalid='ignore'):
+                return func(x, y) & ~null, null
+        return compare
+    if kind == 'not':
+        a = _compile_bool(node[1])
+
+        def negate(cols):
+            t, n = a(cols)
+            return ~t & ~n, n
+        return negate
+    a = _compile_bool(node[1])
+    b = _compile_bool(node[2])
+    if kind == 'and':
+        def both(cols):
+            ta, na = a(cols)
+            tb, nb = b(cols)
+            t = ta & tb
+            false = (~ta & ~na) | (~tb & ~nb)
+            return t, ~t & ~false
+        return both
+
+    def either(cols):
+        ta, na = a(cols)
+        tb, nb = b(cols)
+        t = ta | tb
+        return t, (na | nb) & ~t
+    return either
+
+
+def _sql(node):
+    kind = node[0]
+    if kind == 'num':
+        return repr(node[1])
+    if kind == 'col':
+        return f"`{node[1]}`"
+    if kind == 'neg':
+        return f"(-{_sql(node[1])})"
+    if kind == 'not':
+        return f"(NOT {_sql(node[1])})"
+    if kind == 'and':
+        return f"({_sql(node[1])} AND {_sql(node[2])})"
+    if kind == 'or':
+        return f"({_sql(node[1])} OR {_sql(node[2])})"
+    op = _COMPARE_SQL.get(node[1], node[1])
+    return f"({_sql(node[2])} {op} {_sql(node[3])})"
+
+
+# 编译后的选股条件
+class screen:
+    def __init__(self, expr, name=None):
+        self.expr = expr
+        self.name = name
+        self._node = _parser(_tokenize(expr), expr).parse()
+        self.columns = tuple(sorted(_check(self._node, expr, True, set())))
+        self._func = _compile_bool(self._node)
+
+    # data 为 DataFrame 或 {列名: ndarray}，返回选中行的布尔数组。dtype 指定时先按该精度取值（例如表字段为 FLOAT）。
+    def evaluate(self, data, dtype=None):
+        cols = {}
+        for c in self.columns:
+            if c not in data:
+                raise KeyError(f"选股表达式的列不存在：{c}")
+            value = np.asarray(data[c])
+            if dtype is not None:
+                value = value.astype(dtype)
+            cols[c] = value.astype(np.float64)
+        size = len(data.index) if hasattr(data, 'index') else len(next(iter(data.values()), ()))
+        return np.broadcast_to(np.asarray(self._func(cols)[0], dtype=bool), (size,)).copy()
+
+    # 返回选中的行
+    def filter(self, data, dtype=None):
+        return data.loc[self.evaluate(data, dtype=dtype)]
+
+    # SQL 条件（不含 WHERE）
+    def to_sql(self):
+        return _sql(self._node)
+
+
+_screens = None
+
+
+# 内置条件加上 config/screens.json 中的条件，{名称: 表达式}
+def load_screens():
+    global _screens
+    if _screens is not None:
+        return _screens
+    screens = dict(SCREENS)
+    try:
+        if os.path.isfile(screens_file):
+            with open(screens_file, 'r', encoding='utf-8') as f:
+                screens.update(json.load(f))
+    except Exception as e:
+        logging.error(f"screen_expr.load_screens处理异常：{e}")
+    _screens = screens
+    return _screens
+
+
+# 按名称取编译后的条件
+def get_screen(name):
+    return screen(load_screens()[name], name)
+
+
+# 自定义的条件（config/screens.json 中新增的）
+def custom_screens():
+    return {k: v for k, v in load_screens().items() if k not in SCREENS}
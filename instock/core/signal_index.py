@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import os.path
+import re
+import pickle
+import threading
+import numpy as np
+
+__author__ = 'myh '
+__date__ = '2024/12/02 '
+
+# 信号位图索引。
+# 每个 (信号, 日期) 一个位图，位置是股票在代码全集里的序号；信号包括K线形态、各个策略、指标买卖和指标阈值。
+# 位图用 numpy 按位压缩（每只股票 1 bit），命中很少的信号只保存序号数组；
+# 组合查询直接在压缩位图上按位与或非，例如 "hammer & enter & rsi_6<20" 最近 5 个交易日内出现过。
+# 每个交易日保存一个文件，按需加载最近几天。
+
+cpath_current = os.path.dirname(os.path.dirname(__file__))
+signal_index_path = os.path.join(cpath_current, 'cache', 'signal_index')
+
+# 指标阈值信号：信号名 -> (指标列, 比较符, 阈值)，名字本身就是查询里用的写法
+_OPERATORS = {'>=': np.greater_equal, '<=': np.less_equal, '>': np.greater, '<': np.less}
+INDICATOR_SIGNALS = ('kdjk>=80', 'kdjd>=70', 'kdjj>=100', 'rsi_6>=80', 'cci>=100', 'cr>=300', 'wr_6>=-20', 'vr>=160',
+                     'kdjk<20', 'kdjd<30', 'kdjj<10', 'rsi_6<20', 'cci<-100', 'cr<40', 'wr_6<-80', 'vr<40')
+
+
+# 拆分指标阈值信号 'rsi_6<20' -> ('rsi_6', '<', 20.0)
+def parse_indicator_signal(signal):
+    m = re.fullmatch(r'\s*([A-Za-z_][\w\-]*)\s*(>=|<=|>|<)\s*(-?[\d.]+)\s*', signal)
+    if m is None:
+        raise ValueError(f"指标阈值信号格式错误：{signal}")
+    return m.group(1), m.group(2), float(m.group(3))
+
+
+# 按阈值信号筛选，values 为指标列 ndarray，返回布尔数组
+def eval_indicator_signal(signal, values):
+    column, op, threshold = parse_indicator_signal(signal)
+    with np.errstate(invalid='ignore'):
+        return _OPERATORS[op](values, threshold)
+
+
+class signal_index:
+    def __init__(self, codes=()):
+        self.codes = []  # 代码全集，只追加，已有代码的位置不变
+        self._pos = {}
+        self.bitmaps = {}  # {(信号, 日期): 压缩位图（uint8 按位）或命中序号（uint32）}
+        self.add_codes(codes)
+
+    def add_codes(self, codes):
+        for c in codes:
+            if c not in self._pos:
+                self._pos[c] = len(self.codes)
+                self.codes.append(c)
+
+    def _nbytes(self):
+        return (len(self.codes) + 7) // 8
+
+    # 命中很少时只保存序号，比位图更省
+    def _compress(self, positions):
+        positions = np.asarray(positions, dtype=np.uint32)
+        if len(positions) * 4 < self._nbytes():
+            return np.sort(positions)
+        bits = np.zeros(len(self.codes), dtype=bool)
+        bits[positions] = True
+        return np.packbits(bits)
+
+    # 统一成当前全集长度的按位位图
+    def _dense(self, value):
+        if value is None:
+            return np.zeros(self._nbytes(), dtype=np.uint8)
+        if value.dtype == np.uint32:
+            bits = np.zeros(len(self.codes), dtype=bool)
+            bits[value] = True
+            return np.packbits(bits)
+        if len(value) < self._nbytes():
+            return np.concatenate([value, np.zeros(self._nbytes() - len(value), dtype=np.uint8)])
+        return value
+
+    def add(self, signal, date, codes):
+        codes = list(codes)
+        self.add_codes(codes)
+        self.bitmaps[(signal, date)] = self._compress([self._pos[c] for c in codes])
+
+    def dates(self):
+        return sorted(set(d for _, d in self.bitmaps))
+
+    def signals(self):
+        return sorted(set(s for s, _ in self.bitmaps))
+
+    # 信号在 dates 中任一天出现过的位图，信号不存在（例如名字拼错）时报错，不当作没有命中
+    def get(self, signal, dates):
+        if signal not in self.signals():
+            raise ValueError(f"信号不存在：{signal}")
+        bits = self._dense(None)
+        for d in dates:
+            value = self.bitmaps.get((signal, d))
+            if value is not None:
+                bits |= self._dense(value)
+        return bits
+
+    def all(self):
+        bits = np.packbits(np.ones(len(self.codes), dtype=bool))
+        return self._dense(bits)
+
+    def codes_of(self, bits):
+        positions = np.nonzero(np.unpackbits(bits, count=len(self.codes)))[0]
+        return [self.codes[i] for i in positions]
+
+    def count(self, bits):
+        return int(np.unpackbits(bits, count=len(self.codes)).sum())
+
+    # 组合查询，expr 支持 & | ~ ( ) 以及 AND OR NOT，信号名为K线形态、策略名或指标阈值。
+    # 每个信号在 dates 中任一天出现过即为真，返回命中的代码列表。
+    def query(self, expr, dates):
+        return self.codes_of(self.query_bits(expr, dates))
+
+    def query_bits(self, expr, dates):
+        tokens = _tokenize(expr)
+        bits, pos = self._parse_or(tokens, 0, dates)
+        if pos != len(tokens):
+            raise ValueError(f"查询表达式错误：{expr}")
+        return bits
+
+    def _parse_or(self, tokens, pos, dates):
+        bits, pos = self._parse_and(tokens, pos, dates)
+        while pos < len(tokens) and tokens[pos] == '|':
+            other, pos = self._parse_and(tokens, pos + 1, dates)
+            bits = bits | other
+        return bits, pos
+
+    def _parse_and(self, tokens, pos, dates):
+        bits, pos = self._parse_not(tokens, pos, dates)
+        while pos < len(tokens) and tokens[pos] == '&':
+            other, pos = self._parse_not(tokens, pos + 1, dates)
+            bits = bits & other
+        return bits, pos
+
+    def _parse_not(self, tokens, pos, dates):
+        if pos >= len(tokens):
+            raise ValueError("查询表达式不完整")
+        token = tokens[pos]
+        if token == '~':
+            bits, pos = self._parse_not(tokens, pos + 1, dates)
+            return ~bits & self.all(), pos
+        if token == '(':
+            bits, pos = self._parse_or(tokens, pos + 1, dates)
+            if pos >= len(tokens) or tokens[pos] != ')':
+                raise ValueError("查询表达式括号不匹配")
+            return bits, pos + 1
+        if token in ('&', '|', ')'):
+            raise ValueError(f"查询表达式错误：{token}")
+        return self.get(token, dates), pos + 1
+
+    # 合并另一个索引（例如另一天的文件），代码按本索引的全集重新排位
+    def merge(self, other):
+        self.add_codes(other.codes)
+        remap = np.array([self._pos[c] for c in other.codes], dtype=np.uint32)
+        for key, value in other.bitmaps.items():
+            if value.dtype == np.uint32:
+                positions = remap[value]
+            else:
+                positions = remap[np.nonzero(np.unpackbits(value, count=len(other.codes)))[0]]
+            self.bitmaps[key] = self._compress(positions)
+        return self
+
+
+_TOKEN = re.compile(r'\s*(\(|\)|&|\||~|[^\s()&|~]+)')
+_WORDS = {'and': '&', 'or': '|', 'not': '~'}
+
+
+def _tokenize(expr):
+    tokens = []
+    pos = 0
+    expr = expr.strip()
+    while pos < len(expr):
+        m = _TOKEN.match(expr, pos)
+        if m is None:
+            raise ValueError(f"查询表达式错误：{expr}")
+        token = m.group(1)
+        tokens.append(_WORDS.get(token.lower(), token))
+        pos = m.end()
+    return tokens
+
+
+def _index_file(date):
+    return os.path.join(signal_index_path, f'{date}.pickle')
+
+
+# 保存某个交易日的位图
+def save_index(index, date):
+    try:
+        if not os.path.exists(signal_index_path):
+            os.makedirs(signal_index_path)
+        day = signal_index(index.codes)
+        day.bitmaps = {k: v for k, v in index.bitmaps.items() if k[1] == date}
+        with open(_index_file(date), 'wb') as f:
+            pickle.dump({'codes': day.codes, 'bitmaps': day.bitmaps}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception as e:
+        logging.error(f"signal_index.save_index处理异常：{date}{e}")
+
+
+# 加载指定交易日的位图，合并为一个索引；dates 为 None 时加载最近 days 个交易日。
+def load_index(dates=None, days=5):
+    index = signal_index()
+    try:
+        if not os.path.exists(signal_index_path):
+            return index
+        if dates is None:
+            files = sorted(f for f in os.listdir(signal_index_path) if f.endswith('.pickle'))
+            dates = [f[:10] for f in files[-days:]]
+        for date in dates:
+            if not os.path.isfile(_index_file(date)):
+                continue
+            with open(_index_file(date), 'rb') as f:
+                saved = pickle.load(f)
+            day = signal_index(saved['codes'])
+            day.bitmaps = saved['bitmaps']
+            index.merge(day)
+    except Exception as e:
+        logging.error(f"signal_index.load_index处理异常：{e}")
+    return index
+
+
+_loaded = {}  # 最近一次查询加载的索引，键为各个日期文件的 (日期, 修改时间)
+_loaded_lock = threading.Lock()
+
+
+# 日期 -> 文件修改时间
+def _index_files():
+    if not os.path.exists(signal_index_path):
+        return {}
+    with os.scandir(signal_index_path) as it:
+        return {e.name[:10]: e.stat().st_mtime_ns for e in it if e.name.endswith('.pickle')}
+
+
+# 取已加载的索引，日期文件有增加、删除或重新保存时才重新加载
+def get_index(dates):
+    files = _index_files()
+    key = tuple((d, files[d]) for d in dates if d in files)
+    with _loaded_lock:
+        index = _loaded.get(key)
+        if index is None:
+            index = load_index([d for d, _ in key])
+            _loaded.clear()
+            _loaded[key] = index
+        return index
+
+
+# 查询最近 days 个交易日（截止 date，None 为最新）内满足 expr 的股票代码，信号名不存在或表达式错误时报 ValueError
+def query(expr, date=None, days=1):
+    try:
+        files = sorted(_index_files())
+        if date is not None:
+            files = [d for d in files if d <= date]
+        dates = files[-days:]
+        index = get_index(dates)
+    except Exception as e:
+        logging.error(f"signal_index.query处理异常：{expr}{e}")
+        return None
+    return index.query(expr, dates)
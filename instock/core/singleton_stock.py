@@ -23,6 +23,12 @@ class stock_data(metaclass=singleton_type):
     def get_data(self):
         return self.data
 
+    # 已加载的当天股票数据，单例还没有创建时返回 None（不会去抓取）
+    @classmethod
+    def get_loaded_data(cls):
+        instance = cls.get_instance()
+        return None if instance is None else getattr(instance, 'data', None)
+
 
 # 读取股票历史数据
 class stock_hist_data(metaclass=singleton_type):
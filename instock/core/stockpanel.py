@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+__author__ = 'myh '
+__date__ = '2024/11/20 '
+
+# 面板默认包含的行情字段
+PANEL_FIELDS = ('open', 'high', 'low', 'close', 'volume', 'amount', 'p_change')
+
+
+# 行情按日期升序排列，日期为 'YYYY-MM-DD' 字符串，字典序即时间顺序，可以直接二分查找。
+# 返回 date 在 data 中的位置：side='right' 为 <= date 的行数，side='left' 为 < date 的行数。
+def date_index(data, date, side='right'):
+    return int(np.searchsorted(data['date'].values, date, side=side))
+
+
+# 截取 end_date（含）之前的行情，按位置切片，不复制数据；end_date 为 None 时原样返回。
+# 替代 data.loc[data['date'] <= end_date]：不再逐行比较字符串，也不再复制整个行情。
+def slice_end(data, end_date):
+    if end_date is None:
+        return data
+    return data.iloc[:date_index(data, end_date)]
+
+
+# 截取 start_date（含）之后的行情，按位置切片，不复制数据
+def slice_start(data, start_date):
+    if start_date is None:
+        return data
+    return data.iloc[date_index(data, start_date, side='left'):]
+
+
+# 股票 × 交易日 面板数据。
+# 每只股票一行，按最后一根K线右对齐；上市时间不足（或停牌）的股票左侧补 NaN，
+# begin 记录每行第一根有效K线所在的列，valid 为有效数据掩码。
+class stock_panel:
+    def __init__(self, keys, fields, dates, begin):
+        self.keys = keys  # [(date, code, name), ...]
+        self.fields = fields  # {'close': ndarray(N, T), ...}
+        self.dates = dates  # ndarray(N, T) 字符串日期，补齐部分为 None
+        self.begin = begin  # ndarray(N,) 每行第一根有效K线的列号
+        self.size = len(keys)
+        self.length = dates.shape[1]
+        self.valid = np.arange(self.length)[None, :] >= begin[:, None]
+
+    def __getitem__(self, field):
+        return self.fields[field]
+
+    def __contains__(self, field):
+        return field in self.fields
+
+    def codes(self):
+        return [k[1] for k in self.keys]
+
+
+# 由 {(date, code, name): DataFrame} 构建面板。
+# end_date 之后的数据被截掉；threshold 为每只股票保留的最近K线数，None 保留全部。
+def build_panel(stocks, end_date=None, threshold=None, fields=PANEL_FIELDS):
+    keys = []
+    slices = []
+    for k in stocks:
+        data = stocks[k]
+        if data is None:
+            continue
+        end = len(data.index) if end_date is None else date_index(data, end_date)
+        start = 0 if threshold is None else max(end - threshold, 0)
+        keys.append(k)
+        slices.append((data, start, end))
+
+    size = len(keys)
+    length = max((e - s for _, s, e in slices), default=0)
+    panel_fields = {f: np.full((size, length), np.nan, dtype=np.float64) for f in fields}
+    panel_dates = np.full((size, length), None, dtype=object)
+    begin = np.empty(size, dtype=np.int64)
+    for i, (data, s, e) in enumerate(slices):
+        n = e - s
+        b = length - n
+        begin[i] = b
+        if n == 0:
+            continue
+        for f in fields:
+            panel_fields[f][i, b:] = data[f].values[s:e]
+        panel_dates[i, b:] = data['date'].values[s:e]
+    return stock_panel(keys, panel_fields, panel_dates, begin)
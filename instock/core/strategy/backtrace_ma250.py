@@ -1,9 +1,9 @@
 #!/usr/local/bin/python
 # -*- coding: utf-8 -*-
 
-import numpy as np
-import talib as tl
 from datetime import datetime, timedelta
+import instock.core.feature_cache as fcache
+from instock.core.stockpanel import slice_end
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
@@ -14,22 +14,18 @@ __date__ = '2023/3/10 '
 # 2.前段由年线(250日)以下向上突破
 # 3.后段必须在年线以上运行，且后段最低价日与最高价日相差必须在10-50日间
 # 4.回踩伴随缩量：最高价日交易量/后段最低价日交易量>2,后段最低价/最高价<0.8
-def check(code_name, data, date=None, threshold=60):
+def check(code_name, data, date=None, *, threshold):
     if date is None:
         end_date = code_name[0]
     else:
         end_date = date.strftime("%Y-%m-%d")
 
-    if end_date is not None:
-        mask = (data['date'] <= end_date)
-        data = data.loc[mask].copy()
+    data = slice_end(data, end_date)
     if len(data.index) < 250:
         return False
 
-    data.loc[:, 'ma250'] = tl.MA(data['close'].values, timeperiod=250)
-    data['ma250'].values[np.isnan(data['ma250'].values)] = 0.0
-
-    data = data.tail(n=threshold)
+    ma250 = fcache.get_feature(code_name[1], data, 'ma250', tail=threshold)
+    data = data.tail(n=threshold).assign(ma250=ma250)
 
     # 区间最低点
     lowest_row = [1000000, 0, '']
@@ -1,10 +1,10 @@
 #!/usr/local/bin/python
 # -*- coding: utf-8 -*-
 
-from datetime import datetime
-import numpy as np
-import talib as tl
 from instock.core.strategy import enter
+import instock.core.strategy.strategy_registry as sreg
+import instock.core.feature_cache as fcache
+from instock.core.stockpanel import slice_end
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
@@ -14,27 +14,27 @@ __date__ = '2023/3/10 '
 # 1.60日内某日收盘价>=60日均线>开盘价
 # 2.且【1】放量上涨
 # 3.且【1】间之前时间，任意一天收盘价与60日均线偏离在-5%~20%之间。
-def check(code_name, data, date=None, threshold=60):
-    origin_data = data
+def check(code_name, data, date=None, *, threshold):
     if date is None:
         end_date = code_name[0]
     else:
         end_date = date.strftime("%Y-%m-%d")
-    if end_date is not None:
-        mask = (data['date'] <= end_date)
-        data = data.loc[mask].copy()
+    data = slice_end(data, end_date)
     if len(data.index) < threshold:
         return False
 
-    data.loc[:, 'ma60'] = tl.MA(data['close'].values, timeperiod=60)
-    data['ma60'].values[np.isnan(data['ma60'].values)] = 0.0
-
-    data = data.tail(n=threshold)
+    ma60 = fcache.get_feature(code_name[1], data, 'ma60', tail=threshold)
+    # 每天是否放量上涨，逐日查表；成交额、量比用放量上涨策略的参数
+    enter_params = sreg.STRATEGY_REGISTRY['enter']['params']
+    is_enter = enter.check_volume_series(code_name, data, threshold, enter_params['ratio'], enter_params['amount'],
+                                         tail=threshold)
+    data = data.tail(n=threshold).assign(ma60=ma60)
 
     breakthrough_row = None
-    for _close, _open, _date, _ma60 in zip(data['close'].values, data['open'].values, data['date'].values, data['ma60'].values):
+    for _close, _open, _date, _ma60, _enter in zip(data['close'].values, data['open'].values, data['date'].values,
+                                                   data['ma60'].values, is_enter):
         if _open < _ma60 <= _close:
-            if enter.check_volume(code_name, origin_data, date=datetime.date(datetime.strptime(_date, '%Y-%m-%d')), threshold=threshold):
+            if _enter:
                 breakthrough_row = _date
                 break
 
@@ -2,24 +2,22 @@
 # -*- coding: utf-8 -*-
 
 
-import numpy as np
-import talib as tl
+import instock.core.feature_cache as fcache
+from instock.core.stockpanel import slice_end
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
 
 # 放量跌停
 # 1.跌>9.5%
-# 2.成交额不低于2亿
-# 3.成交量至少是5日平均成交量的4倍
-def check(code_name, data, date=None, threshold=60):
+# 2.成交额不低于2亿（amount）
+# 3.成交量至少是5日平均成交量的4倍（ratio）
+def check(code_name, data, date=None, *, threshold, ratio, amount):
     if date is None:
         end_date = code_name[0]
     else:
         end_date = date.strftime("%Y-%m-%d")
-    if end_date is not None:
-        mask = (data['date'] <= end_date)
-        data = data.loc[mask].copy()
+    data = slice_end(data, end_date)
     if len(data.index) < threshold:
         return False
 
@@ -27,8 +25,7 @@ def check(code_name, data, date=None, threshold=60):
     if p_change > -9.5:
         return False
 
-    data.loc[:, 'vol_ma5'] = tl.MA(data['volume'].values, timeperiod=5)
-    data['vol_ma5'].values[np.isnan(data['vol_ma5'].values)] = 0.0
+    vol_ma5 = fcache.get_feature(code_name[1], data, 'vol_ma5', tail=2)
 
     data = data.tail(n=threshold + 1)
     if len(data.index) < threshold + 1:
@@ -39,18 +36,17 @@ def check(code_name, data, date=None, threshold=60):
     # 最后一天成交量
     last_vol = data.iloc[-1]['volume']
 
-    amount = last_close * last_vol
+    last_amount = last_close * last_vol
 
     # 成交额不低于2亿
-    if amount < 200000000:
+    if last_amount < amount:
         return False
 
-    data = data.head(n=threshold)
-
-    mean_vol = data.iloc[-1]['vol_ma5']
+    # 前一天的5日均量
+    mean_vol = vol_ma5[0]
 
     vol_ratio = last_vol / mean_vol
-    if vol_ratio >= 4:
+    if vol_ratio >= ratio:
         return True
     else:
         return False
@@ -2,7 +2,8 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
-import talib as tl
+import instock.core.feature_cache as fcache
+from instock.core.stockpanel import slice_end
 
 
 __author__ = 'myh '
@@ -11,16 +12,14 @@ __date__ = '2023/3/10 '
 
 # 放量上涨
 # 1.当日比前一天上涨小于2%或收盘价小于开盘价
-# 2.当日成交额不低于2亿
-# 3.当日成交量/5日平均成交量>=2
-def check_volume(code_name, data, date=None, threshold=60):
+# 2.当日成交额不低于2亿（amount）
+# 3.当日成交量/5日平均成交量>=2（ratio）
+def check_volume(code_name, data, date=None, *, threshold, ratio, amount):
     if date is None:
         end_date = code_name[0]
     else:
         end_date = date.strftime("%Y-%m-%d")
-    if end_date is not None:
-        mask = (data['date'] <= end_date)
-        data = data.loc[mask].copy()
+    data = slice_end(data, end_date)
     if len(data.index) < threshold:
         return False
 
@@ -28,8 +27,7 @@ def check_volume(code_name, data, date=None, threshold=60):
     if p_change < 2 or data.iloc[-1]['close'] < data.iloc[-1]['open']:
         return False
 
-    data.loc[:, 'vol_ma5'] = tl.MA(data['volume'].values, timeperiod=5)
-    data['vol_ma5'].values[np.isnan(data['vol_ma5'].values)] = 0.0
+    vol_ma5 = fcache.get_feature(code_name[1], data, 'vol_ma5', tail=2)
 
     data = data.tail(n=threshold + 1)
     if len(data) < threshold + 1:
@@ -40,18 +38,38 @@ def check_volume(code_name, data, date=None, threshold=60):
     # 最后一天成交量
     last_vol = data.iloc[-1]['volume']
 
-    amount = last_close * last_vol
+    last_amount = last_close * last_vol
 
     # 成交额不低于2亿
-    if amount < 200000000:
+    if last_amount < amount:
         return False
 
-    data = data.head(n=threshold)
-
-    mean_vol = data.iloc[-1]['vol_ma5']
+    # 前一天的5日均量
+    mean_vol = vol_ma5[0]
 
     vol_ratio = last_vol / mean_vol
-    if vol_ratio >= 2:
+    if vol_ratio >= ratio:
         return True
     else:
         return False
+
+
+# 逐日的 check_volume 结果：data 为截止日期之前的行情，返回最近 tail 根K线每天是否满足（tail 为 None 时全部）。
+# 组合策略按天查表，不再对每一天重新截取行情、重算均量。
+def check_volume_series(code_name, data, threshold, ratio, amount, tail=None):
+    size = len(data.index)
+    tail = size if tail is None else min(tail, size)
+    start = size - tail
+    # 每天对应前一天的5日均量
+    vol_ma5 = fcache.get_feature(code_name[1], data, 'vol_ma5', tail=tail + 1)
+    mean_vol = np.full(tail, np.nan)
+    if len(vol_ma5) > 1:
+        mean_vol[tail - len(vol_ma5) + 1:] = vol_ma5[:-1]
+    close = data['close'].values[start:]
+    open_ = data['open'].values[start:]
+    volume = data['volume'].values[start:]
+    bars = np.arange(start + 1, size + 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hit = (bars >= threshold + 1) & ~(data['p_change'].values[start:] < 2) & ~(close < open_)
+        hit &= ~(close * volume < amount) & (volume / mean_vol >= ratio)
+    return hit
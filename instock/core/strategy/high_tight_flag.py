@@ -1,6 +1,7 @@
 #!/usr/local/bin/python
 # -*- coding: utf-8 -*-
 
+from instock.core.stockpanel import slice_end
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
@@ -8,9 +9,9 @@ __date__ = '2023/3/10 '
 
 # 高而窄的旗形
 # 1.必须至少上市交易60日
-# 2.当日收盘价/之前24~10日的最低价>=1.9
+# 2.当日收盘价/之前24~10日的最低价>=1.9（ratio）
 # 3.之前24~10日必须连续两天涨幅大于等于9.5%
-def check_high_tight(code_name, data, date=None, threshold=60, istop=False):
+def check_high_tight(code_name, data, date=None, istop=False, *, threshold, ratio):
     # 龙虎榜上必须有机构
     if not istop:
         return False
@@ -18,9 +19,7 @@ def check_high_tight(code_name, data, date=None, threshold=60, istop=False):
         end_date = code_name[0]
     else:
         end_date = date.strftime("%Y-%m-%d")
-    if end_date is not None:
-        mask = (data['date'] <= end_date)
-        data = data.loc[mask]
+    data = slice_end(data, end_date)
     if len(data.index) < threshold:
         return False
 
@@ -30,7 +29,7 @@ def check_high_tight(code_name, data, date=None, threshold=60, istop=False):
     data = data.head(n=14)
     low = data['low'].values.min()
     ratio_increase = data.iloc[-1]['high'] / low
-    if ratio_increase < 1.9:
+    if ratio_increase < ratio:
         return False
 
     # 连续两天涨幅大于等于10%
@@ -1,8 +1,8 @@
 #!/usr/local/bin/python
 # -*- coding: utf-8 -*-
 
-import numpy as np
-import talib as tl
+import instock.core.feature_cache as fcache
+from instock.core.stockpanel import slice_end
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
@@ -12,27 +12,21 @@ __date__ = '2023/3/10 '
 # 均线多头
 # 1.30日前的30日均线<20日前的30日均线<10日前的30日均线<当日的30日均线
 # 3.(当日的30日均线/30日前的30日均线)>1.2
-def check(code_name, data, date=None, threshold=30):
+def check(code_name, data, date=None, *, threshold):
     if date is None:
         end_date = code_name[0]
     else:
         end_date = date.strftime("%Y-%m-%d")
-    if end_date is not None:
-        mask = (data['date'] <= end_date)
-        data = data.loc[mask].copy()
+    data = slice_end(data, end_date)
     if len(data.index) < threshold:
         return False
 
-    data.loc[:, 'ma30'] = tl.MA(data['close'].values, timeperiod=30)
-    data['ma30'].values[np.isnan(data['ma30'].values)] = 0.0
-
-    data = data.tail(n=threshold)
+    ma30 = fcache.get_feature(code_name[1], data, 'ma30', tail=threshold)
 
     step1 = round(threshold / 3)
     step2 = round(threshold * 2 / 3)
 
-    if data.iloc[0]['ma30'] < data.iloc[step1]['ma30'] < \
-            data.iloc[step2]['ma30'] < data.iloc[-1]['ma30'] and data.iloc[-1]['ma30'] > 1.2 * data.iloc[0]['ma30']:
+    if ma30[0] < ma30[step1] < ma30[step2] < ma30[-1] and ma30[-1] > 1.2 * ma30[0]:
         return True
     else:
         return False
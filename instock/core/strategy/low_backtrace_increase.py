@@ -1,6 +1,7 @@
 #!/usr/local/bin/python
 # -*- coding: utf-8 -*-
 
+from instock.core.stockpanel import slice_end
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
@@ -9,14 +10,12 @@ __date__ = '2023/3/10 '
 # 无大幅回撤
 # 1.当日收盘价比60日前的收盘价的涨幅小于0.6
 # 2.最近60日，不能有单日跌幅超7%、高开低走7%、两日累计跌幅10%、两日高开低走累计10%
-def check(code_name, data, date=None, threshold=60):
+def check(code_name, data, date=None, *, threshold):
     if date is None:
         end_date = code_name[0]
     else:
         end_date = date.strftime("%Y-%m-%d")
-    if end_date is not None:
-        mask = (data['date'] <= end_date)
-        data = data.loc[mask]
+    data = slice_end(data, end_date)
     if len(data.index) < threshold:
         return False
 
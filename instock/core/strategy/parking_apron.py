@@ -1,8 +1,8 @@
 #!/usr/local/bin/python
 # -*- coding: utf-8 -*-
 
-from datetime import datetime
 from instock.core.strategy import turtle_trade
+from instock.core.stockpanel import slice_end
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
@@ -12,25 +12,25 @@ __date__ = '2023/3/10 '
 # 1.最近15日有涨幅大于9.5%，且必须是放量上涨
 # 2.紧接的下个交易日必须高开，收盘价必须上涨，且与开盘价不能大于等于相差3%
 # 3.接下2、3个交易日必须高开，收盘价必须上涨，且与开盘价不能大于等于相差3%，且每天涨跌幅在5%间
-def check(code_name, data, date=None, threshold=15):
-    origin_data = data
+def check(code_name, data, date=None, *, threshold):
     if date is None:
         end_date = code_name[0]
     else:
         end_date = date.strftime("%Y-%m-%d")
-    if end_date is not None:
-        mask = (data['date'] <= end_date)
-        data = data.loc[mask]
+    data = slice_end(data, end_date)
     if len(data.index) < threshold:
         return False
 
+    # 每天是否满足海龟交易法则，逐日查表
+    is_enter = turtle_trade.check_enter_series(code_name, data, threshold=threshold, tail=threshold)
     data = data.tail(n=threshold)
 
     limitup_row = [1000000, '']
     # 找出涨停日
-    for _close, _p_change, _date in zip(data['close'].values, data['p_change'].values, data['date'].values):
+    for _close, _p_change, _date, _enter in zip(data['close'].values, data['p_change'].values, data['date'].values,
+                                                is_enter):
         if _p_change > 9.5:
-            if turtle_trade.check_enter(code_name, origin_data, date=datetime.date(datetime.strptime(_date, '%Y-%m-%d')), threshold=threshold):
+            if _enter:
                 limitup_row[0] = _close
                 limitup_row[1] = _date
                 if check_internal(data, limitup_row):
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+import threading
+import numpy as np
+import pandas as pd
+from instock.core.stockpanel import build_panel, stock_panel, date_index
+import instock.core.feature_cache as fcache
+import instock.core.tablestructure as tbs
+import instock.core.strategy.strategy_registry as sreg
+
+__author__ = 'myh '
+__date__ = '2024/12/03 '
+
+# 策略批量筛选。
+# 全市场行情构建成 股票 × 交易日 面板（只保留最近 STRATEGY_WINDOW 根K线），每个策略写成面板上的数组条件，
+# 一次调用得到所有股票是否选中的布尔向量，和逐只股票调用策略函数的结果完全一致（包括原函数里的边界写法）。
+# 均线等依赖全部历史的特征从 feature_cache 取，和策略函数共用，数值逐位相同。
+# 历史回补（get_strategy_backfill）每块股票只构建一次全部历史的面板，逐日取出窗口，全部策略一遍算完。
+
+STRATEGY_WINDOW = sreg.resolve_window()  # 最长的策略窗口 60 天，再加前一天的5日均量
+STRATEGY_FIELDS = sreg.resolve_fields()
+PANEL_KEEP_COUNT = 2  # 同时保留几份面板（多个策略线程共用）
+
+
+# 策略面板：行情面板 + 每只股票截止日期的K线数 + 按需取出的均线特征。
+# features(特征名) 返回 (size, length) 的特征面板，和行情面板按列对齐。
+class strategy_panel:
+    def __init__(self, panel, bars, features, end_date=None):
+        self.end_date = end_date
+        self.panel = panel
+        self.keys = panel.keys
+        self.size = panel.size
+        self.length = panel.length
+        self.bars = bars
+        self._get_feature = features
+        self._features = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, field):
+        return self.panel[field]
+
+    # 第 t 列及之前的K线数
+    def bars_at(self, t):
+        return self.bars - (self.length - 1 - t)
+
+    # 截止日期之前全部历史上的均线特征（同策略函数），返回最近 length 列
+    def ma(self, field, period):
+        name = f"vol_ma{period}" if field == 'volume' else f"ma{period}"
+        with self._lock:
+            value = self._features.get(name)
+            if value is None:
+                value = self._get_feature(name)
+                self._features[name] = value
+            return value
+
+    def dates_at(self, rows, cols):
+        return np.array(self.panel.dates[rows, cols], dtype='datetime64[D]')
+
+
+# 截止日期的策略面板（每日作业），均线特征来自特征缓存
+def build_strategy_panel(stocks, end_date, window=STRATEGY_WINDOW):
+    panel = build_panel(stocks, end_date=end_date, threshold=window, fields=STRATEGY_FIELDS)
+    if panel.length < window:
+        # K线都不足窗口时左侧补齐，各策略按固定列号取数
+        pad = window - panel.length
+        fields = {f: np.pad(v, ((0, 0), (pad, 0)), constant_values=np.nan) for f, v in panel.fields.items()}
+        dates = np.pad(panel.dates, ((0, 0), (pad, 0)), constant_values=None)
+        panel = stock_panel(panel.keys, fields, dates, panel.begin + pad)
+    series = [stocks[k] for k in panel.keys]
+    bars = np.array([date_index(data, end_date) for data in series], dtype=np.int64)
+
+    def features(name):
+        value = np.full((panel.size, panel.length), np.nan, dtype=np.float64)
+        for i, data in enumerate(series):
+            if bars[i] == 0:
+                continue
+            ma = fcache.get_feature(panel.keys[i][1], data, name, end_date=end_date, tail=panel.length)
+            value[i, panel.length - len(ma):] = ma
+        return value
+
+    return strategy_panel(panel, bars, features, end_date)
+
+
+# 放量上涨在第 t 列是否成立（enter.check_volume 的面板写法）
+def _enter_at(sp, t, threshold, ratio, amount):
+    close = sp['close'][:, t]
+    open_ = sp['open'][:, t]
+    volume = sp['volume'][:, t]
+    bars = sp.bars_at(t)
+    mean_vol = sp.ma('volume', 5)[:, t - 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hit = (bars >= threshold) & ~(sp['p_change'][:, t] < 2) & ~(close < open_)
+        hit &= (bars >= threshold + 1) & ~(close * volume < amount)
+        hit &= (volume / mean_vol) >= ratio
+    return hit
+
+
+# 海龟交易法则在第 t 列是否成立（turtle_trade.check_enter 的面板写法）
+def _turtle_at(sp, t, threshold):
+    close = sp['close']
+    max_price = np.zeros(sp.size, dtype=np.float64)
+    for j in range(t - threshold + 1, t + 1):
+        c = close[:, j]
+        max_price = np.where(c > max_price, c, max_price)
+    return (sp.bars_at(t) >= threshold) & (close[:, t] >= max_price)
+
+
+def check_volume(sp, threshold, ratio, amount):
+    return _enter_at(sp, sp.length - 1, threshold, ratio, amount)
+
+
+def check_enter(sp, threshold):
+    return _turtle_at(sp, sp.length - 1, threshold)
+
+
+def check_climax_limitdown(sp, threshold, ratio, amount):
+    t = sp.length - 1
+    close = sp['close'][:, t]
+    volume = sp['volume'][:, t]
+    mean_vol = sp.ma('volume', 5)[:, t - 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hit = (sp.bars >= threshold) & ~(sp['p_change'][:, t] > -9.5)
+        hit &= (sp.bars >= threshold + 1) & ~(close * volume < amount)
+        hit &= (volume / mean_vol) >= ratio
+    return hit
+
+
+def check_low_increase(sp, ma_long, threshold):
+    close = sp['close']
+    p_change = sp['p_change']
+    lowest = np.full(sp.size, 1000000.0)
+    highest = np.zeros(sp.size, dtype=np.float64)
+    total_change = np.zeros(sp.size, dtype=np.float64)
+    for j in range(sp.length - threshold, sp.length):
+        p = p_change[:, j]
+        total_change = total_change + np.where((p > 0) | (p < 0), np.abs(p), 0.0)
+        c = close[:, j]
+        higher = c > highest
+        lower = ~higher & (c < lowest)
+        highest = np.where(higher, c, highest)
+        lowest = np.where(lower, c, lowest)
+    with np.errstate(invalid='ignore'):
+        atr = total_change / threshold
+        ratio = (highest - lowest) / lowest
+    return (sp.bars >= ma_long) & ~(atr > 10) & (ratio > 1.1)
+
+
+def check_backtrace_ma250(sp, threshold):
+    close = sp['close']
+    volume = sp['volume']
+    ma250 = sp.ma('close', 250)
+    start = sp.length - threshold
+    rows = np.arange(sp.size)
+
+    # 区间最高、最低（最低点只在没有创新高的K线上更新）
+    highest = np.zeros(sp.size, dtype=np.float64)
+    highest_vol = np.zeros(sp.size, dtype=np.float64)
+    highest_col = np.full(sp.size, start, dtype=np.int64)
+    lowest = np.full(sp.size, 1000000.0)
+    lowest_vol = np.zeros(sp.size, dtype=np.float64)
+    for j in range(start, sp.length):
+        c = close[:, j]
+        higher = c > highest
+        lower = ~higher & (c < lowest)
+        highest = np.where(higher, c, highest)
+        highest_vol = np.where(higher, volume[:, j], highest_vol)
+        highest_col = np.where(higher, j, highest_col)
+        lowest = np.where(lower, c, lowest)
+        lowest_vol = np.where(lower, volume[:, j], lowest_vol)
+    hit = (sp.bars >= 250) & (lowest_vol != 0) & (highest_vol != 0)
+
+    # 前半段由年线以下向上突破
+    hit &= highest_col > start
+    front_last = np.maximum(highest_col - 1, start)
+    hit &= (close[:, start] < ma250[:, start]) & (close[rows, front_last] > ma250[rows, front_last])
+
+    # 后半段在年线以上运行，找近期低点
+    recent = np.full(sp.size, 1000000.0)
+    recent_vol = np.zeros(sp.size, dtype=np.float64)
+    recent_col = highest_col.copy()
+    for j in range(start, sp.length):
+        c = close[:, j]
+        end = j >= highest_col
+        hit &= ~(end & (c < ma250[:, j]))
+        lower = end & (c < recent)
+        recent = np.where(lower, c, recent)
+        recent_vol = np.where(lower, volume[:, j], recent_vol)
+        recent_col = np.where(lower, j, recent_col)
+
+    idx = np.nonzero(hit)[0]
+    if len(idx) > 0:
+        date_diff = (sp.dates_at(idx, recent_col[idx]) - sp.dates_at(idx, highest_col[idx])).astype(np.int64)
+        hit[idx] = (date_diff >= 10) & (date_diff <= 50)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hit &= (highest_vol / recent_vol > 2) & (recent / highest < 0.8)
+    return hit
+
+
+def check_breakthrough_platform(sp, threshold):
+    enter_params = sreg.STRATEGY_REGISTRY['enter']['params']
+    close = sp['close']
+    open_ = sp['open']
+    ma60 = sp.ma('close', 60)
+    start = sp.length - threshold
+
+    # 第一根从均线下方突破且放量上涨的K线
+    breakthrough = np.full(sp.size, -1, dtype=np.int64)
+    for j in range(start, sp.length):
+        cross = (breakthrough < 0) & (open_[:, j] < ma60[:, j]) & (ma60[:, j] <= close[:, j])
+        if cross.any():
+            cross &= _enter_at(sp, j, threshold, enter_params['ratio'], enter_params['amount'])
+            breakthrough = np.where(cross, j, breakthrough)
+    hit = (sp.bars >= threshold) & (breakthrough >= 0)
+
+    # 突破之前在均线附近整理
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for j in range(start, sp.length):
+            m = ma60[:, j]
+            front = (j < breakthrough) & (m > 0)
+            ratio = (m - close[:, j]) / m
+            hit &= ~(front & ~((-0.05 < ratio) & (ratio < 0.2)))
+    return hit
+
+
+def check_parking_apron(sp, threshold):
+    close = sp['close']
+    open_ = sp['open']
+    p_change = sp['p_change']
+    hit = np.zeros(sp.size, dtype=bool)
+    # 涨停日之后还要有 3 根K线
+    for j in range(sp.length - threshold, sp.length - 3):
+        limitup = p_change[:, j] > 9.5
+        if not limitup.any():
+            continue
+        limitup &= _turtle_at(sp, j, threshold)
+        price = close[:, j]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            c, o = close[:, j + 1], open_[:, j + 1]
+            ok = (c > price) & (o > price) & (0.97 < c / o) & (c / o < 1.03)
+            for d in (j + 2, j + 3):
+                c, o, p = close[:, d], open_[:, d], p_change[:, d]
+                ok &= (0.97 < c / o) & (c / o < 1.03) & (-5 < p) & (p < 5) & (c > price) & (o > price)
+        hit |= limitup & ok
+    return hit & (sp.bars >= threshold)
+
+
+def check_low_backtrace_increase(sp, threshold):
+    close = sp['close']
+    open_ = sp['open']
+    p_change = sp['p_change']
+    start = sp.length - threshold
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio_increase = (close[:, -1] - close[:, start]) / close[:, start]
+        hit = (sp.bars >= threshold) & ~(ratio_increase < 0.6)
+        previous_p_change = np.full(sp.size, 100.0)
+        previous_open = np.full(sp.size, -1000000.0)
+        for j in range(start, sp.length):
+            p, c, o = p_change[:, j], close[:, j], open_[:, j]
+            hit &= ~((p < -7) | ((c - o) / o * 100 < -7) | (previous_p_change + p < -10) |
+                     ((c - previous_open) / previous_open * 100 < -10))
+            previous_p_change = p
+            previous_open = o
+    return hit
+
+
+def check_keep_increasing(sp, threshold):
+    ma30 = sp.ma('close', 30)
+    start = sp.length - threshold
+    m0 = ma30[:, start]
+    m1 = ma30[:, start + round(threshold / 3)]
+    m2 = ma30[:, start + round(threshold * 2 / 3)]
+    m3 = ma30[:, -1]
+    return (sp.bars >= threshold) & (m0 < m1) & (m1 < m2) & (m2 < m3) & (m3 > 1.2 * m0)
+
+
+# istop 为每只股票是否上了龙虎榜的布尔向量
+def check_high_tight(sp, threshold, ratio, istop=None):
+    if istop is None:
+        return np.zeros(sp.size, dtype=bool)
+    start = sp.length - 24
+    end = start + 14
+    low = sp['low'][:, start:end].min(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hit = istop & (sp.bars >= threshold) & ~(sp['high'][:, end - 1] / low < ratio)
+    p_change = sp['p_change']
+    twice = np.zeros(sp.size, dtype=bool)
+    for j in range(start + 1, end):
+        twice |= (p_change[:, j - 1] >= 9.5) & (p_change[:, j] >= 9.5)
+    return hit & twice
+
+
+# 策略名 -> 面板写法，策略名、窗口和依赖见 strategy_registry.STRATEGY_REGISTRY
+STRATEGY_BATCH = {
+    'enter': check_volume,
+    'turtle_trade': check_enter,
+    'climax_limitdown': check_climax_limitdown,
+    'low_atr': check_low_increase,
+    'backtrace_ma250': check_backtrace_ma250,
+    'breakthrough_platform': check_breakthrough_platform,
+    'parking_apron': check_parking_apron,
+    'low_backtrace_increase': check_low_backtrace_increase,
+    'keep_increasing': check_keep_increasing,
+    'high_tight_flag': check_high_tight,
+}
+
+
+def is_supported(name):
+    return name in STRATEGY_BATCH
+
+
+_panels = {}
+_panels_lock = threading.Lock()
+
+
+# 同一份行情、同一天的面板在各个策略之间共用（行情为单例，按对象区分；同时持有行情，避免 id 被复用）
+def get_panel(stocks, end_date):
+    key = (id(stocks), end_date)
+    with _panels_lock:
+        item = _panels.get(key)
+        if item is None or item[0] is not stocks:
+            item = (stocks, build_strategy_panel(stocks, end_date))
+            _panels[key] = item
+            while len(_panels) > PANEL_KEEP_COUNT:
+                _panels.pop(next(iter(_panels)))
+        return item[1]
+
+
+# 面板上运行策略，返回选中的布尔向量；inputs 为 {额外数据名: 代码集合}，params 为覆盖注册表默认值的策略参数。
+def check_panel(name, sp, inputs=None, params=None):
+    kwargs = dict(sreg.STRATEGY_REGISTRY[name]['params'])
+    for arg, input_name in sreg.STRATEGY_REGISTRY[name]['inputs'].items():
+        codes = None if inputs is None else inputs.get(input_name)
+        if codes is not None:
+            kwargs[arg] = np.array([k[1] in codes for k in sp.keys], dtype=bool)
+    if params:
+        kwargs.update(params)
+    return STRATEGY_BATCH[name](sp, **kwargs)
+
+
+# 全市场批量筛选，返回选中的 (date, code, name) 列表；inputs 为策略需要的额外数据 {额外数据名: 代码集合}。
+def get_strategy_batch(name, stocks, date=None, inputs=None):
+    try:
+        if not stocks:
+            return []
+        end_date = next(iter(stocks))[0] if date is None else date.strftime("%Y-%m-%d")
+        sp = get_panel(stocks, end_date)
+        hit = check_panel(name, sp, inputs)
+        return [sp.keys[i] for i in np.nonzero(hit)[0]]
+    except Exception as e:
+        logging.error(f"strategy_batch.get_strategy_batch处理异常：{name}策略{e}")
+    return None
+
+
+# 逐只股票执行策略函数（没有面板写法的策略），每只股票依次跑完全部策略，行情只读一遍。
+# strategies 为 [(表名, 策略函数)]，inputs 为 {额外数据名: 代码集合}。
+# 返回 ({表名: 选中的 key 列表}, {表名: 耗时秒})。
+def check_stocks(stocks, strategies, date=None, inputs=None):
+    hits = {t: [] for t, _ in strategies}
+    timing = {t: 0.0 for t, _ in strategies}
+    names = {t: sreg.strategy_name(t) for t, _ in strategies}
+    for k, data in stocks.items():
+        if data is None:
+            continue
+        for table_name, strategy_func in strategies:
+            start = time.perf_counter()
+            try:
+                if strategy_func(k, data, date=date, **sreg.stock_kwargs(names[table_name], k[1], inputs)):
+                    hits[table_name].append(k)
+            except Exception as e:
+                logging.error(f"strategy_batch.check_stocks处理异常：{k[1]}代码{e}策略{table_name}")
+            timing[table_name] += time.perf_counter() - start
+    return hits, timing
+
+
+# 历史回补时每次放进面板的股票数，控制全历史面板的内存占用
+BACKFILL_CHUNK_SIZE = 200
+
+
+# 历史回补的面板：一块股票全部历史的行情面板，均线特征在全部历史上只算一遍。
+# 均线每个位置只依赖之前的K线，各日期取对应位置和逐日计算逐位相同；
+# 每个日期按各股票该日及之前最后一根K线取出 window 列，得到和当日作业相同的策略面板。
+class backfill_panel:
+    def __init__(self, stocks, end_date, window=STRATEGY_WINDOW):
+        self.stocks = stocks
+        self.end_date = end_date
+        self.window = window
+        self.panel = build_panel(stocks, end_date=end_date, fields=STRATEGY_FIELDS)
+        self._features = {}
+
+    def feature(self, name):
+        value = self._features.get(name)
+        if value is None:
+            p = self.panel
+            value = np.full((p.size, p.length), np.nan, dtype=np.float64)
+            for i, k in enumerate(p.keys):
+                b = int(p.begin[i])
+                if b < p.length:
+                    value[i, b:] = fcache.get_feature(k[1], self.stocks[k], name, end_date=self.end_date)
+            self._features[name] = value
+        return value
+
+    # 依次返回 dates 中每个日期的策略面板
+    def panels(self, dates):
+        p = self.panel
+        # 每个日期各股票的K线数
+        counts = np.empty((p.size, len(dates)), dtype=np.int64)
+        for i in range(p.size):
+            b = p.begin[i]
+            counts[i] = np.searchsorted(p.dates[i, b:].astype(str), dates, side='right')
+        offsets = np.arange(1 - self.window, 1)
+        for j, date in enumerate(dates):
+            bars = counts[:, j]
+            cols = (p.begin + bars - 1)[:, None] + offsets[None, :]
+            valid = cols >= p.begin[:, None]
+            cols = np.clip(cols, 0, p.length - 1)
+            fields = {f: _gather(p[f], cols, valid) for f in STRATEGY_FIELDS}
+            panel = stock_panel(p.keys, fields, _gather(p.dates, cols, valid, None),
+                                self.window - np.minimum(bars, self.window))
+
+            def features(name, cols=cols, valid=valid):
+                return _gather(self.feature(name), cols, valid)
+
+            yield date, strategy_panel(panel, bars, features, date)
+
+
+# 按列号取出每行的窗口，窗口超出该股票第一根K线的部分为 fill
+def _gather(values, cols, valid, fill=np.nan):
+    return np.where(valid, np.take_along_axis(values, cols, axis=1), fill)
+
+
+# 历史回补：dates 中每个日期的策略结果，每块股票只构建一次全部历史的面板，所有策略共用。
+# 返回 {策略名: DataFrame(date, code, name)}，按日期排列；inputs 为 {日期: {额外数据名: 代码集合}}。
+def get_strategy_backfill(stocks, dates, names, inputs=None):
+    try:
+        dates = sorted(d.strftime("%Y-%m-%d") if not isinstance(d, str) else d for d in dates)
+        keys = [k for k in stocks if stocks[k] is not None]
+        results = {n: [] for n in names}
+        if keys and dates:
+            for s in range(0, len(keys), BACKFILL_CHUNK_SIZE):
+                chunk = keys[s:s + BACKFILL_CHUNK_SIZE]
+                bp = backfill_panel({k: stocks[k] for k in chunk}, dates[-1])
+                if bp.panel.length == 0:
+                    continue
+                for date, sp in bp.panels(dates):
+                    _inputs = None if inputs is None else inputs.get(date)
+                    for n in names:
+                        hit = check_panel(n, sp, _inputs)
+                        results[n].extend((date, sp.keys[i][1], sp.keys[i][2]) for i in np.nonzero(hit)[0])
+        columns = list(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns'])
+        data = {}
+        for n, rows in results.items():
+            # 各块内按日期排列，合并后重新按日期排序
+            data[n] = pd.DataFrame(rows, columns=columns).sort_values('date', kind='stable', ignore_index=True)
+        return data
+    except Exception as e:
+        logging.error(f"strategy_batch.get_strategy_backfill处理异常：{e}")
+    return None
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = 'myh '
+__date__ = '2024/12/06 '
+
+# 策略注册表。策略名为表名去掉 cn_stock_strategy_ 前缀，逐只股票的策略函数见 tablestructure.TABLE_CN_STOCK_STRATEGIES，
+# 面板写法见 strategy_batch.STRATEGY_BATCH。
+# 策略名: {'lookback': 策略用到的最近K线数, 'fields': 用到的行情字段,
+#          'features': 全部历史上计算的特征（feature_cache 特征名）, 'inputs': {策略函数参数名: 额外数据名},
+#          'params': 策略参数的取值（逐只股票和面板写法都从这里取，参数寻优时覆盖），lookback 随 threshold 变化}
+# 额外数据按日期取一次，所有策略共用，传给策略函数时换成每只股票是否在其中（例如 istop）。
+STRATEGY_PREFIX = 'cn_stock_strategy_'
+
+# 行情字段的顺序
+INPUT_FIELDS = ('open', 'high', 'low', 'close', 'volume', 'p_change')
+
+# 额外数据：名字 -> 说明（代码集合，取数函数见 strategy_data_daily_job）
+STRATEGY_INPUTS = {
+    'stock_tops': '最近90天龙虎榜机构买入的股票',
+}
+
+STRATEGY_REGISTRY = {
+    'enter': {'lookback': 61, 'fields': ('open', 'close', 'volume', 'p_change'), 'features': ('vol_ma5',),
+              'inputs': {}, 'params': {'threshold': 60, 'ratio': 2, 'amount': 200000000}},
+    'keep_increasing': {'lookback': 30, 'fields': (), 'features': ('ma30',), 'inputs': {},
+                        'params': {'threshold': 30}},
+    'parking_apron': {'lookback': 15, 'fields': ('open', 'close', 'p_change'), 'features': (), 'inputs': {},
+                      'params': {'threshold': 15}},
+    'backtrace_ma250': {'lookback': 60, 'fields': ('close', 'volume'), 'features': ('ma250',), 'inputs': {},
+                        'params': {'threshold': 60}},
+    'breakthrough_platform': {'lookback': 61, 'fields': ('open', 'close', 'volume', 'p_change'),
+                              'features': ('ma60', 'vol_ma5'), 'inputs': {}, 'params': {'threshold': 60}},
+    'low_backtrace_increase': {'lookback': 60, 'fields': ('open', 'close', 'p_change'), 'features': (),
+                               'inputs': {}, 'params': {'threshold': 60}},
+    'turtle_trade': {'lookback': 60, 'fields': ('close',), 'features': (), 'inputs': {},
+                     'params': {'threshold': 60}},
+    'high_tight_flag': {'lookback': 60, 'fields': ('high', 'low', 'p_change'), 'features': (),
+                        'inputs': {'istop': 'stock_tops'}, 'params': {'threshold': 60, 'ratio': 1.9}},
+    'climax_limitdown': {'lookback': 61, 'fields': ('close', 'volume', 'p_change'), 'features': ('vol_ma5',),
+                         'inputs': {}, 'params': {'threshold': 60, 'ratio': 4, 'amount': 200000000}},
+    'low_atr': {'lookback': 10, 'fields': ('close', 'p_change'), 'features': (), 'inputs': {},
+                'params': {'ma_long': 250, 'threshold': 10}},
+}
+
+
+# 表名 -> 策略名
+def strategy_name(table_name):
+    return table_name[len(STRATEGY_PREFIX):] if table_name.startswith(STRATEGY_PREFIX) else table_name
+
+
+def _names(names):
+    return list(STRATEGY_REGISTRY) if names is None else [n for n in names if n in STRATEGY_REGISTRY]
+
+
+# 一组策略共用面板时需要的K线数
+def resolve_window(names=None):
+    return max((STRATEGY_REGISTRY[n]['lookback'] for n in _names(names)), default=0)
+
+
+# 按参数调整后的策略窗口
+def resolve_lookback(name, params=None):
+    conf = STRATEGY_REGISTRY[name]
+    lookback = conf['lookback']
+    if params and 'threshold' in params and 'threshold' in conf['params']:
+        lookback += params['threshold'] - conf['params']['threshold']
+    return lookback
+
+
+# 一组策略用到的行情字段，按 INPUT_FIELDS 排列
+def resolve_fields(names=None):
+    fields = set()
+    for n in _names(names):
+        fields.update(STRATEGY_REGISTRY[n]['fields'])
+    return tuple(f for f in INPUT_FIELDS if f in fields)
+
+
+# 一组策略用到的特征，共用的特征只算一次
+def resolve_features(names=None):
+    features = []
+    for n in _names(names):
+        features.extend(f for f in STRATEGY_REGISTRY[n]['features'] if f not in features)
+    return features
+
+
+# 一组策略需要的额外数据名
+def resolve_inputs(names=None):
+    inputs = []
+    for n in _names(names):
+        inputs.extend(i for i in STRATEGY_REGISTRY[n]['inputs'].values() if i not in inputs)
+    return inputs
+
+
+# 策略函数的参数：注册表中的策略参数，加上每只股票是否在额外数据中（额外数据为 None 时不传，用策略函数的默认值）
+def stock_kwargs(name, code, inputs):
+    if name not in STRATEGY_REGISTRY:
+        return {}
+    kwargs = dict(STRATEGY_REGISTRY[name]['params'])
+    if not inputs:
+        return kwargs
+    for arg, input_name in STRATEGY_REGISTRY[name]['inputs'].items():
+        codes = inputs.get(input_name)
+        if codes is not None:
+            kwargs[arg] = code in codes
+    return kwargs
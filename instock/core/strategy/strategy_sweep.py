@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import logging
+import itertools
+import concurrent.futures
+import numpy as np
+import pandas as pd
+import instock.core.process_executor as pe
+import instock.core.strategy.strategy_batch as sbt
+import instock.core.strategy.strategy_registry as sreg
+
+__author__ = 'myh '
+__date__ = '2024/12/08 '
+
+# 策略参数寻优。
+# 策略的阈值（窗口天数、放量倍数、成交额下限等）在注册表 params 中有默认值，这里在一段日期上评估多组参数：
+# 每块股票只构建一次全部历史的回补面板，均线等特征只算一遍，逐日取出窗口后所有参数组合共用同一个面板；
+# 股票分块后多进程计算。每个信号的得分为信号日收盘价起 horizon 个交易日的收益率（%，同回测表的 rate_N），
+# 按参数组合汇总信号数、平均收益、中位数、胜率和 t 值（平均收益 / 标准差 × √信号数），按 t 值排名。
+# 没有开启多进程时股票分块在线程池中计算（面板上的 numpy 计算不占 GIL）。
+# 走步验证：滚动的训练区间上选出 t 值最高的参数，在紧接着的测试区间上统计它的表现。
+
+# 随机抽取的参数组合数，docker -e 传递。0 表示评估全部组合。
+sweep_samples = 0
+_sweep_samples = os.environ.get('sweep_samples')
+if _sweep_samples is not None:
+    sweep_samples = int(_sweep_samples)
+
+# 没有开启多进程时的线程数，docker -e 传递。默认为 CPU 核数。
+sweep_workers = os.cpu_count() or 1
+_sweep_workers = os.environ.get('sweep_workers')
+if _sweep_workers is not None:
+    sweep_workers = int(_sweep_workers)
+
+SWEEP_HORIZON = 5  # 信号之后第几个交易日的收益率
+SWEEP_MIN_COUNT = 30  # 信号数少于此数的参数组合不排名
+WALK_TRAIN_DAYS = 120  # 走步验证的训练区间交易日数
+WALK_TEST_DAYS = 20  # 走步验证的测试区间交易日数，也是每次向前滚动的天数
+
+# 策略名: {参数: [取值]}，没有列出的参数用注册表中的默认值
+SWEEP_SPACES = {
+    'enter': {'threshold': [40, 60, 90], 'ratio': [1.5, 2, 3], 'amount': [100000000, 200000000, 500000000]},
+    'keep_increasing': {'threshold': [20, 30, 45, 60]},
+    'parking_apron': {'threshold': [10, 15, 20, 30]},
+    'backtrace_ma250': {'threshold': [40, 60, 90]},
+    'breakthrough_platform': {'threshold': [40, 60, 90]},
+    'low_backtrace_increase': {'threshold': [40, 60, 90]},
+    'turtle_trade': {'threshold': [20, 40, 60, 90, 120]},
+    'high_tight_flag': {'ratio': [1.5, 1.7, 1.9, 2.1]},
+    'climax_limitdown': {'ratio': [2, 3, 4, 6], 'amount': [100000000, 200000000, 500000000]},
+    'low_atr': {'ma_long': [120, 250], 'threshold': [5, 10, 20]},
+}
+
+
+# 参数组合：space 为 {参数: [取值]}，返回全部组合；samples 大于 0 且小于组合数时不重复地随机抽取 samples 个
+def param_grid(space, samples=None, seed=None):
+    names = list(space)
+    values = [list(space[n]) for n in names]
+    sizes = [len(v) for v in values]
+    total = int(np.prod(sizes)) if sizes else 1
+    if not samples or samples >= total:
+        return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+    params = []
+    # 组合序号按各参数取值个数展开成每个参数的下标
+    for index in sorted(np.random.default_rng(seed).choice(total, samples, replace=False)):
+        combo = []
+        for v, size in zip(reversed(values), reversed(sizes)):
+            index, j = divmod(int(index), size)
+            combo.append(v[j])
+        params.append(dict(zip(names, reversed(combo))))
+    return params
+
+
+def _params_text(params):
+    return json.dumps(params, sort_keys=True)
+
+
+# 在一块股票上评估 name 策略的全部参数组合，dates 为评估的日期字符串（升序），inputs 为 {日期: {额外数据名: 代码集合}}。
+# 返回与 param_sets 对应的 DataFrame(date, code, rate) 列表，rate 为 horizon 个交易日后的收益率，K线不足为 NaN。
+def get_sweep_chunk(stocks, dates, name, param_sets, horizon=SWEEP_HORIZON, inputs=None):
+    try:
+        keys = [k for k in stocks if stocks[k] is not None]
+        # 至少和当日作业的面板一样宽，默认参数的结果和策略表相同
+        window = max([sbt.STRATEGY_WINDOW] + [sreg.resolve_lookback(name, p) for p in param_sets])
+        results = [[] for _ in param_sets]
+        for s in range(0, len(keys), sbt.BACKFILL_CHUNK_SIZE):
+            chunk = keys[s:s + sbt.BACKFILL_CHUNK_SIZE]
+            # 面板取到行情的最后一天，信号之后的K线用来算收益率
+            bp = sbt.backfill_panel({k: stocks[k] for k in chunk}, None, window)
+            p = bp.panel
+            if p.length == 0:
+                continue
+            close = p['close']
+            for date, sp in bp.panels(dates):
+                _inputs = None if inputs is None else inputs.get(date)
+                # 当天最后一根K线的列号，horizon 天后超出面板的收益率为 NaN
+                col = p.begin + sp.bars - 1
+                ahead = col + horizon
+                valid = (sp.bars > 0) & (ahead < p.length)
+                rows = np.arange(p.size)
+                base = close[rows, np.clip(col, 0, p.length - 1)]
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    rate = np.where(valid, np.around(
+                        100 * (close[rows, np.clip(ahead, 0, p.length - 1)] - base) / base, 2), np.nan)
+                for i, params in enumerate(param_sets):
+                    hit = np.nonzero(sbt.check_panel(name, sp, _inputs, params))[0]
+                    results[i].extend((date, p.keys[j][1], rate[j]) for j in hit)
+        return [pd.DataFrame(r, columns=['date', 'code', 'rate']) for r in results]
+    except Exception as e:
+        logging.error(f"strategy_sweep.get_sweep_chunk处理异常：{name}策略{e}")
+    return None
+
+
+# 评估 name 策略的全部参数组合，股票分块多进程（或多线程）计算。返回与 param_sets 对应的 DataFrame(date, code, rate) 列表，
+# 有一块失败时返回 None，不用部分股票的结果排名。
+def sweep(stocks, dates, name, param_sets, horizon=SWEEP_HORIZON, inputs=None):
+    try:
+        dates = sorted(d.strftime("%Y-%m-%d") if not isinstance(d, str) else d for d in dates)
+        if pe.is_enabled():
+            chunks = pe.run_chunks(get_sweep_chunk, stocks, dates, name, param_sets, horizon, inputs)
+        else:
+            keys = [k for k in stocks if stocks[k] is not None]
+            size = max(-(-len(keys) // (sweep_workers * pe.TASK_CHUNKS_PER_WORKER)), 1)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=sweep_workers) as executor:
+                futures = [executor.submit(get_sweep_chunk, {k: stocks[k] for k in keys[s:s + size]}, dates, name,
+                                           param_sets, horizon, inputs) for s in range(0, len(keys), size)]
+                chunks = [future.result() for future in futures]
+        if not chunks or any(c is None for c in chunks):
+            return None
+        results = []
+        for i in range(len(param_sets)):
+            # 没有信号的块不参与合并
+            frames = [c[i] for c in chunks if len(c[i].index) > 0] or [chunks[0][i]]
+            results.append(pd.concat(frames, ignore_index=True).sort_values(
+                'date', kind='stable', ignore_index=True))
+        return results
+    except Exception as e:
+        logging.error(f"strategy_sweep.sweep处理异常：{name}策略{e}")
+    return None
+
+
+# 一组信号在 start_date ~ end_date 之间的统计
+def _stats(data, start_date=None, end_date=None, min_count=SWEEP_MIN_COUNT):
+    dates = data['date'].values
+    mask = np.ones(len(dates), dtype=bool)
+    if start_date is not None:
+        mask &= dates >= start_date
+    if end_date is not None:
+        mask &= dates <= end_date
+    rate = data['rate'].values[mask].astype(np.float64)
+    rate = rate[~np.isnan(rate)]
+    count = len(rate)
+    if count == 0:
+        return {'count': 0, 'mean_return': np.nan, 'median_return': np.nan, 'win_rate': np.nan, 'score': np.nan}
+    std = rate.std(ddof=1) if count > 1 else 0.0
+    mean = float(rate.mean())
+    score = round(mean / std * np.sqrt(count), 2) if count >= min_count and std > 0 else np.nan
+    return {'count': count, 'mean_return': round(mean, 2), 'median_return': round(float(np.median(rate)), 2),
+            'win_rate': round(float((rate > 0).mean()) * 100, 2), 'score': score}
+
+
+# 参数组合排名，results 为 sweep 的返回值。返回 DataFrame(rank, params, count, mean_return, median_return,
+# win_rate, score)，按 score 从高到低，信号数不足的组合排在最后。
+def rank_params(results, param_sets, start_date=None, end_date=None, min_count=SWEEP_MIN_COUNT):
+    rows = []
+    for params, data in zip(param_sets, results):
+        row = {'params': _params_text(params)}
+        row.update(_stats(data, start_date, end_date, min_count))
+        rows.append(row)
+    data = pd.DataFrame(rows, columns=['params', 'count', 'mean_return', 'median_return', 'win_rate', 'score'])
+    data = data.sort_values(['score', 'mean_return'], ascending=False, na_position='last', kind='stable',
+                            ignore_index=True)
+    data.insert(0, 'rank', np.arange(1, len(data.index) + 1))
+    return data
+
+
+# 走步验证：dates 上每 test_days 天滚动一次，训练区间选 score 最高的参数，统计它在测试区间的表现。
+# 训练区间最后 horizon 天的收益率要用到测试区间的行情，这几天不参与训练。
+# 返回 DataFrame(fold, train_start, train_end, test_start, test_end, params, train_score, count, mean_return,
+# median_return, win_rate, score)。
+def walk_forward(results, param_sets, dates, train_days=WALK_TRAIN_DAYS, test_days=WALK_TEST_DAYS,
+                 horizon=SWEEP_HORIZON, min_count=SWEEP_MIN_COUNT):
+    dates = sorted(d.strftime("%Y-%m-%d") if not isinstance(d, str) else d for d in dates)
+    columns = ['fold', 'train_start', 'train_end', 'test_start', 'test_end', 'params', 'train_score',
+               'count', 'mean_return', 'median_return', 'win_rate', 'score']
+    rows = []
+    fold = 0
+    for s in range(0, len(dates) - train_days, test_days):
+        train = dates[s:s + train_days - horizon]
+        test = dates[s + train_days:s + train_days + test_days]
+        if not train or not test:
+            break
+        fold += 1
+        ranking = rank_params(results, param_sets, train[0], train[-1], min_count)
+        best = ranking[ranking['score'].notna()]
+        if len(best.index) == 0:
+            continue
+        best = best.iloc[0]
+        index = [_params_text(p) for p in param_sets].index(best['params'])
+        row = {'fold': fold, 'train_start': train[0], 'train_end': train[-1], 'test_start': test[0],
+               'test_end': test[-1], 'params': best['params'], 'train_score': best['score']}
+        row.update(_stats(results[index], test[0], test[-1], min_count))
+        rows.append(row)
+    return pd.DataFrame(rows, columns=columns)
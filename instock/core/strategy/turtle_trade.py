@@ -1,6 +1,9 @@
 #!/usr/local/bin/python
 # -*- coding: utf-8 -*-
 
+import numpy as np
+from instock.core.stockpanel import slice_end
+import instock.core.feature_cache as fcache
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
@@ -11,14 +14,12 @@ BALANCE = 200000
 # 海龟交易法则
 # 最后一个交易日收市价为指定区间内最高价
 # 1.当日收盘价>=最近60日最高收盘价
-def check_enter(code_name, data, date=None, threshold=60):
+def check_enter(code_name, data, date=None, *, threshold):
     if date is None:
         end_date = code_name[0]
     else:
         end_date = date.strftime("%Y-%m-%d")
-    if end_date is not None:
-        mask = (data['date'] <= end_date)
-        data = data.loc[mask]
+    data = slice_end(data, end_date)
     if len(data.index) < threshold:
         return False
 
@@ -35,3 +36,12 @@ def check_enter(code_name, data, date=None, threshold=60):
         return True
 
     return False
+
+
+# 逐日的 check_enter 结果：data 为截止日期之前的行情，返回最近 tail 根K线每天是否满足（tail 为 None 时全部）。
+# 组合策略按天查表，不再对每一天重新截取行情。
+def check_enter_series(code_name, data, threshold, tail=None):
+    close_max = fcache.get_feature(code_name[1], data, f'close_max{threshold}', tail=tail)
+    close = data['close'].values[len(data.index) - len(close_max):]
+    with np.errstate(invalid='ignore'):
+        return close >= close_max
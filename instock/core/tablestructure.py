@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from sqlalchemy import DATE, NVARCHAR, FLOAT, BIGINT, SmallInteger, DATETIME
-from sqlalchemy.dialects.mysql import BIT
+from sqlalchemy import DATE, NVARCHAR, FLOAT, BIGINT, SmallInteger, DATETIME, TEXT
+from sqlalchemy.dialects.mysql import BIT, DOUBLE
 import talib as tl
 from instock.core.strategy import enter
 from instock.core.strategy import turtle_trade
@@ -275,6 +275,58 @@ TABLE_CN_STOCK_BACKTEST_DATA = {'name': 'cn_stock_backtest_data', 'cn': '股票
                                 'columns': {'rate_%s' % i: {'type': FLOAT, 'cn': '%s日收益率' % i, 'size': 100} for i in
                                             range(1, RATE_FIELDS_COUNT + 1, 1)}}
 
+# 已回填的收益率天数（rate_1 ~ rate_N 已有值），回测作业只计算之后新到期的N日
+BACKTEST_FILLED_COLUMN = 'rate_filled'
+
+TABLE_CN_STOCK_BACKTEST_STATS = {'name': 'cn_stock_backtest_stats', 'cn': '股票回归测试统计',
+                                 'columns': {'name': {'type': NVARCHAR(50), 'cn': '策略', 'size': 100},
+                                             'month': {'type': NVARCHAR(7), 'cn': '月份', 'size': 70},
+                                             'horizon': {'type': SmallInteger, 'cn': 'N日', 'size': 70},
+                                             'count': {'type': BIGINT, 'cn': '信号数', 'size': 70},
+                                             'mean': {'type': FLOAT, 'cn': '平均收益率', 'size': 90},
+                                             'median': {'type': FLOAT, 'cn': '收益率中位数', 'size': 90},
+                                             'win_rate': {'type': FLOAT, 'cn': '胜率', 'size': 70},
+                                             'p10': {'type': FLOAT, 'cn': '10%分位', 'size': 70},
+                                             'p25': {'type': FLOAT, 'cn': '25%分位', 'size': 70},
+                                             'p75': {'type': FLOAT, 'cn': '75%分位', 'size': 70},
+                                             'p90': {'type': FLOAT, 'cn': '90%分位', 'size': 70},
+                                             'min': {'type': FLOAT, 'cn': '最小值', 'size': 70},
+                                             'max': {'type': FLOAT, 'cn': '最大值', 'size': 70},
+                                             'total': {'type': DOUBLE, 'cn': '收益率合计', 'size': 0},
+                                             'wins': {'type': BIGINT, 'cn': '上涨数', 'size': 0},
+                                             'sketch': {'type': TEXT, 'cn': '分位数草图', 'size': 0}}}
+
+TABLE_CN_STOCK_PORTFOLIO_BACKTEST = {'name': 'cn_stock_portfolio_backtest', 'cn': '策略组合回测',
+                                     'columns': {'name': {'type': NVARCHAR(50), 'cn': '策略', 'size': 100},
+                                                 'start_date': {'type': DATE, 'cn': '开始日期', 'size': 90},
+                                                 'end_date': {'type': DATE, 'cn': '结束日期', 'size': 90},
+                                                 'capital': {'type': FLOAT, 'cn': '初始资金', 'size': 100},
+                                                 'equity': {'type': FLOAT, 'cn': '期末资产', 'size': 100},
+                                                 'total_return': {'type': FLOAT, 'cn': '总收益率', 'size': 90},
+                                                 'cagr': {'type': FLOAT, 'cn': '年化收益率', 'size': 90},
+                                                 'max_drawdown': {'type': FLOAT, 'cn': '最大回撤', 'size': 90},
+                                                 'volatility': {'type': FLOAT, 'cn': '年化波动率', 'size': 90},
+                                                 'sharpe': {'type': FLOAT, 'cn': '夏普比率', 'size': 70},
+                                                 'turnover': {'type': FLOAT, 'cn': '年化换手率', 'size': 90},
+                                                 'trades': {'type': BIGINT, 'cn': '交易次数', 'size': 70},
+                                                 'win_rate': {'type': FLOAT, 'cn': '胜率', 'size': 70},
+                                                 'avg_hold_days': {'type': FLOAT, 'cn': '平均持有天数', 'size': 90}}}
+
+TABLE_CN_STOCK_STRATEGY_SWEEP = {'name': 'cn_stock_strategy_sweep', 'cn': '策略参数寻优',
+                                 'columns': {'name': {'type': NVARCHAR(50), 'cn': '策略', 'size': 100},
+                                             'split': {'type': NVARCHAR(10), 'cn': '区间', 'size': 70},
+                                             'rank': {'type': SmallInteger, 'cn': '排名', 'size': 70},
+                                             'start_date': {'type': DATE, 'cn': '开始日期', 'size': 90},
+                                             'end_date': {'type': DATE, 'cn': '结束日期', 'size': 90},
+                                             'params': {'type': NVARCHAR(200), 'cn': '参数', 'size': 200},
+                                             'horizon': {'type': SmallInteger, 'cn': '持有天数', 'size': 70},
+                                             'count': {'type': BIGINT, 'cn': '信号数', 'size': 70},
+                                             'mean_return': {'type': FLOAT, 'cn': '平均收益率', 'size': 90},
+                                             'median_return': {'type': FLOAT, 'cn': '收益率中位数', 'size': 90},
+                                             'win_rate': {'type': FLOAT, 'cn': '胜率', 'size': 70},
+                                             'score': {'type': FLOAT, 'cn': 't值', 'size': 70},
+                                             'train_score': {'type': FLOAT, 'cn': '训练区间t值', 'size': 90}}}
+
 STOCK_STATS_DATA = {'name': 'calculate_indicator', 'cn': '股票统计/指标计算助手库',
                     'columns': {'close': {'type': FLOAT, 'cn': '价格', 'size': 0},
                                 'macd': {'type': FLOAT, 'cn': 'dif', 'size': 70},
@@ -357,6 +409,7 @@ TABLE_CN_STOCK_INDICATORS['columns'].update(STOCK_STATS_DATA['columns'])
 
 _tmp_columns = TABLE_CN_STOCK_FOREIGN_KEY['columns'].copy()
 _tmp_columns.update(TABLE_CN_STOCK_BACKTEST_DATA['columns'])
+_tmp_columns[BACKTEST_FILLED_COLUMN] = {'type': SmallInteger, 'cn': '已回填天数', 'size': 0}
 
 TABLE_CN_STOCK_INDICATORS_BUY = {'name': 'cn_stock_indicators_buy', 'cn': '股票指标买入',
                                  'columns': _tmp_columns}
@@ -512,6 +565,13 @@ TABLE_CN_STOCK_KLINE_PATTERN = {'name': 'cn_stock_pattern', 'cn': '股票K线形
                                 'columns': TABLE_CN_STOCK_FOREIGN_KEY['columns'].copy()}
 TABLE_CN_STOCK_KLINE_PATTERN['columns'].update(STOCK_KLINE_PATTERN_DATA['columns'])
 
+# K线形态历史，只保存出现形态的 (日期, 代码, 形态, 形态值)
+TABLE_CN_STOCK_KLINE_PATTERN_EVENTS = {'name': 'cn_stock_pattern_events', 'cn': '股票K线形态事件',
+                                       'columns': {'date': {'type': DATE, 'cn': '日期', 'size': 0},
+                                                   'code': {'type': NVARCHAR(6), 'cn': '代码', 'size': 60},
+                                                   'pattern': {'type': NVARCHAR(30), 'cn': '形态', 'size': 100},
+                                                   'value': {'type': SmallInteger, 'cn': '形态值', 'size': 70}}}
+
 TABLE_CN_STOCK_SELECTION = {'name': 'cn_stock_selection', 'cn': '综合选股',
                             'columns': {'date': {'type': DATE, 'cn': '日期', 'size': 0, 'map': 'MAX_TRADE_DATE'},
                                         'code': {'type': NVARCHAR(length=6), 'cn': '代码', 'size': 60,
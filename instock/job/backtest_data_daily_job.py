@@ -15,6 +15,7 @@ sys.path.append(cpath)
 import instock.core.tablestructure as tbs
 import instock.lib.database as mdb
 import instock.core.backtest.rate_stats as rate
+import instock.core.backtest.backtest_stats as bst
 from instock.core.singleton_stock import stock_hist_data
 
 __author__ = 'myh '
@@ -36,62 +37,85 @@ def prepare():
     for k in stocks_data:
         date = k[0]
         break
+    # 统计表在这里建好，各表的线程只写自己的统计行
+    bst.create_stats_table()
     # 回归测试表
     with concurrent.futures.ThreadPoolExecutor() as executor:
         for table in tables:
             executor.submit(process, table, stocks_data, date, backtest_column)
 
 
+# 每行记录已回填的天数，只计算之后新到期的N日，只写这些字段。
 def process(table, data_all, date, backtest_column):
     table_name = table['name']
     if not mdb.checkTableIsExist(table_name):
         return
 
-    column_tail = tuple(table['columns'])[-1]
+    rate_columns = backtest_column[2:]
+    filled_column = tbs.BACKTEST_FILLED_COLUMN
     now_date = datetime.datetime.now().date()
-    sql = f"SELECT * FROM `{table_name}` WHERE `date` < '{now_date}' AND `{column_tail}` is NULL"
     try:
+        rebuild = not bst.has_stats(table_name)
+        if not mdb.checkColumnIsExist(table_name, filled_column):
+            # 老表增加已回填天数字段，已经回填完的行直接记满，其余的行这次全部重算
+            mdb.executeSql(f"ALTER TABLE `{table_name}` ADD COLUMN `{filled_column}` SMALLINT NULL")
+            mdb.executeSql(f"UPDATE `{table_name}` SET `{filled_column}` = {len(rate_columns)} "
+                           f"WHERE `{rate_columns[-1]}` is not NULL")
+            rebuild = True
+
+        _selcol = '`,`'.join(list(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns']) + [filled_column])
+        sql = f"SELECT `{_selcol}` FROM `{table_name}` WHERE `date` < '{now_date}' AND " \
+              f"(`{filled_column}` is NULL OR `{filled_column}` < {len(rate_columns)})"
         data = pd.read_sql(sql=sql, con=mdb.engine())
-        if data is None or len(data.index) == 0:
-            return
-
-        subset = data[list(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns'])]
-        # subset['date'] = subset['date'].values.astype('str')
-        subset = subset.astype({'date': 'string'})
-        stocks = [tuple(x) for x in subset.values]
-
-        results = run_check(stocks, data_all, date, backtest_column)
-        if results is None:
-            return
-
-        data_new = pd.DataFrame(results.values())
-        mdb.update_db_from_df(data_new, table_name, ('date', 'code'))
+        results = None
+        if data is not None and len(data.index) > 0:
+            subset = data[list(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns'])]
+            subset = subset.astype({'date': 'string'})
+            stocks = [tuple(x) for x in subset.values]
+            filled = data[filled_column].fillna(0).astype(int).values
+            results = run_check(stocks, filled, data_all, date, backtest_column)
+
+        applied = []
+        failed_months = set()
+        if results is not None:
+            # 按回填前后的天数分组，每组只写新到期的字段
+            start = dict(zip(zip(subset['date'].values, subset['code'].values), filled))
+            results['start'] = [start[k] for k in zip(results['date'].values, results['code'].values)]
+            for (f0, f1), group in results.groupby(['start', filled_column]):
+                columns = ['date', 'code'] + rate_columns[f0:f1] + [filled_column]
+                if mdb.update_db_from_df(group[columns], table_name, ('date', 'code')):
+                    applied.append(group)
+                else:
+                    # 可能只更新了一部分行，这些月份的统计由表重建
+                    failed_months.update(d[:7] for d in group['date'].astype(str).values)
+
+        # 回测统计只加入这次成功写入的收益率，还没有全表重建过或刚加字段时由全表重建
+        if rebuild:
+            bst.rebuild_stats(table_name, rate_columns)
+        else:
+            if applied:
+                done = pd.concat(applied)
+                dates = done['date'].astype(str).values
+                if not bst.update_stats(table_name, dates, done[rate_columns].values):
+                    failed_months.update(d[:7] for d in dates)
+            if failed_months:
+                bst.rebuild_stats(table_name, rate_columns, sorted(failed_months))
 
     except Exception as e:
         logging.error(f"backtest_data_daily_job.process处理异常：{table}表{e}")
 
 
-def run_check(stocks, data_all, date, backtest_column, workers=40):
-    data = {}
+# 全部待回测的信号一次计算新到期的收益率
+def run_check(stocks, filled, data_all, date, backtest_column):
     try:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
-            future_to_data = {executor.submit(rate.get_rates, stock,
-                                              data_all.get((date, stock[1], stock[2])), backtest_column,
-                                              len(backtest_column) - 1): stock for stock in stocks}
-            for future in concurrent.futures.as_completed(future_to_data):
-                stock = future_to_data[future]
-                try:
-                    _data_ = future.result()
-                    if _data_ is not None:
-                        data[stock] = _data_
-                except Exception as e:
-                    logging.error(f"backtest_data_daily_job.run_check处理异常：{stock[1]}代码{e}")
+        data = rate.get_rates_incremental(stocks, filled, data_all, backtest_column, tbs.BACKTEST_FILLED_COLUMN,
+                                          len(backtest_column) - 1)
+        if data is None or len(data.index) == 0:
+            return None
+        return data
     except Exception as e:
         logging.error(f"backtest_data_daily_job.run_check处理异常：{e}")
-    if not data:
-        return None
-    else:
-        return data
+    return None
 
 
 def main():
@@ -0,0 +1,96 @@
+#!/usr/local/bin/python3
+# -*- coding: utf-8 -*-
+
+import logging
+import concurrent.futures
+import pandas as pd
+import os.path
+import sys
+
+cpath_current = os.path.dirname(os.path.dirname(__file__))
+cpath = os.path.abspath(os.path.join(cpath_current, os.pardir))
+sys.path.append(cpath)
+import instock.lib.run_template as runt
+import instock.core.tablestructure as tbs
+import instock.lib.database as mdb
+import instock.lib.trade_time as trd
+import instock.core.backtest.portfolio as pf
+from instock.core.singleton_stock import stock_hist_data
+
+__author__ = 'myh '
+__date__ = '2024/12/07 '
+
+
+# 策略组合回测：以各策略表的选股为买入信号，在历史行情上模拟交易，统计结果写入组合回测表。
+# 区间作业 python backtest_portfolio_job.py 2022-01-01 2024-12-06，当前时间作业回测全部历史行情。
+def prepare(dates=None):
+    try:
+        run_date, run_date_nph = trd.get_trade_date_last()
+        end_date = run_date_nph if dates is None else dates[-1]
+        stocks_data = stock_hist_data(date=end_date).get_data()
+        if stocks_data is None:
+            return
+        start_date = None if dates is None else dates[0].strftime("%Y-%m-%d")
+        end_date = end_date.strftime("%Y-%m-%d")
+
+        results = []
+        # 各策略相互独立，数据库读取和撮合并行
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            futures = {executor.submit(run_check, strategy, stocks_data, start_date, end_date): strategy
+                       for strategy in tbs.TABLE_CN_STOCK_STRATEGIES}
+            for future in concurrent.futures.as_completed(futures):
+                stats = future.result()
+                if stats is not None:
+                    results.append(stats)
+        if not results:
+            return
+
+        data = pd.DataFrame(results)
+        table_name = tbs.TABLE_CN_STOCK_PORTFOLIO_BACKTEST['name']
+        # 删除老数据。
+        if mdb.checkTableIsExist(table_name):
+            _names = "','".join(data['name'].values)
+            del_sql = f"DELETE FROM `{table_name}` where `name` in ('{_names}')"
+            mdb.executeSql(del_sql)
+            cols_type = None
+        else:
+            cols_type = tbs.get_field_types(tbs.TABLE_CN_STOCK_PORTFOLIO_BACKTEST['columns'])
+        mdb.insert_db_from_df(data, table_name, cols_type, False, "`name`")
+    except Exception as e:
+        logging.error(f"backtest_portfolio_job.prepare处理异常：{e}")
+
+
+def run_check(strategy, stocks, start_date, end_date):
+    table_name = strategy['name']
+    try:
+        if not mdb.checkTableIsExist(table_name):
+            return None
+        sql = f"SELECT `date`,`code` FROM `{table_name}` WHERE `date` <= '{end_date}'"
+        if start_date is not None:
+            sql += f" AND `date` >= '{start_date}'"
+        signals = pd.read_sql(sql=sql, con=mdb.engine())
+        result = pf.backtest(signals, stocks, start_date, end_date)
+        if result is None:
+            return None
+        equity = result['equity']
+        stats = {'name': table_name, 'start_date': equity['date'].iloc[0], 'end_date': equity['date'].iloc[-1],
+                 'capital': pf.PORTFOLIO_CONFIG['capital']}
+        stats.update(result['stats'])
+        logging.info(f"backtest_portfolio_job.run_check {strategy['cn']}：{result['stats']}")
+        return stats
+    except Exception as e:
+        logging.error(f"backtest_portfolio_job.run_check处理异常：{table_name}策略{e}")
+    return None
+
+
+def main():
+    # 使用方法传递。
+    dates = runt.get_args_dates()
+    if dates is not None and not dates:
+        return
+    prepare(dates)
+
+
+# main函数入口
+if __name__ == '__main__':
+    main()
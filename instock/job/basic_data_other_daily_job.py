@@ -5,6 +5,7 @@ import logging
 import concurrent.futures
 import os.path
 import sys
+import numpy as np
 import pandas as pd
 
 cpath_current = os.path.dirname(os.path.dirname(__file__))
@@ -14,6 +15,8 @@ import instock.lib.run_template as runt
 import instock.core.tablestructure as tbs
 import instock.lib.database as mdb
 import instock.core.stockfetch as stf
+import instock.core.screen_expr as sexp
+from instock.core.singleton_stock import stock_data
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
@@ -199,13 +202,19 @@ def save_nph_stock_bonus(date, before=True):
 # 基本面选股
 def stock_spot_buy(date):
     try:
-        _table_name = tbs.TABLE_CN_STOCK_SPOT['name']
-        if not mdb.checkTableIsExist(_table_name):
-            return
+        screen = sexp.get_screen('spot_buy')
+        # 同一天的实时行情已在内存中（单例已加载）时直接筛选，否则查询数据库
+        data = stock_data.get_loaded_data()
+        if data is not None and len(data.index) > 0 and data.iloc[0]['date'] == date.strftime("%Y-%m-%d") \
+                and all(c in data for c in screen.columns):
+            data = screen.filter(data, dtype=np.float32)
+        else:
+            _table_name = tbs.TABLE_CN_STOCK_SPOT['name']
+            if not mdb.checkTableIsExist(_table_name):
+                return
 
-        sql = f'''SELECT * FROM `{_table_name}` WHERE `date` = '{date}' and 
-                `pe9` > 0 and `pe9` <= 20 and `pbnewmrq` <= 10 and `roe_weight` >= 15'''
-        data = pd.read_sql(sql=sql, con=mdb.engine())
+            sql = f"SELECT * FROM `{_table_name}` WHERE `date` = '{date}' and {screen.to_sql()}"
+            data = pd.read_sql(sql=sql, con=mdb.engine())
         data = data.drop_duplicates(subset="code", keep="last")
         if len(data.index) == 0:
             return
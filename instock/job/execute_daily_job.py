@@ -27,6 +27,7 @@ import strategy_data_daily_job as sdj
 import backtest_data_daily_job as bdj
 import klinepattern_data_daily_job as kdj
 import selection_data_daily_job as sddj
+import signal_index_daily_job as sidj
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
@@ -52,6 +53,9 @@ def main():
         # # # # 第5步创建股票策略数据表
         executor.submit(sdj.main)
 
+    # # # # 第5.1步创建信号位图索引
+    sidj.main()
+
     # # # # 第6步创建股票回测
     bdj.main()
 
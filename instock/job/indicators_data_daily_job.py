@@ -3,7 +3,7 @@
 
 
 import logging
-import concurrent.futures
+import numpy as np
 import pandas as pd
 import os.path
 import sys
@@ -14,20 +14,31 @@ sys.path.append(cpath)
 import instock.lib.run_template as runt
 import instock.core.tablestructure as tbs
 import instock.lib.database as mdb
-import instock.core.indicator.calculate_indicator as idr
+import instock.core.indicator.calculate_indicator_batch as bidr
+import instock.core.indicator.calculate_indicator_stream as sidr
+import instock.core.indicator.indicator_cache as icache
+import instock.core.process_executor as pe
+import instock.core.screen_expr as sexp
+import instock.core.backtest.backtest_stats as bst
 from instock.core.singleton_stock import stock_hist_data
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
 
+# 指标计算方式，docker -e 传递。batch：每天用最近90根K线重算；stream：持久化递推状态，每天只推进新增K线
+indicator_mode = 'batch'
+_indicator_mode = os.environ.get('indicator_mode')
+if _indicator_mode is not None:
+    indicator_mode = _indicator_mode
+
 
 def prepare(date):
     try:
         stocks_data = stock_hist_data(date=date).get_data()
         if stocks_data is None:
             return
-        results = run_check(stocks_data, date=date)
-        if results is None:
+        data = run_check(stocks_data, date=date)
+        if data is None:
             return
 
         table_name = tbs.TABLE_CN_STOCK_INDICATORS['name']
@@ -39,126 +50,150 @@ def prepare(date):
         else:
             cols_type = tbs.get_field_types(tbs.TABLE_CN_STOCK_INDICATORS['columns'])
 
-        dataKey = pd.DataFrame(results.keys())
-        _columns = tuple(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns'])
-        dataKey.columns = _columns
-
-        dataVal = pd.DataFrame(results.values())
-        dataVal.drop('date', axis=1, inplace=True)  # 删除日期字段，然后和原始数据合并。
-
-        data = pd.merge(dataKey, dataVal, on=['code'], how='left')
-        # data.set_index('code', inplace=True)
         # 单例，时间段循环必须改时间
         date_str = date.strftime("%Y-%m-%d")
         if date.strftime("%Y-%m-%d") != data.iloc[0]['date']:
             data['date'] = date_str
         mdb.insert_db_from_df(data, table_name, cols_type, False, "`date`,`code`")
 
+        # 二次筛选数据。直接计算买卖股票数据。
+        guess_buy(date_str, data)
+        guess_sell(date_str, data)
     except Exception as e:
         logging.error(f"indicators_data_daily_job.prepare处理异常：{e}")
 
 
-def run_check(stocks, date=None, workers=40):
-    data = {}
+# 全市场批量计算指标，股票 × 交易日 面板上一次算完，不再逐只股票提交线程池。
+def run_check(stocks, date=None):
     columns = list(tbs.STOCK_STATS_DATA['columns'])
-    columns.insert(0, 'code')
-    columns.insert(0, 'date')
-    data_column = columns
     try:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
-            future_to_data = {executor.submit(idr.get_indicator, k, stocks[k], data_column, date=date): k for k in stocks}
-            for future in concurrent.futures.as_completed(future_to_data):
-                stock = future_to_data[future]
-                try:
-                    _data_ = future.result()
-                    if _data_ is not None:
-                        data[stock] = _data_
-                except Exception as e:
-                    logging.error(f"indicators_data_daily_job.run_check处理异常：{stock[1]}代码{e}")
+        if indicator_mode == 'stream':
+            data = sidr.get_indicator_stream(stocks, columns, date=date)
+        elif icache.is_enabled():
+            # 行情和参数都没变的股票直接用缓存结果
+            data = icache.get_indicator_batch(stocks, columns, date, run_check_batch)
+        else:
+            data = run_check_batch(stocks, columns, date)
+        if data is None or len(data.index) == 0:
+            return None
+        return data
     except Exception as e:
         logging.error(f"indicators_data_daily_job.run_check处理异常：{e}")
-    if not data:
-        return None
-    else:
-        return data
+    return None
 
 
-# 对每日指标数据，进行筛选。将符合条件的。二次筛选出来。
-# 只是做简单筛选
-def guess_buy(date):
-    try:
-        _table_name = tbs.TABLE_CN_STOCK_INDICATORS['name']
-        if not mdb.checkTableIsExist(_table_name):
-            return
+def run_check_batch(stocks, columns, date=None):
+    if pe.is_enabled():
+        # 股票分块，多进程各算一块面板
+        data = [d for d in pe.run_chunks(bidr.get_indicator_batch, stocks, columns, date=date) if d is not None]
+        return pd.concat(data, ignore_index=True) if data else None
+    return bidr.get_indicator_batch(stocks, columns, date=date)
 
-        _columns = tuple(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns'])
-        _selcol = '`,`'.join(_columns)
-        sql = f'''SELECT `{_selcol}` FROM `{_table_name}` WHERE `date` = '{date}' and 
-                `kdjk` >= 80 and `kdjd` >= 70 and `kdjj` >= 100 and `rsi_6` >= 80 and 
-                `cci` >= 100 and `cr` >= 300 and `wr_6` >= -20 and `vr` >= 160'''
-        data = pd.read_sql(sql=sql, con=mdb.engine())
-        data = data.drop_duplicates(subset="code", keep="last")
-        # data.set_index('code', inplace=True)
 
-        if len(data.index) == 0:
+# 历史回补：区间作业一次取行情，每只股票只算一遍全部历史的指标，所有日期的结果一次写入。
+def prepare_range(dates):
+    try:
+        stocks_data = stock_hist_data(date=dates[-1]).get_data()
+        if stocks_data is None:
+            return
+        data = run_check_range(stocks_data, dates)
+        if data is None:
             return
 
-        table_name = tbs.TABLE_CN_STOCK_INDICATORS_BUY['name']
+        table_name = tbs.TABLE_CN_STOCK_INDICATORS['name']
         # 删除老数据。
         if mdb.checkTableIsExist(table_name):
-            del_sql = f"DELETE FROM `{table_name}` where `date` = '{date}'"
+            _dates = "','".join(d.strftime("%Y-%m-%d") for d in dates)
+            del_sql = f"DELETE FROM `{table_name}` where `date` in ('{_dates}')"
             mdb.executeSql(del_sql)
             cols_type = None
         else:
-            cols_type = tbs.get_field_types(tbs.TABLE_CN_STOCK_INDICATORS_BUY['columns'])
+            cols_type = tbs.get_field_types(tbs.TABLE_CN_STOCK_INDICATORS['columns'])
 
-        _columns_backtest = tuple(tbs.TABLE_CN_STOCK_BACKTEST_DATA['columns'])
-        data = pd.concat([data, pd.DataFrame(columns=_columns_backtest)])
         mdb.insert_db_from_df(data, table_name, cols_type, False, "`date`,`code`")
+
+        # 二次筛选数据。
+        for date_str, _data in data.groupby('date', sort=False, observed=True):
+            guess_buy(date_str, _data)
+            guess_sell(date_str, _data)
+    except Exception as e:
+        logging.error(f"indicators_data_daily_job.prepare_range处理异常：{e}")
+
+
+def run_check_range(stocks, dates):
+    columns = list(tbs.STOCK_STATS_DATA['columns'])
+    try:
+        if pe.is_enabled():
+            data = [d for d in pe.run_chunks(bidr.get_indicator_backfill, stocks, dates, columns) if d is not None]
+            # 各块内按日期排列，合并后重新按日期排序
+            data = pd.concat(data, ignore_index=True).sort_values('date', kind='stable', ignore_index=True) \
+                if data else None
+        else:
+            data = bidr.get_indicator_backfill(stocks, dates, columns)
+        if data is None or len(data.index) == 0:
+            return None
+        return data
+    except Exception as e:
+        logging.error(f"indicators_data_daily_job.run_check_range处理异常：{e}")
+    return None
+
+
+# 对每日指标数据，进行筛选。将符合条件的。二次筛选出来。
+# 只是做简单筛选。条件见 screen_expr.SCREENS，data 为刚算出的指标结果时直接在内存中筛选，否则查询数据库。
+def guess_buy(date, data=None):
+    try:
+        guess(date, 'indicators_buy', tbs.TABLE_CN_STOCK_INDICATORS_BUY, data)
     except Exception as e:
         logging.error(f"indicators_data_daily_job.guess_buy处理异常：{e}")
 
 
 # 设置卖出数据。
-def guess_sell(date):
+def guess_sell(date, data=None):
     try:
+        guess(date, 'indicators_sell', tbs.TABLE_CN_STOCK_INDICATORS_SELL, data)
+    except Exception as e:
+        logging.error(f"indicators_data_daily_job.guess_sell处理异常：{e}")
+
+
+def guess(date, screen_name, table, data=None):
+    _columns = list(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns'])
+    screen = sexp.get_screen(screen_name)
+    if data is None:
         _table_name = tbs.TABLE_CN_STOCK_INDICATORS['name']
         if not mdb.checkTableIsExist(_table_name):
             return
-
-        _columns = tuple(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns'])
         _selcol = '`,`'.join(_columns)
-        sql = f'''SELECT `{_selcol}` FROM `{_table_name}` WHERE `date` = '{date}' and 
-                `kdjk` < 20 and `kdjd` < 30 and `kdjj` < 10 and `rsi_6` < 20 and 
-                `cci` < -100 and `cr` < 40 and `wr_6` < -80 and `vr` < 40'''
+        sql = f"SELECT `{_selcol}` FROM `{_table_name}` WHERE `date` = '{date}' and {screen.to_sql()}"
         data = pd.read_sql(sql=sql, con=mdb.engine())
-        data = data.drop_duplicates(subset="code", keep="last")
-        # data.set_index('code', inplace=True)
-        if len(data.index) == 0:
-            return
-
-        table_name = tbs.TABLE_CN_STOCK_INDICATORS_SELL['name']
-        # 删除老数据。
-        if mdb.checkTableIsExist(table_name):
-            del_sql = f"DELETE FROM `{table_name}` where `date` = '{date}'"
-            mdb.executeSql(del_sql)
-            cols_type = None
-        else:
-            cols_type = tbs.get_field_types(tbs.TABLE_CN_STOCK_INDICATORS_SELL['columns'])
+    else:
+        # 表字段为 FLOAT，按单精度取值比较，和查询数据库的结果一致
+        data = screen.filter(data, dtype=np.float32)[_columns]
+    data = data.drop_duplicates(subset="code", keep="last")
+    # data.set_index('code', inplace=True)
+
+    if len(data.index) == 0:
+        return
+
+    table_name = table['name']
+    # 删除老数据。
+    if mdb.checkTableIsExist(table_name):
+        del_sql = f"DELETE FROM `{table_name}` where `date` = '{date}'"
+        mdb.executeSql(del_sql)
+        # 删除的行可能已经计入回测统计
+        bst.refresh_stats(table_name, [date])
+        cols_type = None
+    else:
+        cols_type = tbs.get_field_types(table['columns'])
 
-        _columns_backtest = tuple(tbs.TABLE_CN_STOCK_BACKTEST_DATA['columns'])
-        data = pd.concat([data, pd.DataFrame(columns=_columns_backtest)])
-        mdb.insert_db_from_df(data, table_name, cols_type, False, "`date`,`code`")
-    except Exception as e:
-        logging.error(f"indicators_data_daily_job.guess_sell处理异常：{e}")
+    _columns_backtest = tuple(tbs.TABLE_CN_STOCK_BACKTEST_DATA['columns'])
+    data = pd.concat([data.astype({c: object for c in _columns}), pd.DataFrame(columns=_columns_backtest)])
+    mdb.insert_db_from_df(data, table_name, cols_type, False, "`date`,`code`")
 
 
 def main():
     # 使用方法传递。
-    runt.run_with_args(prepare)
-    # 二次筛选数据。直接计算买卖股票数据。
-    runt.run_with_args(guess_buy)
-    runt.run_with_args(guess_sell)
+    # 计算完直接在内存中二次筛选买卖股票数据。
+    runt.run_with_dates(prepare, prepare_range)
 
 
 # main函数入口
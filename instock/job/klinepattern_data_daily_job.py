@@ -3,7 +3,7 @@
 
 
 import logging
-import concurrent.futures
+import datetime
 import pandas as pd
 import os.path
 import sys
@@ -16,6 +16,7 @@ import instock.core.tablestructure as tbs
 import instock.lib.database as mdb
 from instock.core.singleton_stock import stock_hist_data
 import instock.core.pattern.pattern_recognitions as kpr
+import instock.core.process_executor as pe
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
@@ -26,8 +27,8 @@ def prepare(date):
         stocks_data = stock_hist_data(date=date).get_data()
         if stocks_data is None:
             return
-        results = run_check(stocks_data, date=date)
-        if results is None:
+        data = run_check(stocks_data, date=date)
+        if data is None:
             return
 
         table_name = tbs.TABLE_CN_STOCK_KLINE_PATTERN['name']
@@ -39,13 +40,6 @@ def prepare(date):
         else:
             cols_type = tbs.get_field_types(tbs.TABLE_CN_STOCK_KLINE_PATTERN['columns'])
 
-        dataKey = pd.DataFrame(results.keys())
-        _columns = tuple(tbs.TABLE_CN_STOCK_FOREIGN_KEY['columns'])
-        dataKey.columns = _columns
-
-        dataVal = pd.DataFrame(results.values())
-
-        data = pd.merge(dataKey, dataVal, on=['code'], how='left')
         # 单例，时间段循环必须改时间
         date_str = date.strftime("%Y-%m-%d")
         if date.strftime("%Y-%m-%d") != data.iloc[0]['date']:
@@ -56,32 +50,81 @@ def prepare(date):
         logging.error(f"klinepattern_data_daily_job.prepare处理异常：{e}")
 
 
-def run_check(stocks, date=None, workers=40):
-    data = {}
+# 全市场批量识别形态，多进程时股票分块各算一块。
+def run_check(stocks, date=None):
     columns = tbs.STOCK_KLINE_PATTERN_DATA['columns']
-    data_column = columns
     try:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
-            future_to_data = {executor.submit(kpr.get_pattern_recognition, k, stocks[k], data_column, date=date): k for k in stocks}
-            for future in concurrent.futures.as_completed(future_to_data):
-                stock = future_to_data[future]
-                try:
-                    _data_ = future.result()
-                    if _data_ is not None:
-                        data[stock] = _data_
-                except Exception as e:
-                    logging.error(f"klinepattern_data_daily_job.run_check处理异常：{stock[1]}代码{e}")
+        if pe.is_enabled():
+            data = [d for d in pe.run_chunks(kpr.get_pattern_batch, stocks, columns, date=date) if d is not None]
+            return pd.concat(data, ignore_index=True) if data else None
+        return kpr.get_pattern_batch(stocks, columns, date=date)
     except Exception as e:
         logging.error(f"klinepattern_data_daily_job.run_check处理异常：{e}")
-    if not data:
-        return None
+    return None
+
+
+# 形态历史：每天只追加上次保存之后新增交易日的形态事件。
+def prepare_events(date):
+    try:
+        stocks_data = stock_hist_data(date=date).get_data()
+        if stocks_data is None:
+            return
+        start_date = date
+        table_name = tbs.TABLE_CN_STOCK_KLINE_PATTERN_EVENTS['name']
+        if mdb.checkTableIsExist(table_name):
+            result = mdb.executeSqlFetch(f"SELECT MAX(`date`) FROM `{table_name}`")
+            if result and result[0][0] is not None and result[0][0] < date:
+                start_date = result[0][0] + datetime.timedelta(days=1)
+        save_events(stocks_data, start_date, date)
+    except Exception as e:
+        logging.error(f"klinepattern_data_daily_job.prepare_events处理异常：{e}")
+
+
+# 形态历史回补：区间作业一次取行情，每只股票用全部K线算一遍，所有日期的形态事件一次写入。
+def prepare_events_range(dates):
+    try:
+        stocks_data = stock_hist_data(date=dates[-1]).get_data()
+        if stocks_data is None:
+            return
+        save_events(stocks_data, dates[0], dates[-1])
+    except Exception as e:
+        logging.error(f"klinepattern_data_daily_job.prepare_events_range处理异常：{e}")
+
+
+def save_events(stocks, start_date, end_date):
+    start_str = start_date.strftime("%Y-%m-%d")
+    end_str = end_date.strftime("%Y-%m-%d")
+    columns = tbs.STOCK_KLINE_PATTERN_DATA['columns']
+    if pe.is_enabled():
+        data = pe.run_chunks(kpr.get_pattern_events, stocks, columns, start_str, end_str)
+        # 有一块失败就整体不写，否则删除老数据后只写回一部分股票的形态
+        if not data or any(d is None for d in data):
+            logging.error("klinepattern_data_daily_job.save_events处理异常：部分股票计算失败，不写入")
+            return
+        # 没有事件的块不参与合并
+        data = pd.concat([d for d in data if len(d.index) > 0] or data[:1], ignore_index=True)
+    else:
+        data = kpr.get_pattern_events(stocks, columns, start_str, end_str)
+    if data is None:
+        return
+
+    table_name = tbs.TABLE_CN_STOCK_KLINE_PATTERN_EVENTS['name']
+    # 删除老数据。
+    if mdb.checkTableIsExist(table_name):
+        del_sql = f"DELETE FROM `{table_name}` where `date` >= '{start_str}' and `date` <= '{end_str}'"
+        mdb.executeSql(del_sql)
+        cols_type = None
     else:
-        return data
+        cols_type = tbs.get_field_types(tbs.TABLE_CN_STOCK_KLINE_PATTERN_EVENTS['columns'])
+    # 按形态、日期查询哪些股票出现了形态
+    mdb.insert_db_from_df(data, table_name, cols_type, False, "`date`,`code`,`pattern`",
+                          {'_pattern_date': "`pattern`,`date`"})
 
 
 def main():
     # 使用方法传递。
     runt.run_with_args(prepare)
+    runt.run_with_dates(prepare_events, prepare_events_range)
 
 
 # main函数入口
@@ -0,0 +1,90 @@
+#!/usr/local/bin/python3
+# -*- coding: utf-8 -*-
+
+
+import logging
+import pandas as pd
+import os.path
+import sys
+
+cpath_current = os.path.dirname(os.path.dirname(__file__))
+cpath = os.path.abspath(os.path.join(cpath_current, os.pardir))
+sys.path.append(cpath)
+import instock.lib.run_template as runt
+import instock.core.tablestructure as tbs
+import instock.lib.database as mdb
+import instock.core.signal_index as sgi
+import instock.core.screen_expr as sexp
+
+__author__ = 'myh '
+__date__ = '2024/12/02 '
+
+
+def _read(table_name, columns, date):
+    if not mdb.checkTableIsExist(table_name):
+        return None
+    _selcol = '`,`'.join(columns)
+    sql = f"SELECT `{_selcol}` FROM `{table_name}` WHERE `date` = '{date}'"
+    return pd.read_sql(sql=sql, con=mdb.engine())
+
+
+# 由当天的形态、策略、指标结果生成信号位图并保存。
+def prepare(date):
+    try:
+        date_str = date.strftime("%Y-%m-%d")
+        index = sgi.signal_index()
+
+        # 指标阈值和 config/screens.json 中自定义的指标条件，同时确定当天的代码全集
+        screens = []
+        for name, expr in sexp.custom_screens().items():
+            try:
+                screen = sexp.screen(expr, name)
+            except ValueError as e:
+                logging.error(f"signal_index_daily_job.prepare处理异常：{name}{e}")
+                continue
+            if all(c in tbs.STOCK_STATS_DATA['columns'] for c in screen.columns):
+                screens.append(screen)
+        columns = set(sgi.parse_indicator_signal(s)[0] for s in sgi.INDICATOR_SIGNALS)
+        for screen in screens:
+            columns.update(screen.columns)
+        data = _read(tbs.TABLE_CN_STOCK_INDICATORS['name'], ['code'] + sorted(columns), date_str)
+        if data is not None and len(data.index) > 0:
+            codes = data['code'].values
+            index.add_codes(codes)
+            for signal in sgi.INDICATOR_SIGNALS:
+                column = sgi.parse_indicator_signal(signal)[0]
+                index.add(signal, date_str, codes[sgi.eval_indicator_signal(signal, data[column].values)])
+            for screen in screens:
+                index.add(screen.name, date_str, codes[screen.evaluate(data)])
+
+        # K线形态，形态值不为 0 即为出现
+        pattern_columns = list(tbs.STOCK_KLINE_PATTERN_DATA['columns'])
+        data = _read(tbs.TABLE_CN_STOCK_KLINE_PATTERN['name'], ['code'] + pattern_columns, date_str)
+        if data is not None and len(data.index) > 0:
+            codes = data['code'].values
+            for column in pattern_columns:
+                index.add(column, date_str, codes[data[column].values != 0])
+
+        # 策略、指标买卖，信号名为表名去掉前缀
+        tables = [t['name'] for t in tbs.TABLE_CN_STOCK_STRATEGIES] + \
+                 [tbs.TABLE_CN_STOCK_INDICATORS_BUY['name'], tbs.TABLE_CN_STOCK_INDICATORS_SELL['name']]
+        for table_name in tables:
+            data = _read(table_name, ['code'], date_str)
+            if data is not None:
+                signal = table_name.replace('cn_stock_strategy_', '').replace('cn_stock_', '')
+                index.add(signal, date_str, data['code'].values)
+
+        if index.bitmaps:
+            sgi.save_index(index, date_str)
+    except Exception as e:
+        logging.error(f"signal_index_daily_job.prepare处理异常：{e}")
+
+
+def main():
+    # 使用方法传递。
+    runt.run_with_args(prepare)
+
+
+# main函数入口
+if __name__ == '__main__':
+    main()
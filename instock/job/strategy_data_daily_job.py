@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import time
+import threading
 import concurrent.futures
 import pandas as pd
 import os.path
@@ -15,26 +17,49 @@ import instock.core.tablestructure as tbs
 import instock.lib.database as mdb
 from instock.core.singleton_stock import stock_hist_data
 from instock.core.stockfetch import fetch_stock_top_entity_data
+import instock.core.process_executor as pe
+import instock.core.strategy.strategy_batch as sbt
+import instock.core.strategy.strategy_registry as sreg
+import instock.core.backtest.backtest_stats as bst
 
 __author__ = 'myh '
 __date__ = '2023/3/10 '
 
 
-def prepare(date, strategy):
+# 策略阶段的线程数，docker -e 传递。默认为 CPU 核数，全部策略共用，不再每个策略各开一个线程池。
+strategy_workers = os.cpu_count() or 1
+_strategy_workers = os.environ.get('strategy_workers')
+if _strategy_workers is not None:
+    strategy_workers = int(_strategy_workers)
+
+
+# 当天的策略（默认全部）统一调度计算，再逐个写入策略表。
+def prepare(date, strategies=None):
     try:
         stocks_data = stock_hist_data(date=date).get_data()
         if stocks_data is None:
             return
-        table_name = strategy['name']
-        strategy_func = strategy['func']
-        results = run_check(strategy_func, table_name, stocks_data, date)
-        if results is None:
+        if strategies is None:
+            strategies = tbs.TABLE_CN_STOCK_STRATEGIES
+        results = run_check(strategies, stocks_data, date)
+        for strategy in strategies:
+            save(strategy, results.get(strategy['name']), date)
+    except Exception as e:
+        logging.error(f"strategy_data_daily_job.prepare处理异常：{e}")
+
+
+def save(strategy, results, date):
+    table_name = strategy['name']
+    try:
+        if not results:
             return
 
         # 删除老数据。
         if mdb.checkTableIsExist(table_name):
             del_sql = f"DELETE FROM `{table_name}` where `date` = '{date}'"
             mdb.executeSql(del_sql)
+            # 删除的行可能已经计入回测统计
+            bst.refresh_stats(table_name, [date])
             cols_type = None
         else:
             cols_type = tbs.get_field_types(tbs.TABLE_CN_STOCK_STRATEGIES[0]['columns'])
@@ -49,44 +74,156 @@ def prepare(date, strategy):
         if date.strftime("%Y-%m-%d") != data.iloc[0]['date']:
             data['date'] = date_str
         mdb.insert_db_from_df(data, table_name, cols_type, False, "`date`,`code`")
-
     except Exception as e:
-        logging.error(f"strategy_data_daily_job.prepare处理异常：{strategy}策略{e}")
+        logging.error(f"strategy_data_daily_job.save处理异常：{table_name}策略{e}")
+
 
+# 调度当天的全部策略，返回 {表名: 选中的 key 列表}：
+# 额外数据一次取齐；有面板写法的策略共用一份面板依次计算；
+# 其余策略按股票分组，每只股票依次跑完这些策略，线程数（或进程数）有上限。
+# 各策略耗时写入日志，逐只股票的策略为各线程耗时之和。
+def run_check(strategies, stocks, date):
+    results = {}
+    timing = {}
+    names = {s['name']: sreg.strategy_name(s['name']) for s in strategies}
+    inputs = fetch_inputs(sreg.resolve_inputs(list(names.values())), date)
+    batch = [s for s in strategies if sbt.is_supported(names[s['name']])]
+    if batch:
+        start = time.perf_counter()
+        sbt.get_panel(stocks, date.strftime("%Y-%m-%d"))
+        timing['panel'] = time.perf_counter() - start
+    for strategy in batch:
+        start = time.perf_counter()
+        data = sbt.get_strategy_batch(names[strategy['name']], stocks, date, inputs)
+        timing[strategy['name']] = time.perf_counter() - start
+        if data is not None:
+            results[strategy['name']] = data
+    # 没有面板写法或面板计算出错的策略
+    others = [(s['name'], s['func']) for s in strategies if s['name'] not in results]
+    if others:
+        hits, _timing = run_check_stocks(others, stocks, date, inputs)
+        results.update(hits)
+        timing.update(_timing)
+    logging.info(f"strategy_data_daily_job.run_check {date} 耗时：" +
+                 "，".join(f"{names.get(k, k)} {v:.2f}秒" for k, v in timing.items()))
+    return results
 
-def run_check(strategy_fun, table_name, stocks, date, workers=40):
-    is_check_high_tight = False
-    if strategy_fun.__name__ == 'check_high_tight':
-        stock_tops = fetch_stock_top_entity_data(date)
-        if stock_tops is not None:
-            is_check_high_tight = True
-    data = []
+
+def run_check_stocks(strategies, stocks, date, inputs):
+    hits = {t: [] for t, _ in strategies}
+    timing = {t: 0.0 for t, _ in strategies}
     try:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
-            if is_check_high_tight:
-                future_to_data = {executor.submit(strategy_fun, k, stocks[k], date=date, istop=(k[1] in stock_tops)): k for k in stocks}
-            else:
-                future_to_data = {executor.submit(strategy_fun, k, stocks[k], date=date): k for k in stocks}
-            for future in concurrent.futures.as_completed(future_to_data):
-                stock = future_to_data[future]
+        if pe.is_enabled():
+            # 多进程，行情放在共享内存里，子进程只返回选中的股票
+            chunks = pe.run_chunks(sbt.check_stocks, stocks, strategies, date=date, inputs=inputs)
+        else:
+            keys = [k for k in stocks if stocks[k] is not None]
+            size = max(-(-len(keys) // (strategy_workers * pe.TASK_CHUNKS_PER_WORKER)), 1)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=strategy_workers) as executor:
+                futures = [executor.submit(sbt.check_stocks, {k: stocks[k] for k in keys[s:s + size]}, strategies,
+                                           date, inputs) for s in range(0, len(keys), size)]
+                chunks = [future.result() for future in futures]
+        for _hits, _timing in chunks:
+            for t in hits:
+                hits[t].extend(_hits[t])
+                timing[t] += _timing[t]
+    except Exception as e:
+        logging.error(f"strategy_data_daily_job.run_check_stocks处理异常：{e}")
+    return hits, timing
+
+
+# 策略需要的额外数据：额外数据名 -> 按日期取数的函数，见 strategy_registry.STRATEGY_INPUTS
+_INPUT_FUNCS = {
+    'stock_tops': fetch_stock_top_entity_data,
+}
+_inputs = {}
+_inputs_lock = threading.Lock()
+
+
+# 取额外数据 {额外数据名: 代码集合}，同一天只取一次，各策略共用
+def fetch_inputs(input_names, date):
+    data = {}
+    for input_name in input_names:
+        key = (input_name, date)
+        with _inputs_lock:
+            if key not in _inputs:
                 try:
-                    if future.result():
-                        data.append(stock)
+                    _inputs[key] = _INPUT_FUNCS[input_name](date)
                 except Exception as e:
-                    logging.error(f"strategy_data_daily_job.run_check处理异常：{stock[1]}代码{e}策略{table_name}")
+                    logging.error(f"strategy_data_daily_job.fetch_inputs处理异常：{input_name}{e}")
+                    _inputs[key] = None
+            data[input_name] = _inputs[key]
+    return data
+
+
+# 历史回补：区间作业一次取行情，全部策略在同一遍面板计算中得到所有日期的结果，每个策略表一次写入。
+def prepare_range(dates):
+    try:
+        stocks_data = stock_hist_data(date=dates[-1]).get_data()
+        if stocks_data is None:
+            return
+        strategies = [s for s in tbs.TABLE_CN_STOCK_STRATEGIES if sbt.is_supported(sreg.strategy_name(s['name']))]
+        names = [sreg.strategy_name(s['name']) for s in strategies]
+        results = run_check_range(names, stocks_data, dates)
+        if results is not None:
+            for strategy, name in zip(strategies, names):
+                save_range(strategy, results[name], dates)
+
+        # 没有面板写法的策略逐日计算
+        others = [s for s in tbs.TABLE_CN_STOCK_STRATEGIES if s not in strategies]
+        if others:
+            for date in dates:
+                prepare(date, others)
+    except Exception as e:
+        logging.error(f"strategy_data_daily_job.prepare_range处理异常：{e}")
+
+
+def run_check_range(names, stocks, dates):
+    try:
+        input_names = sreg.resolve_inputs(names)
+        inputs = {d.strftime("%Y-%m-%d"): fetch_inputs(input_names, d) for d in dates} if input_names else None
+        if pe.is_enabled():
+            # 股票分块，多进程各算一块；有一块失败就整体不写，否则删除老数据后只写回一部分股票
+            chunks = pe.run_chunks(sbt.get_strategy_backfill, stocks, dates, names, inputs)
+            if not chunks or any(d is None for d in chunks):
+                logging.error("strategy_data_daily_job.run_check_range处理异常：部分股票回补失败，不写入")
+                return None
+            # 各块内按日期排列，合并后重新按日期排序
+            return {n: pd.concat([d[n] for d in chunks], ignore_index=True).sort_values(
+                'date', kind='stable', ignore_index=True) for n in names}
+        return sbt.get_strategy_backfill(stocks, dates, names, inputs)
+    except Exception as e:
+        logging.error(f"strategy_data_daily_job.run_check_range处理异常：{e}")
+    return None
+
+
+def save_range(strategy, data, dates):
+    table_name = strategy['name']
+    try:
+        # 删除老数据。
+        if mdb.checkTableIsExist(table_name):
+            _dates = "','".join(d.strftime("%Y-%m-%d") for d in dates)
+            del_sql = f"DELETE FROM `{table_name}` where `date` in ('{_dates}')"
+            mdb.executeSql(del_sql)
+            # 删除的行可能已经计入回测统计
+            bst.refresh_stats(table_name, dates)
+            cols_type = None
+        else:
+            cols_type = tbs.get_field_types(tbs.TABLE_CN_STOCK_STRATEGIES[0]['columns'])
+        if data is None or len(data.index) == 0:
+            return
+
+        _columns_backtest = tuple(tbs.TABLE_CN_STOCK_BACKTEST_DATA['columns'])
+        data = pd.concat([data, pd.DataFrame(columns=_columns_backtest)])
+        mdb.insert_db_from_df(data, table_name, cols_type, False, "`date`,`code`")
     except Exception as e:
-        logging.error(f"strategy_data_daily_job.run_check处理异常：{e}策略{table_name}")
-    if not data:
-        return None
-    else:
-        return data
+        logging.error(f"strategy_data_daily_job.save_range处理异常：{table_name}策略{e}")
 
 
 def main():
     # 使用方法传递。
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        for strategy in tbs.TABLE_CN_STOCK_STRATEGIES:
-            executor.submit(runt.run_with_args, prepare, strategy)
+    # 区间作业、N个时间作业一次回补全部策略。
+    runt.run_with_dates(prepare, prepare_range)
 
 
 # main函数入口
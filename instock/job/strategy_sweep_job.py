@@ -0,0 +1,113 @@
+#!/usr/local/bin/python3
+# -*- coding: utf-8 -*-
+
+import logging
+import numpy as np
+import pandas as pd
+import os.path
+import sys
+
+cpath_current = os.path.dirname(os.path.dirname(__file__))
+cpath = os.path.abspath(os.path.join(cpath_current, os.pardir))
+sys.path.append(cpath)
+import instock.lib.run_template as runt
+import instock.core.tablestructure as tbs
+import instock.lib.database as mdb
+import instock.lib.trade_time as trd
+import instock.core.strategy.strategy_sweep as ssw
+import instock.core.strategy.strategy_registry as sreg
+import instock.job.strategy_data_daily_job as sdj
+from instock.core.singleton_stock import stock_hist_data
+
+__author__ = 'myh '
+__date__ = '2024/12/08 '
+
+SWEEP_DAYS = 250  # 当前时间作业评估最近多少个交易日
+
+
+# 策略参数寻优：各策略在 ssw.SWEEP_SPACES 的参数组合上评估，全区间排名和走步验证结果写入参数寻优表。
+# 区间作业 python strategy_sweep_job.py 2023-01-01 2024-12-06，当前时间作业评估最近 SWEEP_DAYS 个交易日。
+def prepare(dates=None):
+    try:
+        run_date, run_date_nph = trd.get_trade_date_last()
+        end_date = run_date_nph if dates is None else dates[-1]
+        stocks_data = stock_hist_data(date=end_date).get_data()
+        if stocks_data is None:
+            return
+        if dates is None:
+            calendar = np.unique(np.concatenate([v['date'].values for v in stocks_data.values() if v is not None]))
+            dates = [str(d) for d in calendar[-SWEEP_DAYS:]]
+        else:
+            dates = [d.strftime("%Y-%m-%d") for d in dates]
+
+        for name in ssw.SWEEP_SPACES:
+            data = run_check(name, stocks_data, dates)
+            if data is not None and len(data.index) > 0:
+                save(name, data)
+    except Exception as e:
+        logging.error(f"strategy_sweep_job.prepare处理异常：{e}")
+
+
+def run_check(name, stocks, dates):
+    try:
+        param_sets = ssw.param_grid(ssw.SWEEP_SPACES[name], ssw.sweep_samples)
+        input_names = sreg.resolve_inputs([name])
+        inputs = None
+        if input_names:
+            inputs = {}
+            for d in dates:
+                inputs[d] = sdj.fetch_inputs(input_names, pd.Timestamp(d).date())
+        results = ssw.sweep(stocks, dates, name, param_sets, ssw.SWEEP_HORIZON, inputs)
+        if results is None:
+            return None
+
+        # 全区间排名
+        ranking = ssw.rank_params(results, param_sets)
+        ranking.insert(0, 'split', 'all')
+        ranking['start_date'] = dates[0]
+        ranking['end_date'] = dates[-1]
+        # 走步验证：每一折一行（区间为 wf折号），为训练区间选出的参数在测试区间的表现，train_score 为训练区间的 t 值
+        walk = ssw.walk_forward(results, param_sets, dates)
+        walk = walk.rename(columns={'test_start': 'start_date', 'test_end': 'end_date'})
+        walk.insert(0, 'split', [f"wf{f}" for f in walk['fold'].values])
+        walk['rank'] = 1
+        data = pd.concat([d for d in (ranking, walk) if len(d.index) > 0], ignore_index=True)
+        data.insert(0, 'name', sreg.STRATEGY_PREFIX + name)
+        data['horizon'] = ssw.SWEEP_HORIZON
+        if len(walk.index) > 0:
+            logging.info(f"strategy_sweep_job.run_check {name} 走步验证：\n{walk.to_string()}")
+        return data[list(tbs.TABLE_CN_STOCK_STRATEGY_SWEEP['columns'])]
+    except Exception as e:
+        logging.error(f"strategy_sweep_job.run_check处理异常：{name}策略{e}")
+    return None
+
+
+def save(name, data):
+    table_name = tbs.TABLE_CN_STOCK_STRATEGY_SWEEP['name']
+    try:
+        # 删除老数据。
+        if mdb.checkTableIsExist(table_name):
+            # 老表增加训练区间t值字段
+            if not mdb.checkColumnIsExist(table_name, 'train_score'):
+                mdb.executeSql(f"ALTER TABLE `{table_name}` ADD COLUMN `train_score` FLOAT NULL")
+            del_sql = f"DELETE FROM `{table_name}` where `name` = '{sreg.STRATEGY_PREFIX + name}'"
+            mdb.executeSql(del_sql)
+            cols_type = None
+        else:
+            cols_type = tbs.get_field_types(tbs.TABLE_CN_STOCK_STRATEGY_SWEEP['columns'])
+        mdb.insert_db_from_df(data, table_name, cols_type, False, "`name`,`split`,`rank`")
+    except Exception as e:
+        logging.error(f"strategy_sweep_job.save处理异常：{name}策略{e}")
+
+
+def main():
+    # 使用方法传递。
+    dates = runt.get_args_dates()
+    if dates is not None and not dates:
+        return
+    prepare(dates)
+
+
+# main函数入口
+if __name__ == '__main__':
+    main()
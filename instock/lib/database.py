@@ -113,7 +113,7 @@ def insert_other_db_from_df(to_db, data, table_name, cols_type, write_index, pri
             logging.error(f"database.insert_other_db_from_df处理异常：{table_name}表{e}")
 
 
-# 更新数据
+# 更新数据，返回是否全部更新成功（出错时之前的行已经更新）
 def update_db_from_df(data, table_name, where):
     data = data.where(data.notnull(), None)
     update_string = f'UPDATE `{table_name}` set '
@@ -150,8 +150,10 @@ def update_db_from_df(data, table_name, where):
                                     sql = f'''{sql}`{col}` = {row[index]}, '''
                     sql = f'{sql[:-2]}{sql_where}'
                     db.execute(sql)
+                return True
             except Exception as e:
                 logging.error(f"database.update_db_from_df处理异常：{sql}{e}")
+    return False
 
 
 # 检查表是否存在
@@ -168,6 +170,19 @@ def checkTableIsExist(tableName):
     return False
 
 
+def checkColumnIsExist(tableName, columnName):
+    with get_connection() as conn:
+        with conn.cursor() as db:
+            db.execute("""
+                SELECT COUNT(*)
+                FROM information_schema.columns
+                WHERE table_name = '{0}' AND column_name = '{1}'
+                """.format(tableName.replace('\'', '\'\''), columnName.replace('\'', '\'\'')))
+            if db.fetchone()[0] == 1:
+                return True
+    return False
+
+
 # 增删改数据
 def executeSql(sql, params=()):
     with get_connection() as conn:
@@ -56,3 +56,46 @@ def run_with_args(run_fun, *args):
                 run_fun(run_date_nph, *args)
         except Exception as e:
             logging.error(f"run_template.run_with_args处理异常：{run_fun}{sys.argv}{e}")
+
+
+# 区间作业、N个时间作业时的交易日列表，当前时间作业返回 None。
+def get_args_dates():
+    if len(sys.argv) == 3:
+        tmp_year, tmp_month, tmp_day = sys.argv[1].split("-")
+        run_date = datetime.datetime(int(tmp_year), int(tmp_month), int(tmp_day)).date()
+        tmp_year, tmp_month, tmp_day = sys.argv[2].split("-")
+        end_date = datetime.datetime(int(tmp_year), int(tmp_month), int(tmp_day)).date()
+        dates = []
+        while run_date <= end_date:
+            if trd.is_trade_date(run_date):
+                dates.append(run_date)
+            run_date += datetime.timedelta(days=1)
+        return dates
+    elif len(sys.argv) == 2:
+        dates = []
+        for date in sys.argv[1].split(','):
+            tmp_year, tmp_month, tmp_day = date.split("-")
+            run_date = datetime.datetime(int(tmp_year), int(tmp_month), int(tmp_day)).date()
+            if trd.is_trade_date(run_date):
+                dates.append(run_date)
+        return sorted(dates)
+    return None
+
+
+# 通用函数，支持一次处理多个日期的作业（历史回补）。
+# 区间作业、N个时间作业把全部交易日一次交给 run_range_fun(dates, *args)，当前时间作业仍然调用 run_fun。
+def run_with_dates(run_fun, run_range_fun, *args):
+    try:
+        dates = get_args_dates()
+    except Exception as e:
+        logging.error(f"run_template.run_with_dates处理异常：{run_range_fun}{sys.argv}{e}")
+        return
+    if dates is None:
+        run_with_args(run_fun, *args)
+        return
+    if not dates:
+        return
+    try:
+        run_range_fun(dates, *args)
+    except Exception as e:
+        logging.error(f"run_template.run_with_dates处理异常：{run_range_fun}{sys.argv}{e}")
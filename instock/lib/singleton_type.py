@@ -18,3 +18,7 @@ class singleton_type(type):
                 cls._instance = super(singleton_type, cls).__call__(*args, **kwargs)  # 创建cls的对象
 
         return cls._instance
+
+    # 已创建的实例，还没有创建时返回 None（不会创建）
+    def get_instance(cls):
+        return cls.__dict__.get('_instance')